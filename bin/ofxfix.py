@@ -18,14 +18,15 @@
 # fixofx.py - canonicalize all recognized upload formats to OFX 2.0
 #
 
+import logging
 import os
 import os.path
 import sys
 
-from fixofx.ofx import Response, FileTyper
-from fixofx.ofxtools.ofc_converter import OfcConverter
-from fixofx.ofxtools.qif_converter import QifConverter
-from fixofx.ofxtools.iif_converter import IifConverter
+import fixofx
+from fixofx.ofx import FileTyper, TimingLog, Budget, BudgetExceeded
+from fixofx.ofx.instrument import stage
+from fixofx.ofx.trace import set_sample_rate
 
 
 def fixpath(filename):
@@ -34,7 +35,6 @@ def fixpath(filename):
 
 
 from optparse import OptionParser
-from pyparsing import ParseException
 
 __doc__ = \
 """Canonicalizes files from several supported data upload formats (currently
@@ -59,96 +59,27 @@ except ImportError:
     pass
 
 
-def convert(filecontent, filetype, verbose=False, fid="UNKNOWN", org="UNKNOWN",
-            bankid="UNKNOWN", accttype="UNKNOWN", acctid="UNKNOWN",
-            balance="UNKNOWN", curdef=None, lang="ENG", dayfirst=False,
-            debug=False):
-
-    text = os.linesep.join(s for s in filecontent.splitlines() if s)
-
-    # This finishes a verbosity message started by the caller, where the
-    # caller explains the source command-line option and this explains the
-    # source format.
-    if verbose:
-        sys.stderr.write("Converting from %s format.\n" % filetype)
-
-    if options.debug and (filetype in ["OFC", "QIF"] or filetype.startswith("OFX")):
-        sys.stderr.write("Starting work on raw text:\n")
-        sys.stderr.write(rawtext + "\n\n")
-
-    if filetype.startswith("OFX/2"):
-        if verbose: sys.stderr.write("No conversion needed; returning unmodified.\n")
-
-        # The file is already OFX 2 -- return it unaltered, ignoring
-        # any of the parameters passed to this method.
-        return text
-
-    elif filetype.startswith("OFX"):
-        if verbose: sys.stderr.write("Converting to OFX/2.0...\n")
-
-        # This will throw a ParseException if it is unable to recognize
-        # the source format.
-        response = Response(text, debug=debug)
-        return response.as_xml(original_format=filetype)
-
-    elif filetype == "OFC":
-        if verbose: sys.stderr.write("Beginning OFC conversion...\n")
-        converter = OfcConverter(text, fid=fid, org=org, curdef=curdef,
-                                 lang=lang, debug=debug)
-
-        # This will throw a ParseException if it is unable to recognize
-        # the source format.
-        if verbose:
-            sys.stderr.write("Converting to OFX/1.02...\n\n%s\n\n" %
-                             converter.to_ofx102())
-            sys.stderr.write("Converting to OFX/2.0...\n")
-
-        return converter.to_xml()
-
-    elif filetype == "QIF":
-        if verbose: sys.stderr.write("Beginning QIF conversion...\n")
-        converter = QifConverter(text, fid=fid, org=org,
-                                 bankid=bankid, accttype=accttype,
-                                 acctid=acctid, balance=balance,
-                                 curdef=curdef, lang=lang, dayfirst=dayfirst,
-                                 debug=debug)
-
-        # This will throw a ParseException if it is unable to recognize
-        # the source format.
-        if verbose:
-            sys.stderr.write("Converting to OFX/1.02...\n\n%s\n\n" %
-                             converter.to_ofx102())
-            sys.stderr.write("Converting to OFX/2.0...\n")
-
-        return converter.to_xml()
-
-    elif filetype == "IIF":
-        if verbose: sys.stderr.write("Beginning IIF conversion...\n")
-        converter = IifConverter(text, fid=fid, org=org,
-                                 bankid=bankid, accttype=accttype,
-                                 acctid=acctid, balance=balance,
-                                 curdef=curdef, lang=lang, dayfirst=dayfirst,
-                                 debug=debug)
-
-        # This will throw a ParseException if it is unable to recognize
-        # the source format.
-        if verbose:
-            sys.stderr.write("Converting to OFX/1.02...\n\n%s\n\n" %
-                             converter.to_ofx102())
-            sys.stderr.write("Converting to OFX/2.0...\n")
-
-        return converter.to_xml()
-
-    else:
-        raise TypeError("Unable to convert source format '%s'." % filetype)
-
 parser = OptionParser(description=__doc__)
 parser.add_option("-d", "--debug", action="store_true", dest="debug",
                   default=False, help="spit out gobs of debugging output during parse")
+parser.add_option("--trace", dest="trace", type="float", default=None,
+                  metavar="RATE", help="log a sampled RATE (0 to 1) of parse "
+                  "failures, with the tags open at the failure, to STDERR")
 parser.add_option("-v", "--verbose", action="store_true", dest="verbose",
                   default=False, help="be more talkative, social, outgoing")
 parser.add_option("-t", "--type", action="store_true", dest="type",
                   default=False, help="print input file type and exit")
+parser.add_option("--timing", action="store_true", dest="timing",
+                  default=False, help="print a per-stage timing breakdown to STDERR")
+parser.add_option("--max-size", dest="max_size", type="int", default=None,
+                  metavar="BYTES", help="refuse input larger than BYTES")
+parser.add_option("--max-time", dest="max_time", type="float", default=None,
+                  metavar="SECONDS", help="give up on a conversion after SECONDS "
+                  "(a long call into C, such as a regular expression match, "
+                  "finishes first)")
+parser.add_option("--max-memory", dest="max_memory", type="int", default=None,
+                  metavar="BYTES", help="give up on a conversion that grows "
+                  "memory by BYTES")
 parser.add_option("-f", "--file", dest="filename", default=None,
                   help="source file to convert (writes to STDOUT)")
 parser.add_option("--fid", dest="fid", default="UNKNOWN",
@@ -169,8 +100,44 @@ parser.add_option("--balance", dest="balance", default="UNKNOWN",
                   help="(QIF only) Account balance to use in output")
 parser.add_option("--dayfirst", action="store_true", dest="dayfirst", default=False,
                   help="(QIF only) Parse dates day first (UK format)")
+parser.add_option("--fitids", dest="fitids", type="choice", default="position",
+                  choices=["position", "content"], metavar="STRATEGY",
+                  help="(OFC/QIF/IIF only) make up transaction IDs from each "
+                  "transaction's place in its day ('position', the default) "
+                  "or from a hash of its contents ('content')")
+parser.add_option("--check-bankid", action="store_true", dest="check_bankid",
+                  default=False,
+                  help="(OFX output only) report whether each BANKID in the "
+                  "output is a valid routing number, and its type and region, "
+                  "on STDERR")
+parser.add_option("--columns", dest="columns", type="choice", default=None,
+                  choices=["ndjson", "csv", "arrow", "parquet"], metavar="FORMAT",
+                  help="write one row per transaction as FORMAT (ndjson, csv, "
+                  "arrow or parquet) instead of OFX 2.0")
+parser.add_option("--sqlite", dest="sqlite", default=None, metavar="PATH",
+                  help="add the transactions to the SQLite database PATH "
+                  "instead of writing OFX 2.0")
+parser.add_option("--incremental", dest="incremental", default=None, metavar="PATH",
+                  help="(--columns and --sqlite only) pass on only transactions "
+                  "not seen before, keeping track of them in the index PATH")
+parser.add_option("--cache", dest="cache", default=None, metavar="DIR",
+                  help="keep conversions in DIR, and reuse them when the same "
+                  "file is converted again with the same options")
+parser.add_option("--cache-size", dest="cache_size", type="int",
+                  default=256 * 1024 * 1024, metavar="BYTES",
+                  help="(--cache only) evict the least recently used "
+                  "conversions beyond BYTES")
 parser.add_option("-s", "--string", dest="string", default=None,
                   help="string to convert")
+parser.add_option("--serve", action="store_true", dest="serve", default=False,
+                  help="stay resident, converting newline-delimited JSON jobs "
+                  "from STDIN (or --socket) and writing replies to STDOUT")
+parser.add_option("--socket", dest="socket", default=None, metavar="PATH",
+                  help="(--serve only) take jobs on the Unix socket PATH")
+parser.add_option("--workers", dest="workers", type="int", default=None,
+                  metavar="N", help="(--serve only) convert in N worker processes")
+parser.add_option("--files", dest="files", default=None, metavar="DIR",
+                  help="(--serve only) allow \"file\" jobs for files in DIR")
 (options, args) = parser.parse_args()
 
 #
@@ -183,6 +150,79 @@ if options.verbose and not hasattr(open, 'newlines'):
 
 if options.verbose: print("Options: %s" % options)
 
+log = logging.getLogger("fixofx.ofxfix")
+
+if options.debug:
+    logging.basicConfig(stream=sys.stderr, level=logging.DEBUG,
+                        format="%(name)s: %(message)s")
+elif options.timing or options.trace is not None:
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO,
+                        format="%(message)s")
+
+if options.trace is not None:
+    logging.getLogger("fixofx.trace").setLevel(logging.DEBUG)
+    set_sample_rate(options.trace)
+
+if options.timing:
+    instrument = TimingLog()
+else:
+    instrument = None
+
+budget = Budget(max_bytes=options.max_size, max_seconds=options.max_time,
+                max_memory=options.max_memory, instrument=instrument)
+
+if options.check_bankid and (options.columns or options.sqlite):
+    parser.error("--check-bankid needs OFX output; it can't be used with "
+                 "--columns or --sqlite")
+
+if options.incremental:
+    if not (options.columns or options.sqlite):
+        parser.error("--incremental needs --columns or --sqlite")
+    from fixofx.incremental import ImportIndex
+    index = ImportIndex(options.incremental)
+else:
+    index = None
+
+if options.cache:
+    from fixofx.ofx.cache import ConversionCache
+    cache = ConversionCache(options.cache, max_bytes=options.cache_size)
+else:
+    cache = None
+
+#
+# In server mode, the conversion options are defaults for every job.
+#
+
+if options.serve:
+    from fixofx.server import Server
+
+    hints = { "fid"      : options.fid,
+              "org"      : options.org,
+              "bankid"   : options.bankid,
+              "accttype" : options.accttype,
+              "acctid"   : options.acctid,
+              "balance"  : options.balance,
+              "curdef"   : options.curdef,
+              "lang"     : options.lang,
+              "dayfirst" : options.dayfirst,
+              "fitids"   : options.fitids,
+              "check_bankid" : options.check_bankid }
+    limits = { "max_bytes"   : options.max_size,
+               "max_seconds" : options.max_time,
+               "max_memory"  : options.max_memory }
+    with Server(hints=hints, workers=options.workers, limits=limits,
+                cache=cache, files=options.files) as server:
+        try:
+            if options.socket:
+                if options.verbose:
+                    sys.stderr.write("Serving on '%s'.\n" % options.socket)
+                server.serve_socket(options.socket)
+            else:
+                server.serve_stream(sys.stdin.buffer, sys.stdout.buffer)
+        except KeyboardInterrupt:
+            pass
+    sys.exit(0)
+
 #
 # Load up the raw text to be converted.
 #
@@ -231,28 +271,81 @@ else:
 # Convert the raw text to OFX 2.0.
 #
 
+filetype = "UNKNOWN"
 try:
-    # Determine the type of file contained in 'text', using a quick guess
-    # rather than parsing the file to make sure.  (Parsing will fail
-    # below if the guess is wrong on OFX/1 and QIF.)
-    filetype  = FileTyper(rawtext).trust()
-
-    if options.type:
-        print("Input file type is %s." % filetype)
-        sys.exit(0)
-    elif options.debug:
-        sys.stderr.write("Input file type is %s.\n" % filetype)
-
-    converted = convert(rawtext, filetype, verbose=options.verbose,
-                        fid=options.fid, org=options.org, bankid=options.bankid,
-                        accttype=options.accttype, acctid=options.acctid,
-                        balance=options.balance, curdef=options.curdef,
-                        lang=options.lang, dayfirst=options.dayfirst,
-                        debug=options.debug)
-    print(converted)
-    sys.exit(0)
-
-except ParseException as detail:
+    with budget:
+        budget.check_size(rawtext)
+
+        # Determine the type of file contained in 'text', using a quick guess
+        # rather than parsing the file to make sure.  (Parsing will fail
+        # below if the guess is wrong on OFX/1 and QIF.)  With a cache, the
+        # conversion guesses the type only if the file isn't cached.
+        if options.type or not cache:
+            with stage(budget, "filetype") as timer:
+                timer.count = len(rawtext)
+                filetype  = FileTyper(rawtext).trust()
+
+        if not options.type:
+            log.debug("Input file type is %s.", filetype)
+            log.debug("Starting work on raw text:\n%s\n", rawtext)
+
+            # This finishes a verbosity message started above, where we
+            # explained the source command-line option and this explains
+            # the source format.
+            if options.verbose and not cache:
+                sys.stderr.write("Converting from %s format.\n" % filetype)
+
+            hints = { "filetype" : None if cache else filetype,
+                      "fid"      : options.fid,
+                      "org"      : options.org,
+                      "bankid"   : options.bankid,
+                      "accttype" : options.accttype,
+                      "acctid"   : options.acctid,
+                      "balance"  : options.balance,
+                      "curdef"   : options.curdef,
+                      "lang"     : options.lang,
+                      "dayfirst" : options.dayfirst,
+                      "fitids"   : options.fitids,
+                      "check_bankid" : options.check_bankid }
+
+            # This will throw a ParseException if it is unable to recognize
+            # the source format, or a TypeError if it can't convert it.
+            if options.sqlite or options.columns:
+                rows = fixofx.transactions(rawtext, hints=hints, debug=options.debug,
+                                           instrument=budget)
+                if index is not None:
+                    rows = index.new_rows(rows)
+
+            if options.sqlite:
+                from fixofx.sink import SqliteSink
+
+                with SqliteSink(options.sqlite) as sink:
+                    txn_count = sink.write(rows, source=options.filename,
+                                           filetype=filetype)
+            elif options.columns:
+                from fixofx.ofx.columns import write_rows
+
+                if options.columns in ("arrow", "parquet"):
+                    txn_count = write_rows(rows, sys.stdout.buffer, options.columns)
+                else:
+                    txn_count = write_rows(rows, sys.stdout, options.columns)
+                sys.stdout.flush()
+            else:
+                converted = fixofx.convert(rawtext, hints=hints, debug=options.debug,
+                                           instrument=budget, cache=cache,
+                                           ofx102=options.verbose)
+                txn_count = converted.txn_count
+                if converted.ofx102 is not None:
+                    # The OFX/1.02 that QIF, OFC and IIF go through.
+                    sys.stderr.write("Converting to OFX/1.02...\n\n%s\n\n" %
+                                     converted.ofx102)
+                    sys.stderr.write("Converting to OFX/2.0...\n")
+                if cache and options.verbose:
+                    sys.stderr.write("%s %s file (cache hit rate %s).\n" %
+                                     ("Found cached" if cache.hits else "Converted",
+                                      converted.filetype, cache.stats()["hit_rate"]))
+
+except fixofx.ParseException as detail:
     print("Parse exception during '%s' conversion:\n%s" % (filetype, detail))
     print("Exiting.")
     sys.stderr.write("fixofx failed with error code 4\n")
@@ -263,3 +356,34 @@ except TypeError as detail:
     print("Exiting.")
     sys.stderr.write("fixofx failed with error code 5\n")
     sys.exit(5)
+
+except BudgetExceeded as detail:
+    print("Gave up on '%s' conversion: %s" % (filetype, detail))
+    print("Exiting.")
+    sys.stderr.write("fixofx failed with error code 6\n")
+    sys.exit(6)
+
+except ImportError as detail:
+    # Arrow and Parquet output without pyarrow installed.
+    print(detail)
+    print("Exiting.")
+    sys.stderr.write("fixofx failed with error code 7\n")
+    sys.exit(7)
+
+# Exit outside the 'try' for --type, so that looking up the exceptions above
+# doesn't load the parsers after all.
+if options.type:
+    print("Input file type is %s." % filetype)
+    sys.exit(0)
+
+if instrument is not None:
+    instrument.log(options.filename or "standard input")
+if options.verbose:
+    sys.stderr.write("Converted %d transactions.\n" % txn_count)
+if not (options.columns or options.sqlite):
+    if converted.bankids is not None:
+        for (bankid, check) in sorted(converted.bankids.items()):
+            sys.stderr.write("BANKID %s: valid: %s; type: %s; region: %s\n" %
+                             (bankid, check.valid, check.type, check.region))
+    print(converted.ofx)
+sys.exit(0)
@@ -1 +1,32 @@
 # coding: utf-8
+
+# The one-call conversion API:
+#
+#   import fixofx
+#   xml = fixofx.convert(data, hints={"acctid": "1234"}).ofx
+#   rows = fixofx.transactions(data, hints={"acctid": "1234"})
+#
+# fixofx.conversion, and with it the parsers and converters, is loaded on
+# first use.  ParseException is pyparsing's, raised by convert() for input
+# that can't be read; it is here so that callers can catch it without
+# importing pyparsing themselves.
+
+# Kept in step with setup.py; conversion caches are keyed by it.
+__version__ = "3.0"
+
+_exports = { "convert"        : "fixofx.conversion",
+             "Conversion"     : "fixofx.conversion",
+             "transactions"   : "fixofx.conversion",
+             "ParseException" : "pyparsing" }
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(__import__(_exports[name], fromlist=[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_exports))
@@ -0,0 +1,264 @@
+#coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+#  fixofx.conversion - canonicalize any recognized upload format to OFX 2.0.
+#
+
+import logging
+import os
+import re
+import threading
+
+from fixofx.ofx import FileTyper
+from fixofx.ofx.instrument import stage
+
+log = logging.getLogger(__name__)
+
+# The hints convert() understands, with their defaults.  They fill in what
+# the source format doesn't carry; OFX sources ignore them.  "fitids" is
+# how QIF, OFC and IIF transaction IDs are made up (see ofx.fitid);
+# "check_bankid" has convert() check the output's BANKIDs (see Conversion).
+HINTS = { "fid"      : "UNKNOWN",
+          "org"      : "UNKNOWN",
+          "bankid"   : "UNKNOWN",
+          "accttype" : "UNKNOWN",
+          "acctid"   : "UNKNOWN",
+          "balance"  : "UNKNOWN",
+          "curdef"   : None,
+          "lang"     : "ENG",
+          "dayfirst" : False,
+          "fitids"   : "position",
+          "check_bankid" : False,
+          "filetype" : None }
+
+# pyparsing grammars take a while to build and aren't safe to share between
+# threads, so each thread keeps its own, keyed by (class, debug).
+_local = threading.local()
+
+_bankid_re = re.compile(r"<BANKID>\s*([^<\s]*)")
+
+
+def _parser(parser_class, debug=False):
+    parsers = getattr(_local, "parsers", None)
+    if parsers is None:
+        parsers = _local.parsers = {}
+    key = (parser_class, debug)
+    if key not in parsers:
+        parsers[key] = parser_class(debug=debug)
+    return parsers[key]
+
+
+class Conversion:
+    """The result of convert().  'ofx' is the OFX 2.0 document, 'filetype'
+    the source format as FileTyper names it ("QIF", "OFC", "OFX/1.02" and
+    so on), 'date_format' the date format the source was read with
+    ("MM/DD/YY" or "DD/MM/YY", or None for formats with unambiguous
+    dates), and 'txn_count' the number of transactions in the output.
+    With the "check_bankid" hint, 'bankids' maps each routing number
+    (BANKID) in the output to its ofx.validators.RoutingCheck -- whether
+    it is valid, and its institution type and Federal Reserve region;
+    otherwise it is None.  'ofx102' is the OFX/1.02 document a QIF, OFC
+    or IIF source went through on the way, if convert() was asked to
+    keep it, and None otherwise."""
+
+    def __init__(self, ofx, filetype, date_format=None, ofx102=None):
+        self.ofx         = ofx
+        self.filetype    = filetype
+        self.date_format = date_format
+        self.txn_count   = ofx.count("<STMTTRN>")
+        self.bankids     = None
+        self.ofx102      = ofx102
+
+    def check_bankids(self):
+        """Fills in 'bankids' (and returns it).  Checks are remembered
+        across conversions, so the same bank costs a lookup each time."""
+        from fixofx.ofx.validators import check_routing_number
+
+        self.bankids = {}
+        for bankid in set(_bankid_re.findall(self.ofx)):
+            # "UNKNOWN" is the bankid hint's default, not a routing number.
+            if bankid and bankid != "UNKNOWN":
+                check = self.bankids[bankid] = check_routing_number(bankid)
+                if not check.valid:
+                    log.info("BANKID %s is not a valid routing number.", bankid)
+        return self.bankids
+
+    def __str__(self):
+        return self.ofx
+
+    def __repr__(self):
+        return "<Conversion %s, %d transactions>" % (self.filetype, self.txn_count)
+
+
+def read_input(data):
+    """Returns the text of 'data', which may be a str, bytes (read as
+    Latin-1, like ofxfix.py reads files), or a file object opened in
+    either mode."""
+    if hasattr(data, "read"):
+        data = data.read()
+    if isinstance(data, (bytes, bytearray)):
+        data = data.decode("latin-1")
+    if not isinstance(data, str):
+        raise TypeError("Can't convert input of type '%s'." % type(data).__name__)
+    return data
+
+
+def _options(hints):
+    # Returns HINTS filled in from 'hints'.
+    options = dict(HINTS)
+    if hints:
+        unknown = set(hints) - set(HINTS)
+        if unknown:
+            raise ValueError("Unknown conversion hints: %s" % ", ".join(sorted(unknown)))
+        options.update(hints)
+    return options
+
+
+def _read(data, hints, instrument):
+    # Returns the cleaned-up text of 'data', its file type, and the
+    # conversion options (HINTS filled in from 'hints', less the type).
+    options  = _options(hints)
+    rawtext  = read_input(data)
+    filetype = options.pop("filetype")
+    options.pop("check_bankid")
+    if filetype is None:
+        with stage(instrument, "filetype") as timer:
+            timer.count = len(rawtext)
+            filetype = FileTyper(rawtext).trust()
+    log.debug("Converting from %s format.", filetype)
+
+    text = os.linesep.join(s for s in rawtext.splitlines() if s)
+    return (text, filetype, options)
+
+
+def _converter(text, filetype, options, debug, instrument):
+    # Returns the converter for 'filetype' (a Response for OFX/1), having
+    # parsed 'text', or None for OFX/2, which needs no converting.  Each
+    # format's converter is imported when it's first needed, so that a
+    # process converting only QIF doesn't load the rest.
+    if filetype.startswith("OFX/2"):
+        return None
+
+    elif filetype.startswith("OFX"):
+        from fixofx.ofx import Parser, Response
+        return Response(text, debug=debug, instrument=instrument,
+                        parser=_parser(Parser, debug))
+
+    elif filetype == "OFC":
+        from fixofx.ofxtools.ofc_converter import OfcConverter
+        from fixofx.ofxtools.ofc_parser import OfcParser
+        return OfcConverter(text, fid=options["fid"], org=options["org"],
+                            curdef=options["curdef"], lang=options["lang"],
+                            fitids=options["fitids"], debug=debug,
+                            instrument=instrument, parser=_parser(OfcParser, debug))
+
+    elif filetype == "QIF":
+        from fixofx.ofxtools.qif_converter import QifConverter
+        from fixofx.ofxtools.qif_parser import QifParser
+        return QifConverter(text, debug=debug, instrument=instrument,
+                            parser=_parser(QifParser, debug), **options)
+
+    elif filetype == "IIF":
+        from fixofx.ofxtools.iif_converter import IifConverter
+        from fixofx.ofxtools.iif_parser import IifParser
+        return IifConverter(text, debug=debug, instrument=instrument,
+                            parser=_parser(IifParser, debug), **options)
+
+    raise TypeError("Unable to convert source format '%s'." % filetype)
+
+
+def convert(data, hints=None, debug=False, instrument=None, cache=None,
+            ofx102=False):
+    """Converts 'data' -- a str, bytes, or file object holding a file in any
+    format fixofx recognizes -- to OFX 2.0, and returns a Conversion.
+    'hints' is a dict with any of the keys in HINTS, filling in account
+    details the source format leaves out; give "filetype" to skip
+    guessing the source format.  Raises a ParseException if the source
+    can't be read as the format it seems to be, and a TypeError if the
+    format isn't one that can be converted.
+
+    Parsers are built once per thread and reused, so convert() is cheap
+    to call over and over from a long-running process, from any number
+    of threads.  With 'cache', an ofx.ConversionCache, a file converted
+    before with the same hints is returned from the cache.  With 'ofx102',
+    the Conversion keeps the intermediate OFX/1.02 document (which a
+    cached Conversion doesn't have)."""
+    options = _options(hints)
+    check_bankid = options.pop("check_bankid")
+    if cache is None:
+        result = _convert(data, hints, debug, instrument, ofx102)
+    else:
+        # Checking BANKIDs doesn't change the OFX, so it isn't part of
+        # the key.
+        text = read_input(data)
+        key = cache.key(text, options)
+        with stage(instrument, "cache_lookup"):
+            cached = cache.get(key)
+        if cached is not None:
+            result = Conversion(*cached)
+        else:
+            result = _convert(text, hints, debug, instrument, ofx102)
+            cache.put(key, result.ofx, result.filetype, result.date_format)
+
+    if check_bankid:
+        with stage(instrument, "check_bankid"):
+            result.check_bankids()
+    return result
+
+
+def _convert(data, hints, debug, instrument, keep_ofx102=False):
+    (text, filetype, options) = _read(data, hints, instrument)
+    converter = _converter(text, filetype, options, debug, instrument)
+
+    if converter is None:
+        # The file is already OFX 2 -- return it unaltered, ignoring
+        # any hints.
+        return Conversion(text, filetype)
+
+    elif filetype.startswith("OFX"):
+        with stage(instrument, "format_xml"):
+            return Conversion(converter.as_xml(original_format=filetype), filetype)
+
+    ofx102 = converter.to_ofx102() if keep_ofx102 else None
+    xml = converter.to_xml(ofx102)
+    if filetype == "OFC":
+        return Conversion(xml, filetype, ofx102=ofx102)
+    elif converter.dayfirst:
+        return Conversion(xml, filetype, "DD/MM/YY", ofx102)
+    return Conversion(xml, filetype, "MM/DD/YY", ofx102)
+
+
+def transactions(data, hints=None, debug=False, instrument=None):
+    """Reads 'data' as convert() does, and returns an iterator over its
+    transactions as flat rows (dicts keyed by ofx.columns.COLUMNS), in
+    the order the OFX 2.0 output would list them.  QIF, OFC and IIF
+    transactions come straight from the converter, without making OFX
+    and parsing it again.  Parse errors are raised here, not while
+    iterating.  Rows carry the BANKID as given, so the "check_bankid"
+    hint, which only convert() can report on, is a ValueError here;
+    check the rows' "bankid" with ofx.check_routing_number() instead."""
+    from fixofx.ofx.columns import statement_rows, xml_rows
+
+    if hints and hints.get("check_bankid"):
+        raise ValueError("The check_bankid hint is for convert(); check the rows' "
+                         "bankid with ofx.check_routing_number() instead.")
+    (text, filetype, options) = _read(data, hints, instrument)
+    converter = _converter(text, filetype, options, debug, instrument)
+
+    if converter is None:
+        return xml_rows(text)
+    elif filetype.startswith("OFX"):
+        statements = converter.get_statements()
+        return (row for statement in statements for row in statement_rows(statement))
+    return converter.rows()
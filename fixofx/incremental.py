@@ -0,0 +1,195 @@
+#coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+#  fixofx.incremental - pass on only the transactions not seen before.
+#
+
+import hashlib
+import logging
+import sqlite3
+from itertools import islice
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS import_accounts (
+    id        INTEGER PRIMARY KEY,
+    bankid    TEXT NOT NULL,
+    acctid    TEXT NOT NULL,
+    accttype  TEXT NOT NULL,
+    watermark TEXT,
+    UNIQUE (bankid, acctid, accttype)
+);
+CREATE TABLE IF NOT EXISTS import_seen (
+    account   INTEGER NOT NULL,
+    key       BLOB NOT NULL,
+    PRIMARY KEY (account, key)
+) WITHOUT ROWID;
+"""
+
+# SQLite's default limit on parameters per statement is 999.
+_LOOKUP_SIZE = 900
+
+
+def txn_key(fitid):
+    """Returns the index key for a transaction ID: a 128-bit hash, as 16
+    bytes, so that the index stays small however long the IDs.  A
+    collision would pass a real transaction over as seen; by the birthday
+    bound, the odds of any among n IDs of one account are about
+    n**2 / 2**129, or one in 10**24 at ten million transactions."""
+    return hashlib.blake2b(fitid.encode("utf-8"), digest_size=16).digest()
+
+
+class ImportIndex:
+    """A persistent index of the transactions already imported for each
+    account, for importing overlapping statements (successive 90-day
+    downloads, or re-uploaded QIF files) without passing anything on
+    twice.  Transactions are known by their FITID -- the bank's, or the
+    synthetic one the QIF, OFC and IIF converters make.
+
+    Each account also has a watermark, the latest transaction date seen
+    for it.  Later transactions can't have been seen, so they skip the
+    lookup; in the usual incremental import, where most of a statement
+    overlaps the last one and the rest is newer, only the overlap is
+    looked up.  Lookups go to SQLite in batches, against a table keyed
+    by (account, hash of FITID), so they stay cheap at tens of millions
+    of transactions.
+
+    'database' is a path or an open sqlite3 connection; a connection is
+    left open by close(), with its isolation_level as it was.  Keep it apart
+    from the database of a fixofx.sink.SqliteSink the new rows are
+    written to: each holds its own write transaction while the rows
+    flow through."""
+
+    def __init__(self, database, batch_size=10000, fast=True):
+        if isinstance(database, sqlite3.Connection):
+            self.connection = database
+            self._owned     = False
+        else:
+            self.connection = sqlite3.connect(database)
+            self._owned     = True
+        # Transactions are begun and committed explicitly; the caller's
+        # setting is put back by close().
+        self._isolation_level = self.connection.isolation_level
+        self.connection.isolation_level = None
+        self.batch_size = batch_size
+        if fast:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.new  = 0
+        self.seen = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        if self._owned:
+            self.connection.close()
+        else:
+            self.connection.isolation_level = self._isolation_level
+
+    def watermark(self, bankid, acctid, accttype):
+        """Returns the latest transaction date (as YYYYMMDD) imported
+        for the account, or None -- useful for choosing how far back the
+        next statement request needs to go."""
+        found = self.connection.execute(
+            "SELECT watermark FROM import_accounts WHERE bankid = ? AND acctid = ?"
+            " AND accttype = ?", (bankid or "", acctid or "", accttype or "")).fetchone()
+        if found is None:
+            return None
+        return found[0]
+
+    def new_rows(self, rows):
+        """Yields the rows (as made by fixofx.transactions()) not seen
+        before, in their original order.  They are recorded as seen when
+        the generator finishes, in one database transaction; if it is
+        abandoned or fails part way, nothing is recorded, and the same
+        rows will be new next time.  Rows without a FITID can't be
+        matched up, and are always new."""
+        rows = iter(rows)
+        cursor = self.connection.cursor()
+        cursor.execute("BEGIN")
+        accounts = {}
+        try:
+            while True:
+                batch = list(islice(rows, self.batch_size))
+                if not batch:
+                    break
+                for row in self._new_in_batch(cursor, batch, accounts):
+                    yield row
+            cursor.executemany("UPDATE import_accounts SET watermark = ? WHERE id = ?",
+                               [(account[1], account[0]) for account in accounts.values()
+                                if account[2]])
+            cursor.execute("COMMIT")
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+
+    def _new_in_batch(self, cursor, batch, accounts):
+        # 'accounts' maps account keys to [id, watermark, changed].
+        keyed = []
+        lookups = {}
+        for row in batch:
+            if row["fitid"] is None:
+                keyed.append((row, None, None))
+                continue
+            account_key = (row["bankid"] or "", row["acctid"] or "", row["accttype"] or "")
+            account = accounts.get(account_key)
+            if account is None:
+                account = accounts[account_key] = self._account(cursor, account_key)
+            key = txn_key(row["fitid"])
+            keyed.append((row, account, key))
+            date = row["date"]
+            if date is None or account[1] is None or date[:8] <= account[1]:
+                lookups.setdefault(account[0], set()).add(key)
+
+        found = set()
+        for (account_id, keys) in lookups.items():
+            keys = list(keys)
+            for start in range(0, len(keys), _LOOKUP_SIZE):
+                chunk = keys[start:start + _LOOKUP_SIZE]
+                cursor.execute("SELECT key FROM import_seen WHERE account = ? AND key IN (%s)"
+                               % ",".join("?" * len(chunk)), [account_id] + chunk)
+                found.update((account_id, key) for (key,) in cursor)
+
+        added = []
+        for (row, account, key) in keyed:
+            if key is not None:
+                if (account[0], key) in found:
+                    self.seen += 1
+                    continue
+                # A repeat within this import is a repeat too.
+                found.add((account[0], key))
+                added.append((account[0], key))
+                date = row["date"]
+                if date is not None and (account[1] is None or date[:8] > account[1]):
+                    account[1] = date[:8]
+                    account[2] = True
+            self.new += 1
+            yield row
+        cursor.executemany("INSERT OR IGNORE INTO import_seen (account, key) VALUES (?, ?)",
+                           added)
+
+    def _account(self, cursor, account_key):
+        cursor.execute("INSERT OR IGNORE INTO import_accounts (bankid, acctid, accttype)"
+                       " VALUES (?, ?, ?)", account_key)
+        cursor.execute("SELECT id, watermark FROM import_accounts WHERE bankid = ?"
+                       " AND acctid = ? AND accttype = ?", account_key)
+        (account_id, watermark) = cursor.fetchone()
+        return [account_id, watermark, False]
@@ -20,16 +20,59 @@
 # and have access to all of the classes in the OFX library.  Refer to
 # them with the prefix 'ofx.' and the class name.  For instance, to
 # refer to an OFX error, use the name 'ofx.Error'.
+#
+# The classes are loaded on first use, so that a script that only needs one
+# of them (FileTyper, say) doesn't pay for pyparsing, urllib and the rest.
+# The OFX tag builders of ofx.builder (ofx.OFX, ofx.STMTTRN, and so on) are
+# available the same way, and 'from fixofx.ofx import *' still gives all of
+# them, loading each as it goes.  (The imports use __import__ rather than
+# importlib so that they show up in 'python -X importtime'.)
+
+_exports = { "Account"        : "fixofx.ofx.account",
+             "Document"       : "fixofx.ofx.document",
+             "Error"          : "fixofx.ofx.error",
+             "FileTyper"      : "fixofx.ofx.filetyper",
+             "Instrument"     : "fixofx.ofx.instrument",
+             "TimingLog"      : "fixofx.ofx.instrument",
+             "Budget"         : "fixofx.ofx.budget",
+             "BudgetExceeded" : "fixofx.ofx.budget",
+             "Generator"      : "fixofx.ofx.generator",
+             "Transaction"    : "fixofx.ofx.generator",
+             "Institution"    : "fixofx.ofx.institution",
+             "Parser"         : "fixofx.ofx.parser",
+             "Request"        : "fixofx.ofx.request",
+             "Response"       : "fixofx.ofx.response",
+             "Statement"      : "fixofx.ofx.response",
+             "ResponseCache"  : "fixofx.ofx.cache",
+             "ConversionCache" : "fixofx.ofx.cache",
+             "RoutingNumber"  : "fixofx.ofx.validators",
+             "RoutingCheck"   : "fixofx.ofx.validators",
+             "check_routing_number"  : "fixofx.ofx.validators",
+             "check_routing_numbers" : "fixofx.ofx.validators",
+             "Client"         : "fixofx.ofx.client",
+             "AsyncClient"    : "fixofx.ofx.async_client" }
+
+
+def __getattr__(name):
+    if name == "__all__":
+        # For 'from fixofx.ofx import *': the classes, the modules they
+        # come from, and the tag builders, as the package used to import
+        # them all.  Only a star import pays for working this out.
+        builder = __import__("fixofx.ofx.builder", fromlist=["__all__"])
+        modules = set(module.rsplit(".", 1)[1] for module in _exports.values())
+        value = sorted(set(_exports) | modules | {"builder"}) + list(builder.__all__)
+    elif name in _exports:
+        value = getattr(__import__(_exports[name], fromlist=[name]), name)
+    elif name.isupper():
+        builder = __import__("fixofx.ofx.builder", fromlist=[name])
+        if name not in builder.__all__:
+            raise AttributeError("module %r has no attribute %r" % (__name__, name))
+        value = getattr(builder, name)
+    else:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    globals()[name] = value
+    return value
+
 
-from fixofx.ofx.account import Account
-from fixofx.ofx.document import Document
-from fixofx.ofx.error import Error
-from fixofx.ofx.filetyper import FileTyper
-from fixofx.ofx.generator import Generator, Transaction
-from fixofx.ofx.institution import Institution
-from fixofx.ofx.parser import Parser
-from fixofx.ofx.request import Request
-from fixofx.ofx.response import Response, Statement
-from fixofx.ofx.validators import RoutingNumber
-from fixofx.ofx.client import Client
-from fixofx.ofx.builder import *
+def __dir__():
+    return sorted(set(globals()) | set(_exports))
@@ -0,0 +1,283 @@
+#coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+# ofx.async_client - asyncio user agent with keep-alive connection pools.
+#
+
+import asyncio
+import logging
+import ssl
+import urllib.error
+import urllib.parse
+from email.message import Message
+
+from fixofx.ofx import Error
+from fixofx.ofx.client import Client, merge_statements
+
+log = logging.getLogger(__name__)
+
+
+class _Connection:
+    """One keep-alive HTTP/1.1 connection to an OFX server."""
+
+    def __init__(self, reader, writer):
+        self.reader   = reader
+        self.writer   = writer
+        self.reusable = True
+        self.used     = False
+
+    def is_closed(self):
+        return self.writer.is_closing() or self.reader.at_eof()
+
+    def close(self):
+        self.reusable = False
+        self.writer.close()
+
+    async def post(self, host, path, body):
+        self.used = True
+        head = ("POST %s HTTP/1.1\r\n"
+                "Host: %s\r\n"
+                "Content-Type: application/x-ofx\r\n"
+                "Accept: */*, application/x-ofx\r\n"
+                "Content-Length: %d\r\n"
+                "Connection: keep-alive\r\n"
+                "\r\n") % (path, host, len(body))
+        self.writer.write(head.encode("latin-1") + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("Server closed the connection.")
+        (version, status, reason) = \
+            (status_line.decode("latin-1").rstrip("\r\n").split(" ", 2) + [""])[:3]
+
+        headers = Message()
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            (name, _, value) = line.decode("latin-1").partition(":")
+            headers[name.strip()] = value.strip()
+
+        connection = headers.get("Connection", "").lower()
+        if connection == "close" or (version == "HTTP/1.0" and
+                                     connection != "keep-alive"):
+            self.reusable = False
+
+        if headers.get("Transfer-Encoding", "").lower() == "chunked":
+            content = await self._read_chunked()
+        elif headers.get("Content-Length") is not None:
+            content = await self.reader.readexactly(int(headers["Content-Length"]))
+        else:
+            content = await self.reader.read()
+            self.reusable = False
+
+        return (int(status), reason, headers, content)
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b";")[0].strip(), 16)
+            if size == 0:
+                # Skip any trailers.
+                while (await self.reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readexactly(2)
+
+
+class _ConnectionPool:
+    """Idle keep-alive connections to one OFX server (scheme, host and
+    port)."""
+
+    def __init__(self, scheme, host, port, ssl_context=None, max_idle=8):
+        self.scheme      = scheme
+        self.host        = host
+        self.port        = port
+        self.ssl_context = ssl_context
+        self.max_idle    = max_idle
+        self.idle        = []
+        self.opened      = 0
+
+    async def acquire(self):
+        while self.idle:
+            conn = self.idle.pop()
+            if not conn.is_closed():
+                return conn
+            conn.close()
+
+        if self.scheme == "https":
+            context = self.ssl_context or ssl.create_default_context()
+            (reader, writer) = await asyncio.open_connection(
+                self.host, self.port, ssl=context, server_hostname=self.host)
+        else:
+            (reader, writer) = await asyncio.open_connection(self.host, self.port)
+        self.opened += 1
+        log.debug("Opened connection %d to %s:%s.", self.opened, self.host, self.port)
+        return _Connection(reader, writer)
+
+    def release(self, conn):
+        if conn.reusable and len(self.idle) < self.max_idle and not conn.is_closed():
+            self.idle.append(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        for conn in self.idle:
+            conn.close()
+        self.idle = []
+
+
+class AsyncClient(Client):
+    """asyncio version of ofx.Client, for fetching from many accounts at
+    once.  The request methods are the same as Client's, but are awaited:
+
+        async with AsyncClient(limit=4) as client:
+            responses = await asyncio.gather(
+                *[client.get_statement(acct, user, password) for acct in accounts])
+
+    Connections to each OFX server are kept alive and reused between
+    requests.  At most 'limit' requests are in flight at a time to any one
+    Institution.ofx_url; 'limits' maps individual URLs to their own
+    limit.  'timeout' (in seconds) bounds each request/response exchange.
+    'split_days', 'window_memory' and 'cache' work as they do for Client,
+    except that split date ranges are fetched concurrently within the URL
+    limit.
+    Responses are parsed on the default executor so that the event loop
+    stays responsive while a large statement is parsed."""
+
+    def __init__(self, limit=4, limits=None, timeout=60, ssl_context=None,
+                 max_idle=8, split_days=None, window_memory=None, cache=None):
+        Client.__init__(self, split_days=split_days,
+                        window_memory=window_memory, cache=cache)
+        self.limit       = limit
+        self.limits      = limits or {}
+        self.timeout     = timeout
+        self.ssl_context = ssl_context
+        self.max_idle    = max_idle
+        self._pools      = {}
+        self._semaphores = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+        return False
+
+    async def close(self):
+        """Closes all pooled connections."""
+        for pool in self._pools.values():
+            pool.close()
+        self._pools = {}
+
+    # The request methods are inherited from Client; they return whatever
+    # _send_request or _fetch_statement return, which here are coroutines.
+
+    async def _fetch_statement(self, account, make_request):
+        url = account.institution.ofx_url
+        windows = self._statement_windows(url)
+        for days in windows:
+            try:
+                response = await self._fetch_window(url, make_request, days)
+            except Error:
+                if days == windows[-1]:
+                    raise
+                log.debug("%s rejected a %d-day statement request.", url, days)
+                continue
+            self.window_memory[url] = days
+            return response
+
+    async def _fetch_window(self, url, make_request, days):
+        ranges = self._date_ranges(days)
+        messages = [make_request(start, end) for (start, end) in ranges]
+        self.request_msg = messages[0]
+        if len(messages) == 1:
+            return await self._send_request(url, messages[0])
+
+        responses = await asyncio.gather(
+            *[self._send_request(url, message) for message in messages])
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._check_response,
+                                          merge_statements(responses))
+
+    async def _send_request(self, url, request_body):
+        """Transmits the message to the server and checks the response
+        for error status."""
+        loop = asyncio.get_running_loop()
+        if self.cache is not None:
+            key = self.cache.key(url, request_body)
+            response = await loop.run_in_executor(None, self.cache.get, key)
+            if response is not None:
+                return response
+
+        async with self._semaphore(url):
+            response = await self._post(url, request_body)
+        response = await loop.run_in_executor(None, self._check_response, response)
+
+        if self.cache is not None:
+            await loop.run_in_executor(None, self.cache.put, key, response)
+        return response
+
+    def _semaphore(self, url):
+        semaphore = self._semaphores.get(url)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.limits.get(url, self.limit))
+            self._semaphores[url] = semaphore
+        return semaphore
+
+    def _pool(self, parts):
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        key = (parts.scheme, parts.hostname, port)
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = _ConnectionPool(parts.scheme, parts.hostname, port,
+                                   ssl_context=self.ssl_context,
+                                   max_idle=self.max_idle)
+            self._pools[key] = pool
+        return pool
+
+    async def _post(self, url, request_body):
+        """Transmits the message to the server over a pooled connection
+        and returns the raw response body."""
+        parts = urllib.parse.urlsplit(url)
+        pool = self._pool(parts)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        body = request_body.encode('utf-8')
+
+        while True:
+            conn = await pool.acquire()
+            reused = conn.used
+            try:
+                (status, reason, headers, content) = await asyncio.wait_for(
+                    conn.post(parts.netloc, path, body), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                conn.close()
+                if reused:
+                    # The server dropped an idle keep-alive connection;
+                    # try again on a fresh one.
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            break
+
+        pool.release(conn)
+        if status != 200:
+            raise urllib.error.HTTPError(url, status, reason, headers, None)
+        return content
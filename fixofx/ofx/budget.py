@@ -0,0 +1,280 @@
+#coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+#  ofx.budget - size, time and memory limits for one conversion.
+#
+
+import logging
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+from fixofx.ofx.instrument import Instrument
+
+try:
+    import ctypes
+    _set_async_exc = ctypes.pythonapi.PyThreadState_SetAsyncExc
+except (ImportError, AttributeError):
+    _set_async_exc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+log = logging.getLogger(__name__)
+
+
+class BudgetExceeded(Exception):
+    """Raised when a conversion goes over one of the limits of a Budget.
+    'stage' is the conversion stage that was running when it did (one of
+    the ofx.instrument stage names, or "input" for the size check), and
+    'limit' is "size", "time", "memory" or "recursion"."""
+
+    def __init__(self, stage, limit, allowed=None, used=None):
+        self.stage   = stage
+        self.limit   = limit
+        self.allowed = allowed
+        self.used    = used
+        if allowed is None:
+            message = "%s limit exceeded in stage '%s'" % (limit, stage)
+        else:
+            message = "%s limit exceeded in stage '%s' (%s used, %s allowed)" % \
+                (limit, stage, used, allowed)
+        Exception.__init__(self, message)
+
+
+class _Overrun(BaseException):
+    # Raised asynchronously in the converting thread by the watchdog, and
+    # turned into a BudgetExceeded when the Budget exits.  It derives from
+    # BaseException so that the converters' 'except Exception' blocks let
+    # it through; the watchdog raises it again until it gets out of the
+    # bare 'except:' blocks as well.
+    pass
+
+
+# Parsers that recurse once per level of nesting raise the recursion limit
+# while they run, and it is put back once the last thread using it is
+# done; _recursion_depth counts the users in each thread.
+_recursion_lock  = threading.Lock()
+_recursion_depth = {}
+_recursion_saved = None
+
+
+@contextmanager
+def recursion_limit(limit):
+    """Raises the recursion limit to at least 'limit' for the 'with'
+    block.  A Budget that interrupts the block puts the limit back on
+    exit, should the interruption land where this can't."""
+    global _recursion_saved
+    thread = threading.get_ident()
+    with _recursion_lock:
+        if not _recursion_depth:
+            _recursion_saved = sys.getrecursionlimit()
+            sys.setrecursionlimit(max(limit, _recursion_saved))
+        _recursion_depth[thread] = _recursion_depth.get(thread, 0) + 1
+    try:
+        yield
+    finally:
+        _release_recursion_limit(thread, 1)
+
+
+def _release_recursion_limit(thread, levels=None):
+    # Drops 'levels' of the thread's use of the raised limit (all of them
+    # if None), and puts the limit back if nobody is left using it.
+    # Calling it again after an interruption is harmless.
+    global _recursion_saved
+    with _recursion_lock:
+        depth = _recursion_depth.pop(thread, 0)
+        if levels is not None and depth > levels:
+            _recursion_depth[thread] = depth - levels
+        if not _recursion_depth and _recursion_saved is not None:
+            sys.setrecursionlimit(_recursion_saved)
+            _recursion_saved = None
+
+
+def _memory_in_use():
+    """Returns the resident set size of the process in bytes, or failing
+    that, its peak resident set size, or None."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if resource is not None:
+        # Kilobytes on Linux; good enough as a fallback.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return None
+
+
+class Budget(Instrument):
+    """Limits one conversion to 'max_bytes' of input, 'max_seconds' of
+    wall time and 'max_memory' bytes of memory growth (measured as the
+    process's resident size over what it was when the budget started).
+    Use it as a context manager around the conversion, and pass it as
+    the conversion's instrument so that it knows which stage is running:
+
+        with Budget(max_bytes=..., max_seconds=10) as budget:
+            budget.check_size(text)
+            xml = QifConverter(text, instrument=budget).to_xml()
+
+    Going over a limit raises BudgetExceeded from the 'with' block.
+    Limits are checked as each stage starts and ends, and every
+    'interval' seconds by a watchdog thread, which interrupts a stage
+    that runs long by raising an exception in the converting thread.
+    That exception can only be raised between Python steps, so a stage
+    stuck in one long call into C (a regular expression match on a huge
+    field, say) is interrupted only once that call returns.  A
+    RecursionError (from deeply nested input) is reported as a recursion
+    overrun.  Stage events are passed on to 'instrument', if given.
+
+    A Budget is good for one conversion at a time, in one thread."""
+
+    def __init__(self, max_bytes=None, max_seconds=None, max_memory=None,
+                 instrument=None, interval=0.05):
+        self.max_bytes   = max_bytes
+        self.max_seconds = max_seconds
+        self.max_memory  = max_memory
+        self.instrument  = instrument
+        self.interval    = interval
+
+        self.stages    = []
+        self.exceeded  = None
+        self._lock     = threading.Lock()
+        self._done     = threading.Event()
+        self._watchdog = None
+        self._thread   = None
+        self._injected = False
+        self._delivered = False
+
+    def __enter__(self):
+        self.stages     = []
+        self.exceeded   = None
+        self._injected  = False
+        self._delivered = False
+        self._started   = perf_counter()
+        self._baseline  = _memory_in_use() if self.max_memory is not None else None
+        self._thread    = threading.get_ident()
+        self._done.clear()
+        if self.max_seconds is not None or self.max_memory is not None:
+            self._watchdog = threading.Thread(target=self._watch,
+                                              name="fixofx-budget", daemon=True)
+            self._watchdog.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        while True:
+            try:
+                with self._lock:
+                    # Once the watchdog has stopped, withdraw any
+                    # interruption it made that hasn't been delivered, so
+                    # that none goes off after the block.
+                    self._done.set()
+                    if self._injected and _set_async_exc is not None:
+                        _set_async_exc(ctypes.c_ulong(self._thread), None)
+                break
+            except _Overrun:
+                # Delivered here, on the way out; self.exceeded says why.
+                pass
+        if self._injected:
+            # The interruption may have landed in a recursion_limit()
+            # block's clean-up; none can come now, so finish it here.
+            _release_recursion_limit(self._thread)
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+
+        if self.exceeded is None and exc_type is RecursionError:
+            self.exceeded = BudgetExceeded(self.current_stage(), "recursion")
+        if self.exceeded is None or exc_value is self.exceeded:
+            return False
+        if exc_type is _Overrun:
+            raise self.exceeded from None
+        raise self.exceeded from exc_value
+
+    def current_stage(self):
+        if self.stages:
+            return self.stages[-1]
+        return "(between stages)"
+
+    def check_size(self, data):
+        """Raises BudgetExceeded if 'data' (the input to convert) is larger
+        than max_bytes."""
+        if self.max_bytes is not None and len(data) > self.max_bytes:
+            self.exceeded = BudgetExceeded("input", "size", self.max_bytes, len(data))
+            raise self.exceeded
+
+    def check(self):
+        """Raises BudgetExceeded if the conversion has gone over its time or
+        memory limit."""
+        if self.exceeded is None:
+            self.exceeded = self._overrun()
+        if self.exceeded is not None:
+            raise self.exceeded
+
+    def stage_started(self, stage):
+        self.stages.append(stage)
+        if self.instrument is not None:
+            self.instrument.stage_started(stage)
+        self.check()
+
+    def stage_finished(self, stage, elapsed, count=None):
+        if self.instrument is not None:
+            self.instrument.stage_finished(stage, elapsed, count)
+        # Check before leaving the stage, so an overrun names it.
+        if self.exceeded is None and isinstance(sys.exc_info()[1], RecursionError):
+            self.exceeded = BudgetExceeded(stage, "recursion")
+        if self.exceeded is not None:
+            self._delivered = True
+        try:
+            self.check()
+        finally:
+            if self.stages and self.stages[-1] == stage:
+                self.stages.pop()
+
+    def _overrun(self):
+        if self.max_seconds is not None:
+            elapsed = perf_counter() - self._started
+            if elapsed > self.max_seconds:
+                return BudgetExceeded(self.current_stage(), "time",
+                                      "%.2fs" % self.max_seconds, "%.2fs" % elapsed)
+        if self.max_memory is not None and self._baseline is not None:
+            growth = _memory_in_use() - self._baseline
+            if growth > self.max_memory:
+                return BudgetExceeded(self.current_stage(), "memory",
+                                      self.max_memory, growth)
+        return None
+
+    def _watch(self):
+        injected_at = None
+        while not self._done.wait(self.interval):
+            with self._lock:
+                if self._done.is_set() or self._delivered:
+                    return
+                if self.exceeded is None:
+                    self.exceeded = self._overrun()
+                if self.exceeded is None or _set_async_exc is None:
+                    continue
+                # Interrupt again now and then, in case a bare 'except:'
+                # swallowed the last one, until the exception reaches the
+                # end of a stage.
+                now = perf_counter()
+                if injected_at is None or now - injected_at > 1.0:
+                    log.debug("Interrupting conversion: %s", self.exceeded)
+                    self._injected = True
+                    injected_at = now
+                    _set_async_exc(ctypes.c_ulong(self._thread),
+                                   ctypes.py_object(_Overrun))
@@ -0,0 +1,266 @@
+#coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+#  ofx.cache - on-disk caches of OFX server responses and of conversions.
+#
+
+import hashlib
+import logging
+import os
+import pickle
+import re
+import tempfile
+import time
+
+log = logging.getLogger(__name__)
+
+# Parts of a request that change on every request without changing what is
+# being asked for.  Everything else -- the server URL, FI, user, account
+# and statement dates -- goes into the cache key.  USERPASS is taken out
+# of the text and goes in only as a keyed hash of the credentials (see
+# ResponseCache.key), so that a wrong password misses the cache without
+# the password leaking into the key.
+_volatile_re = re.compile(r"(?:<(?:DTCLIENT|TRNUID|USERPASS)>|NEWFILEUID:)[^<\r\n]*")
+_credentials_re = re.compile(r"<(?:USERID|USERPASS)>([^<\r\n]*)")
+
+# Bump this when the pickled form changes, so that old entries are
+# ignored rather than misread.
+_FORMAT = 2
+
+
+class _DiskCache:
+    # A directory of pickled entries, one file per key, shared safely by
+    # any number of processes: entries are written to a temporary file and
+    # renamed into place, so readers see whole entries or none, and files
+    # that vanish under one process (evicted by another) are just misses.
+    # Access times order entries for eviction; modification times are
+    # when they were stored.  Listing the directory to evict is the slow
+    # part of a store, so it is only done when this process's running
+    # total (as of its last listing, plus what it has stored since) says
+    # the cache may be over size.  Entries from other processes can push
+    # it over in between; the next listing catches up.
+
+    def __init__(self, directory, ttl, max_bytes):
+        self.directory = directory
+        self.ttl       = ttl
+        self.max_bytes = max_bytes
+        self.hits      = 0
+        self.misses    = 0
+        self._total    = None
+        os.makedirs(directory, exist_ok=True)
+
+    def clear(self):
+        for (path, stat) in self._entries():
+            self._remove(path)
+        self._total = None
+
+    def stats(self):
+        """Returns this process's hits, misses and hit rate (None before
+        the first lookup), and the number and total size of the entries
+        now in the cache (from every process using it)."""
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return { "hits"     : self.hits,
+                 "misses"   : self.misses,
+                 "hit_rate" : self.hits / lookups if lookups else None,
+                 "entries"  : len(entries),
+                 "bytes"    : sum(stat.st_size for (path, stat) in entries) }
+
+    def _load(self, key):
+        # Returns the entry stored under 'key' (less its format number),
+        # or None, counting the hit or miss.
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.misses += 1
+            return None
+
+        now = time.time()
+        if self.ttl is not None and now - stat.st_mtime > self.ttl:
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        try:
+            with open(path, "rb") as entry:
+                stored = pickle.load(entry)
+        except Exception as detail:
+            log.debug("Dropping unreadable cache entry %s: %s", path, detail)
+            self._remove(path)
+            self.misses += 1
+            return None
+        if stored[0] != _FORMAT:
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        # The access time orders entries for eviction; the modification
+        # time is left alone, since it is what the TTL counts from.
+        try:
+            os.utime(path, (now, stat.st_mtime))
+        except OSError:
+            pass
+        self.hits += 1
+        return stored[1:]
+
+    def _store(self, key, dump, entry_value):
+        (fd, temp_path) = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as entry:
+                dump((_FORMAT,) + entry_value, entry)
+                size = entry.tell()
+            os.replace(temp_path, self._path(key))
+        except BaseException:
+            self._remove(temp_path)
+            raise
+        if self._total is None or self._total + size > self.max_bytes:
+            self._evict()
+        else:
+            self._total += size
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pickle")
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".pickle"):
+                path = os.path.join(self.directory, name)
+                try:
+                    entries.append((path, os.stat(path)))
+                except OSError:
+                    pass
+        return entries
+
+    def _evict(self):
+        now = time.time()
+        live = []
+        total = 0
+        for (path, stat) in self._entries():
+            if self.ttl is not None and now - stat.st_mtime > self.ttl:
+                self._remove(path)
+            else:
+                live.append((stat.st_atime, stat.st_size, path))
+                total += stat.st_size
+
+        live.sort()
+        while total > self.max_bytes and live:
+            (atime, size, path) = live.pop(0)
+            self._remove(path)
+            total -= size
+        self._total = total
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class ResponseCache(_DiskCache):
+    """Opt-in on-disk cache of successful OFX server responses, for use as
+    the 'cache' argument of ofx.Client and ofx.AsyncClient.  Entries are
+    keyed by server URL and request contents (institution, user, account
+    and date range), and hold the raw response, which is parsed again
+    lazily when it is read, so a hit costs no download, and only as much
+    parsing as the caller needs.  Storing an entry doesn't parse a lazy
+    Response either.
+
+    Entries older than 'ttl' seconds are ignored and removed.  When the
+    cache grows past 'max_bytes', the least recently used entries are
+    removed."""
+
+    def __init__(self, directory, ttl=6 * 60 * 60, max_bytes=64 * 1024 * 1024):
+        _DiskCache.__init__(self, directory, ttl, max_bytes)
+        self._key = None
+
+    def key(self, url, request_body):
+        credentials = "\x1f".join(value.strip() for value
+                                   in _credentials_re.findall(request_body))
+        credentials = hashlib.blake2b(credentials.encode("utf-8"), key=self._secret(),
+                                      digest_size=32).hexdigest()
+        normalized = _volatile_re.sub("", request_body)
+        return hashlib.sha256((url + "\n" + normalized + "\n" + credentials)
+                              .encode("utf-8")).hexdigest()
+
+    def _secret(self):
+        # The key of the credentials hash: random, made by the first
+        # process to use the directory and shared by the rest, so that
+        # entry names can't be used to guess passwords offline.
+        if self._key is None:
+            path = os.path.join(self.directory, "secret")
+            if not os.path.exists(path):
+                (fd, temp_path) = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "wb") as secret:
+                        secret.write(os.urandom(32))
+                    os.link(temp_path, path)
+                except FileExistsError:
+                    pass
+                finally:
+                    self._remove(temp_path)
+            with open(path, "rb") as secret:
+                self._key = secret.read()
+        return self._key
+
+    def get(self, key):
+        """Returns the cached Response for 'key', or None."""
+        from fixofx.ofx.response import Response
+
+        stored = self._load(key)
+        if stored is None:
+            return None
+        (raw_response,) = stored
+        return Response(raw_response, lazy=True)
+
+    def put(self, key, response):
+        """Stores 'response' under 'key', then evicts as needed."""
+        self._store(key, pickle.dump, (response.raw_response,))
+
+
+class ConversionCache(_DiskCache):
+    """Opt-in on-disk cache of conversions, for use as the 'cache' argument
+    of fixofx.convert().  Entries are keyed by a hash of the raw input, the
+    conversion hints and the fixofx version, so a file uploaded again
+    with the same hints comes straight back from the cache, without so
+    much as guessing its type, and an upgrade starts the cache afresh.
+
+    When the cache grows past 'max_bytes', the least recently used
+    entries are removed; entries older than 'ttl' seconds, if given, are
+    ignored and removed.  Any number of processes may share a cache
+    directory."""
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, ttl=None):
+        _DiskCache.__init__(self, directory, ttl, max_bytes)
+
+    def key(self, text, hints):
+        """Returns the key for converting 'text' (a str) with 'hints' (a
+        dict of every conversion hint, defaults included)."""
+        from fixofx import __version__
+
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(("%s\n%d\n%r\n" % (__version__, _FORMAT,
+                                          sorted(hints.items()))).encode("utf-8"))
+        digest.update(text.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Returns the cached (ofx, filetype, date_format) for 'key', or
+        None."""
+        return self._load(key)
+
+    def put(self, key, ofx, filetype, date_format):
+        """Stores a conversion under 'key', then evicts as needed."""
+        self._store(key, pickle.dump, (ofx, filetype, date_format))
@@ -16,11 +16,57 @@
 #
 # ofx.client - user agent for sending OFX requests and checking responses.
 #
+import logging
+import re
 import urllib.request
 import urllib.error
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 
 from fixofx.ofx import Request, Error, Response
+from fixofx.ofx.status import scan_status
+
+log = logging.getLogger(__name__)
+
+_tranlist_re = re.compile(r"<BANKTRANLIST>\s*(.*?)</BANKTRANLIST>", re.DOTALL)
+_stmttrn_re  = re.compile(r"<STMTTRN>.*?</STMTTRN>[ \t]*\r?\n?", re.DOTALL)
+_fitid_re    = re.compile(r"<FITID>([^<\r\n]*)")
+_dtstart_re  = re.compile(r"<DTSTART>([^<\r\n]*)")
+
+
+def merge_statements(responses):
+    """Merges the statement Responses for several date ranges of one
+    account into a single OFX document.  The first response (the newest
+    range) supplies everything but the transaction list; the transaction
+    lists are combined, dropping transactions whose FITID was already
+    seen, and the list starts at the earliest DTSTART."""
+    texts = [response.as_string() for response in responses]
+    seen   = set()
+    txns   = []
+    starts = []
+    for text in texts:
+        tranlist = _tranlist_re.search(text)
+        if tranlist is None:
+            continue
+        start = _dtstart_re.search(tranlist.group(1))
+        if start is not None:
+            starts.append(start.group(1).strip())
+        for match in _stmttrn_re.finditer(tranlist.group(1)):
+            fitid = _fitid_re.search(match.group(0))
+            key = fitid.group(1).strip() if fitid is not None else match.group(0)
+            if key not in seen:
+                seen.add(key)
+                txns.append(match.group(0))
+
+    base = texts[0]
+    tranlist = _tranlist_re.search(base)
+    if tranlist is None:
+        return base
+    first = _stmttrn_re.search(tranlist.group(1))
+    head = tranlist.group(1)[:first.start()] if first is not None else tranlist.group(1)
+    if starts:
+        head = _dtstart_re.sub("<DTSTART>" + min(starts), head, 1)
+    return base[:tranlist.start(1)] + head + "".join(txns) + base[tranlist.end(1):]
 
 
 class Client:
@@ -30,11 +76,31 @@ class Client:
     error flags and throwing errors as exceptions, and returning the
     requested OFX document if the request was successful."""
 
-    def __init__(self):
-        """Constructs the Client object.  No configuration options
-        are offered."""
+    # Statement date ranges to try, in days, longest first.  The USAA and
+    # American Express OFX servers return a valid statement for the full
+    # year, although USAA only includes 90 days and American Express seems
+    # to only include back to the first of the year.  30 days has been our
+    # default, and always seems to work across all OFX servers.
+    statement_windows = (365, 90, 30)
+
+    def __init__(self, split_days=None, max_workers=4, window_memory=None,
+                 cache=None):
+        """Constructs the Client object.  The client remembers, for each
+        OFX server, the longest statement date range that worked and
+        starts from there next time; pass the same dict as
+        'window_memory' to share that between clients.  If 'split_days'
+        is given, longer statements are requested as several ranges of
+        that many days, up to 'max_workers' at once, and merged.  If
+        'cache' (an ofx.ResponseCache) is given, successful responses are
+        kept there and reused for identical requests."""
         # FIXME: Need to let the client set itself for OFX 1.02 or OFX 2.0 formatting.
-        self.request_msg = None
+        self.request_msg   = None
+        self.split_days    = split_days
+        self.max_workers   = max_workers
+        self.cache         = cache
+        if window_memory is None:
+            window_memory = {}
+        self.window_memory = window_memory
 
     def get_fi_profile(self, institution,
                        username="anonymous00000000000000000000000",
@@ -62,25 +128,9 @@ class Client:
         """Sends an OFX request for the given user's bank account
         statement, and returns that statement as an OFX document if
         the request is successful."""
-        request = Request()
-        # I'm breaking out these retries by statement type since I'm assuming that bank,
-        # credit card, and investment OFX servers may each have different behaviors.
-        try:
-            # First, try to get a statement for the full year.  The USAA and American Express
-            # OFX servers return a valid statement, although USAA only includes 90 days and
-            # American Express seems to only include back to the first of the year.
-            self.request_msg = request.bank_stmt(account, username, password, daysago=365)
-            return self._send_request(account.institution.ofx_url, self.request_msg)
-        except Error as detail:
-            try:
-                # If that didn't work, try 90 days back.
-                self.request_msg = request.bank_stmt(account, username, password, daysago=90)
-                return self._send_request(account.institution.ofx_url, self.request_msg)
-            except Error as detail:
-                # If that also didn't work, try 30 days back, which has been our default and
-                # which always seems to work across all OFX servers.
-                self.request_msg = request.bank_stmt(account, username, password, daysago=30)
-                return self._send_request(account.institution.ofx_url, self.request_msg)
+        return self._fetch_statement(account,
+            lambda days, end: Request().bank_stmt(account, username, password,
+                                                  daysago=days, daysend=end))
 
     def get_creditcard_statement(self, account, username, password):
         """Sends an OFX request for the given user's credit card
@@ -88,19 +138,59 @@ class Client:
         successful.  If the OFX server returns an error, the client
         will throw an OfxException indicating the error code and
         message."""
-        # See comments in get_bank_statement, above, which explain these try/catch
-        # blocks.
-        request = Request()
-        try:
-            self.request_msg = request.creditcard_stmt(account, username, password, daysago=365)
-            return self._send_request(account.institution.ofx_url, self.request_msg)
-        except Error as detail:
+        return self._fetch_statement(account,
+            lambda days, end: Request().creditcard_stmt(account, username, password,
+                                                        daysago=days, daysend=end))
+
+    def _statement_windows(self, url):
+        """The date ranges to try for a statement from 'url', longest
+        first, skipping any longer than the longest that has worked."""
+        longest = self.window_memory.get(url)
+        if longest is None:
+            return list(self.statement_windows)
+        return [days for days in self.statement_windows if days <= longest] \
+            or [self.statement_windows[-1]]
+
+    def _date_ranges(self, days):
+        """Splits the last 'days' days into (daysago, daysend) request
+        ranges of at most split_days each, newest first.  The newest range
+        has no end date, so it runs through today."""
+        if not self.split_days or days <= self.split_days:
+            return [(days, None)]
+        ranges = []
+        end = 0
+        while end < days:
+            start = min(end + self.split_days, days)
+            ranges.append((start, end or None))
+            end = start
+        return ranges
+
+    def _fetch_statement(self, account, make_request):
+        url = account.institution.ofx_url
+        windows = self._statement_windows(url)
+        for days in windows:
             try:
-                self.request_msg = request.creditcard_stmt(account, username, password, daysago=90)
-                return self._send_request(account.institution.ofx_url, self.request_msg)
-            except Error as detail:
-                self.request_msg = request.creditcard_stmt(account, username, password, daysago=30)
-                return self._send_request(account.institution.ofx_url, self.request_msg)
+                response = self._fetch_window(url, make_request, days)
+            except Error:
+                if days == windows[-1]:
+                    raise
+                log.debug("%s rejected a %d-day statement request.", url, days)
+                continue
+            self.window_memory[url] = days
+            return response
+
+    def _fetch_window(self, url, make_request, days):
+        ranges = self._date_ranges(days)
+        if len(ranges) == 1:
+            self.request_msg = make_request(days, None)
+            return self._send_request(url, self.request_msg)
+
+        messages = [make_request(start, end) for (start, end) in ranges]
+        self.request_msg = messages[0]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(messages))) as pool:
+            responses = list(pool.map(lambda message: self._send_request(url, message),
+                                      messages))
+        return self._check_response(merge_statements(responses))
 
     def get_closing(self, account, username, password):
         # FIXME: Make sure this list only exists in one place and isn't duplicated here.
@@ -140,43 +230,60 @@ class Client:
     def _send_request(self, url, request_body):
         """Transmits the message to the server and checks the response
         for error status."""
+        if self.cache is None:
+            return self._check_response(self._post(url, request_body))
+
+        key = self.cache.key(url, request_body)
+        response = self.cache.get(key)
+        if response is None:
+            response = self._check_response(self._post(url, request_body))
+            self.cache.put(key, response)
+        return response
 
+    def _post(self, url, request_body):
+        """Transmits the message to the server and returns the raw
+        response body."""
         request = urllib.request.Request(url, request_body.encode('utf-8'),
                                   { "Content-type": "application/x-ofx",
                                     "Accept": "*/*, application/x-ofx" })
         stream = urllib.request.urlopen(request)
         response = stream.read()
         stream.close()
+        return response
 
-        response = Response(response)
-        response.check_signon_status()
+    def _check_response(self, response):
+        """Raises an ofx.Error if the signon or transaction status of a raw
+        server response reports a failure; otherwise returns the response
+        as a Response, which is parsed when first used.  The status blocks
+        are read straight from the text, so failed requests are never
+        parsed at all."""
+        response = Response(response, lazy=True)
+        text = response.as_string()
 
-        parsed_ofx = response.as_dict()
+        signon_status = scan_status(text, "SONRS")
+        if signon_status is None:
+            # Not something the scanner understands; let the parser have
+            # its say.
+            response.check_signon_status()
+        else:
+            self._check_status(signon_status, "signon")
 
         # FIXME: This needs to account for statement closing responses.
 
-        if "BANKMSGSRSV1" in parsed_ofx:
-            bank_status = \
-                parsed_ofx["BANKMSGSRSV1"]["STMTTRNRS"]["STATUS"]
-            self._check_status(bank_status, "bank statement")
-
-        elif "CREDITCARDMSGSRSV1" in parsed_ofx:
-            creditcard_status = \
-                parsed_ofx["CREDITCARDMSGSRSV1"]["CCSTMTTRNRS"]["STATUS"]
-            self._check_status(creditcard_status, "credit card statement")
-
-        elif "SIGNUPMSGSRSV1" in parsed_ofx:
-            acctinfo_status = \
-                parsed_ofx["SIGNUPMSGSRSV1"]["ACCTINFOTRNRS"]["STATUS"]
-            self._check_status(acctinfo_status, "account information")
+        for (tag, description) in (("STMTTRNRS",     "bank statement"),
+                                   ("CCSTMTTRNRS",   "credit card statement"),
+                                   ("ACCTINFOTRNRS", "account information")):
+            status = scan_status(text, tag)
+            if status is not None:
+                self._check_status(status, description)
+                break
 
         return response
 
-    def _check_status(self, status_block, description):
-        # Convert the PyParsing result object into a dictionary so we can
+    def _check_status(self, status, description):
+        # 'status' is a dictionary from ofx.status.scan_status, so we can
         # provide default values if the status values don't exist in the
         # response.
-        status = status_block.asDict()
 
         # There is no OFX status code "-1," so I'm using that code as a
         # marker for "No status code was returned."
@@ -184,7 +291,7 @@ class Client:
 
         # Code "0" is "Success"; code "1" is "data is up-to-date."  Anything
         # else represents an error.
-        if code is not "0" and code is not "1":
+        if code != "0" and code != "1":
             # Try to find information about the error.  If the bank didn't
             # provide status information, return the value "NONE," which
             # should be both clear to a user and a marker of a lack of
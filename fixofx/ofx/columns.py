@@ -0,0 +1,214 @@
+#coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+#  ofx.columns - flat transaction rows, written as NDJSON, CSV, Arrow or Parquet.
+#
+
+import csv
+import datetime
+import json
+import xml.etree.ElementTree as ElementTree
+import xml.sax.saxutils as sax
+from decimal import Decimal, InvalidOperation
+
+# One row per transaction, with the values the OFX 2.0 output would have
+# (dates as YYYYMMDD, amounts as decimal strings, text unescaped), or None
+# where the output would leave the element out.
+COLUMNS = ("fitid", "date", "amount", "type", "payee", "memo", "checknum",
+           "bankid", "acctid", "accttype")
+
+FORMATS = ("ndjson", "csv", "arrow", "parquet")
+
+# The STMTTRN elements each column comes from.
+_elements = { "FITID"    : "fitid",
+              "DTPOSTED" : "date",
+              "TRNAMT"   : "amount",
+              "TRNTYPE"  : "type",
+              "NAME"     : "payee",
+              "MEMO"     : "memo",
+              "CHECKNUM" : "checknum" }
+
+
+def _value(text):
+    if text is None:
+        return None
+    text = sax.unescape(text.strip())
+    if text == "":
+        return None
+    return text
+
+
+def make_row(fitid=None, date=None, amount=None, type=None, payee=None,
+             memo=None, checknum=None, bankid=None, acctid=None, accttype=None):
+    """Returns a row dict for one transaction, cleaning up each value as
+    the OFX 2.0 output would."""
+    return { "fitid"    : _value(fitid),
+             "date"     : _value(date),
+             "amount"   : _value(amount),
+             "type"     : _value(type),
+             "payee"    : _value(payee),
+             "memo"     : _value(memo),
+             "checknum" : _value(checknum),
+             "bankid"   : _value(bankid),
+             "acctid"   : _value(acctid),
+             "accttype" : _value(accttype) }
+
+
+def statement_rows(statement):
+    """Yields the rows of an ofx.Statement."""
+    account = statement.get_account()
+    if "STMTRS" in statement.parse_dict:
+        stmt = statement.parse_dict["STMTRS"]
+    else:
+        stmt = statement.parse_dict["CCSTMTRS"]
+    for item in stmt["BANKTRANLIST"]:
+        if item[0] != "STMTTRN":
+            continue
+        txn = item.asDict()
+        yield make_row(bankid=account.aba_number, acctid=account.acct_number,
+                       accttype=account.acct_type,
+                       **dict((column, txn.get(element))
+                              for (element, column) in _elements.items()))
+
+
+def xml_rows(xml):
+    """Yields the rows of an OFX 2 (XML) document."""
+    root = ElementTree.fromstring(xml)
+    for stmtrs in root.iter():
+        if stmtrs.tag not in ("STMTRS", "CCSTMTRS"):
+            continue
+        account = stmtrs.find("BANKACCTFROM")
+        if account is None:
+            account = stmtrs.find("CCACCTFROM")
+        account_values = {}
+        if account is not None:
+            account_values = { "bankid"   : account.findtext("BANKID"),
+                               "acctid"   : account.findtext("ACCTID"),
+                               "accttype" : account.findtext("ACCTTYPE") }
+            if stmtrs.tag == "CCSTMTRS":
+                account_values["accttype"] = "CREDITCARD"
+        for txn in stmtrs.iter("STMTTRN"):
+            values = dict((column, txn.findtext(element))
+                          for (element, column) in _elements.items())
+            values.update(account_values)
+            yield make_row(**values)
+
+
+def write_ndjson(rows, output):
+    """Writes 'rows' to the text file 'output' as newline-delimited JSON,
+    and returns the number of rows."""
+    count = 0
+    for row in rows:
+        output.write(json.dumps(row))
+        output.write("\n")
+        count += 1
+    return count
+
+
+def write_csv(rows, output):
+    """Writes 'rows' to the text file 'output' (opened with newline="")
+    as CSV with a header line, and returns the number of rows.  Missing
+    values are empty."""
+    writer = csv.DictWriter(output, COLUMNS)
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def _pyarrow():
+    # pyarrow is optional, and slow to import, so it's only imported for
+    # Arrow and Parquet output.
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Arrow and Parquet output need pyarrow; "
+                          "use ndjson or csv instead.")
+    return pyarrow
+
+
+def _arrow_date(value):
+    try:
+        return datetime.date(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+    except (TypeError, ValueError):
+        return None
+
+
+def _arrow_amount(value):
+    try:
+        return Decimal(value)
+    except (TypeError, InvalidOperation):
+        return None
+
+
+def to_arrow(rows):
+    """Returns 'rows' as a pyarrow Table, with dates as date32 (the time
+    of day, if any, is dropped) and amounts as decimal128(38, 9)."""
+    pyarrow = _pyarrow()
+    rows = list(rows)
+    arrays = []
+    fields = []
+    for column in COLUMNS:
+        values = [row[column] for row in rows]
+        if column == "date":
+            arrow_type = pyarrow.date32()
+            values = [_arrow_date(value) for value in values]
+        elif column == "amount":
+            arrow_type = pyarrow.decimal128(38, 9)
+            values = [_arrow_amount(value) for value in values]
+        else:
+            arrow_type = pyarrow.string()
+        arrays.append(pyarrow.array(values, type=arrow_type))
+        fields.append(pyarrow.field(column, arrow_type))
+    return pyarrow.Table.from_arrays(arrays, schema=pyarrow.schema(fields))
+
+
+def write_arrow(rows, output):
+    """Writes 'rows' to the binary file 'output' as an Arrow IPC stream,
+    and returns the number of rows."""
+    table = to_arrow(rows)
+    pyarrow = _pyarrow()
+    with pyarrow.ipc.new_stream(output, table.schema) as writer:
+        writer.write_table(table)
+    return table.num_rows
+
+
+def write_parquet(rows, output):
+    """Writes 'rows' to the binary file 'output' as Parquet, and returns
+    the number of rows."""
+    table = to_arrow(rows)
+    pyarrow = _pyarrow()
+    buffer = pyarrow.BufferOutputStream()
+    pyarrow.parquet.write_table(table, buffer)
+    output.write(buffer.getvalue().to_pybytes())
+    return table.num_rows
+
+
+def write_rows(rows, output, format="ndjson"):
+    """Writes 'rows' to 'output' in 'format' (one of FORMATS), and returns
+    the number of rows.  'output' is a text file for ndjson and csv, and
+    a binary file for arrow and parquet."""
+    if format == "ndjson":
+        return write_ndjson(rows, output)
+    elif format == "csv":
+        return write_csv(rows, output)
+    elif format == "arrow":
+        return write_arrow(rows, output)
+    elif format == "parquet":
+        return write_parquet(rows, output)
+    raise ValueError("Unknown row format '%s'." % format)
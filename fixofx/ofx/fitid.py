@@ -0,0 +1,70 @@
+#coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+#  ofx.fitid - synthetic transaction IDs for formats that have none.
+#
+
+import hashlib
+import re
+from decimal import Decimal, InvalidOperation
+
+# The ways a converter can make up FITIDs.  "position" is the original
+# org-accttype-date-index-amount, where the index is the transaction's
+# place among those of its date; "content" is a hash of what the
+# transaction says, which stays the same when a bank reorders a day's
+# transactions or a download starts or ends on a different day.
+FITID_STRATEGIES = ("position", "content")
+
+_space_re = re.compile(r"\s+")
+
+
+def check_strategy(fitids):
+    if fitids not in FITID_STRATEGIES:
+        raise ValueError("Unknown FITID strategy '%s'; use one of %s." %
+                         (fitids, ", ".join(FITID_STRATEGIES)))
+    return fitids
+
+
+def _amount(amount):
+    # "5", "5.00" and "+5.0" are the same amount.
+    try:
+        return format(Decimal(amount.strip()).normalize(), "f")
+    except (AttributeError, InvalidOperation):
+        return amount or ""
+
+
+def _text(text):
+    if text is None:
+        return ""
+    return _space_re.sub(" ", text).strip().upper()
+
+
+class ContentIds:
+    """Makes content FITIDs for one statement: a hash of a transaction's
+    date, amount, payee, memo and check number, normalized so that
+    formatting differences don't count, then a dash and the number of
+    times the same content has turned up so far in the statement.  Feed
+    it the transactions in file order as they are cleaned; identical
+    transactions (two equal coffees on one day) get -1, -2 and so on."""
+
+    def __init__(self):
+        self.counts = {}
+
+    def make(self, date, amount, payee=None, memo=None, number=None):
+        content = "\x1f".join((_text(date)[:8], _amount(amount), _text(payee),
+                               _text(memo), _text(number)))
+        occurrence = self.counts.get(content, 0) + 1
+        self.counts[content] = occurrence
+        digest = hashlib.blake2b(content.encode("utf-8"), digest_size=12).hexdigest()
+        return "%s-%d" % (digest, occurrence)
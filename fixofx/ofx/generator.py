@@ -21,12 +21,14 @@ from datetime import date
 import uuid
 
 from fixofx.ofx.builder import *
+from fixofx.ofx.fitid import ContentIds, check_strategy
 
 
 class Generator:
     def __init__(self, fid="UNKNOWN", org="UNKNOWN", bankid="UNKNOWN",
                  accttype="UNKNOWN", acctid="UNKNOWN", availbal="0.00",
-                 ledgerbal="0.00", stmtdate=None, curdef="USD", lang="ENG"):
+                 ledgerbal="0.00", stmtdate=None, curdef="USD", lang="ENG",
+                 fitids="position"):
         self.fid       = fid
         self.org       = org
         self.bankid    = bankid
@@ -37,10 +39,14 @@ class Generator:
         self.stmtdate  = stmtdate
         self.curdef    = curdef
         self.lang      = lang
+        self.fitids    = check_strategy(fitids)
         self.txns_by_date = {}
+        self.content_ids  = ContentIds()
 
     def add_transaction(self, date=None, amount=None, number=None,
                         txid=None, type=None, payee=None, memo=None):
+        if txid is None and self.fitids == "content":
+            txid = self.content_ids.make(date, amount, payee, memo, number)
         txn = Transaction(date=date, amount=amount, number=number,
                               txid=txid, type=type, payee=payee, memo=memo)
         txn_date_list = self.txns_by_date.get(txn.date, [])
@@ -150,10 +156,12 @@ class Generator:
                 txn_amt  = txn.amount
 
                 # Make a synthetic transaction ID using as many
-                # uniqueness guarantors as possible.
-                txn.txid = "%s-%s-%s-%s-%s" % (self.org, self.accttype,
-                                                txn_date, txn_index,
-                                                txn_amt)
+                # uniqueness guarantors as possible.  (Content IDs were
+                # made as the transactions were added.)
+                if self.fitids == "position":
+                    txn.txid = "%s-%s-%s-%s-%s" % (self.org, self.accttype,
+                                                    txn_date, txn_index,
+                                                    txn_amt)
                 txns += txn.to_ofx()
                 txn_index -= 1
 
@@ -0,0 +1,128 @@
+#coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+#  ofx.instrument - stage timing hooks for the conversion pipeline.
+#
+
+import logging
+from time import perf_counter
+
+
+class Instrument:
+    """Receives start/stop events for each stage of a conversion (file
+    typing, text cleanup, parsing, date guessing, transaction cleanup,
+    OFX generation, and so on).  Subclass this and override the event
+    methods, then pass an instance as the 'instrument' argument of the
+    converters, Response, or the ofxfix.py convert() function.  When no
+    instrument is given, the stages cost nothing more than a function
+    call."""
+
+    def stage_started(self, stage):
+        pass
+
+    def stage_finished(self, stage, elapsed, count=None):
+        """Called when a stage ends, whether or not it succeeded.  'elapsed'
+        is in seconds; 'count' is the number of items the stage handled
+        (transactions, or characters for text cleanup stages), or None if
+        the stage doesn't report one."""
+        pass
+
+
+class Stage:
+    """Context manager that reports one stage to an Instrument.  Set
+    'count' inside the block to report the number of items handled."""
+    __slots__ = ("instrument", "name", "count", "started")
+
+    def __init__(self, instrument, name):
+        self.instrument = instrument
+        self.name       = name
+        self.count      = None
+        self.started    = None
+
+    def __enter__(self):
+        self.instrument.stage_started(self.name)
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.instrument.stage_finished(self.name,
+                                       perf_counter() - self.started,
+                                       self.count)
+        return False
+
+
+class _NullStage:
+    """Stand-in for Stage when no instrument is attached.  A single shared
+    instance is used, and anything assigned to it is thrown away."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+_null_stage = _NullStage()
+
+
+def stage(instrument, name):
+    """Returns a context manager timing the stage 'name' against
+    'instrument', or a shared do-nothing one if 'instrument' is None."""
+    if instrument is None:
+        return _null_stage
+    return Stage(instrument, name)
+
+
+class TimingLog(Instrument):
+    """Instrument that collects the stages of one conversion and writes a
+    timing breakdown to a logger.  Call log() once the file is done; the
+    collected stages are then cleared so the same instance can be reused
+    for the next file."""
+
+    def __init__(self, logger=None, level=logging.INFO):
+        if logger is None:
+            logger = logging.getLogger("fixofx.timing")
+        self.logger = logger
+        self.level  = level
+        self.stages = []
+
+    def stage_finished(self, stage, elapsed, count=None):
+        self.stages.append((stage, elapsed, count))
+
+    def total(self):
+        return sum(elapsed for (stage, elapsed, count) in self.stages)
+
+    def breakdown(self):
+        total = self.total()
+        lines = []
+        for (stage, elapsed, count) in self.stages:
+            if total > 0:
+                share = elapsed / total * 100
+            else:
+                share = 0.0
+            line = "  %-16s %9.2f ms %5.1f%%" % (stage, elapsed * 1000, share)
+            if count is not None:
+                line += "  (%d items)" % count
+            lines.append(line)
+        lines.append("  %-16s %9.2f ms" % ("total", total * 1000))
+        return "\n".join(lines)
+
+    def log(self, label="conversion"):
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, "Timing for %s:\n%s", label,
+                            self.breakdown())
+        self.stages = []
@@ -19,25 +19,20 @@
 #
 
 import re
-import sys
 
 from pyparsing import (alphanums, alphas, CharsNotIn, Dict, Forward, Group,
-                       Literal, OneOrMore, Optional, White, Word, ZeroOrMore)
+                       Literal, OneOrMore, Optional, ParseException, White,
+                       Word, ZeroOrMore)
 
+from fixofx.ofx.instrument import stage
+from fixofx.ofx.trace import parse_failure
 from fixofx.ofxtools.util import strip_empty_tags
 
+# See strip_close_tags().  As in ofxtools.util.strip_empty_tags, tag names
+# exclude '<' so that the search stays linear on junk input.
+_close_tag_re = re.compile(r'<(?P<tag>[^<>]+)>\s*(?P<value>[^<\n\r]+)'
+                           r'(?:\s*</(?P=tag)>)?(?P<lineend>[\n\r]*)')
 
-def _ofxStartDebugAction( instring, loc, expr ):
-    sys.stderr.write("Match %s at loc %s (%d,%d)" %
-                    (expr, loc,
-                    instring.count("\n", 0, loc) + 1,
-                    loc - instring.rfind("\n", 0, loc)))
-
-def _ofxSuccessDebugAction( instring, startloc, endloc, expr, toks ):
-    sys.stderr.write("Matched %s -> %s" % (expr, str(toks.asList())))
-
-def _ofxExceptionDebugAction( instring, loc, expr, exc ):
-    sys.stderr.write("Exception raised: %s" % exc)
 
 class Parser:
     """Dirt-simple OFX parser for interpreting server results (primarily for
@@ -59,9 +54,9 @@ class Parser:
         body = Group(aggregate).setResultsName("body")
 
         # The parser as a whole
+        self.body = body
         self.parser = headers + body
-        if (debug):
-            self.parser.setDebugActions(_ofxStartDebugAction, _ofxSuccessDebugAction, _ofxExceptionDebugAction)
+        self.debug = debug
 
     def _tag(self, closed=True):
         """Generate parser definitions for OFX tags."""
@@ -73,19 +68,17 @@ class Parser:
         else:
             return openTag
 
-    def parse(self, ofx):
+    def parse(self, ofx, instrument=None):
         """Parse a string argument and return a tree structure representing
         the parsed document."""
-        if(isinstance(ofx, bytes)):
-            ofx = ofx.decode('utf-8')
-
-        ofx = strip_empty_tags(ofx)
-        ofx = self.strip_close_tags(ofx)
-        ofx = self.strip_blank_dtasof(ofx)
-        ofx = self.strip_junk_ascii(ofx)
-        ofx = self.fix_unknown_account_type(ofx)
+        ofx = self._clean(ofx, instrument)
 
-        parsed = self.parser.parseString(ofx).asDict()
+        with stage(instrument, "ofx_parse"):
+            try:
+                parsed = self.parser.parseString(ofx).asDict()
+            except ParseException as exc:
+                parse_failure("OFX", ofx, exc, force=self.debug)
+                raise
 
         def add_on_presence(k):
             if k in parsed["body"]["OFX"][0]:
@@ -101,13 +94,38 @@ class Parser:
 
         return parsed
 
+    def parse_body(self, ofx, instrument=None):
+        """Parse an <OFX> aggregate with no headers in front of it, such as
+        one message set cut out of a larger document, and return the
+        tree that parse() would return under "body"."""
+        ofx = self._clean(ofx, instrument)
+
+        with stage(instrument, "ofx_parse"):
+            try:
+                return self.body.parseString(ofx).asDict()["body"]
+            except ParseException as exc:
+                parse_failure("OFX", ofx, exc, force=self.debug)
+                raise
+
+    def _clean(self, ofx, instrument=None):
+        if(isinstance(ofx, bytes)):
+            ofx = ofx.decode('utf-8')
+
+        with stage(instrument, "ofx_cleanup") as timer:
+            timer.count = len(ofx)
+            ofx = strip_empty_tags(ofx)
+            ofx = self.strip_close_tags(ofx)
+            ofx = self.strip_blank_dtasof(ofx)
+            ofx = self.strip_junk_ascii(ofx)
+            ofx = self.fix_unknown_account_type(ofx)
+        return ofx
+
     def strip_close_tags(self, ofx):
         """Strips close tags on non-aggregate nodes.  Close tags seem to be
         valid OFX/1.x, but they screw up our parser definition and are optional.
         This allows me to keep using the same parser without having to re-write
         it from scratch just yet."""
-        strip_search = '<(?P<tag>[^>]+)>\s*(?P<value>[^<\n\r]+)(?:\s*</(?P=tag)>)?(?P<lineend>[\n\r]*)'
-        return re.sub(strip_search, '<\g<tag>>\g<value>\g<lineend>', ofx)
+        return _close_tag_re.sub('<\g<tag>>\g<value>\g<lineend>', ofx)
 
     def strip_blank_dtasof(self, ofx):
         """Strips empty dtasof tags from wells fargo/wachovia downloads.  Again, it would
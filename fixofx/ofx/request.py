@@ -39,6 +39,12 @@ class Request:
         else:
             return date.strftime("%Y%m%d")
 
+    def _dt_end(self, daysend):
+        if daysend is None:
+            return ""
+        dt_end = datetime.datetime.now() - datetime.timedelta(days=daysend)
+        return DTEND(self._format_date(date=dt_end))
+
     def _message(self, institution, username, password, body):
         """Composes a complete OFX message document."""
         return DOCUMENT(self._header(),
@@ -92,8 +98,11 @@ class Request:
                     ACCTINFORQ(
                         DTACCTUP("19980101")))))
 
-    def bank_stmt(self, account, username, password, daysago=90):
-        """Returns a complete OFX bank statement request document."""
+    def bank_stmt(self, account, username, password, daysago=90,
+                  daysend=None):
+        """Returns a complete OFX bank statement request document.  The
+        statement starts 'daysago' days back and, if 'daysend' is given,
+        ends 'daysend' days back instead of today."""
         dt_start = datetime.datetime.now() - datetime.timedelta(days=daysago)
         return self._message(account.institution, username, password,
             BANKMSGSRQV1(
@@ -107,6 +116,7 @@ class Request:
                             ACCTTYPE(account.get_ofx_accttype())),
                         INCTRAN(
                             DTSTART(self._format_date(date=dt_start)),
+                            self._dt_end(daysend),
                             INCLUDE("Y"))))))
 
     def bank_closing(self, account, username, password):
@@ -122,8 +132,11 @@ class Request:
                             ACCTID(account.acct_number),
                             ACCTTYPE(account.get_ofx_accttype()))))))
 
-    def creditcard_stmt(self, account, username, password, daysago=90):
-        """Returns a complete OFX credit card statement request document."""
+    def creditcard_stmt(self, account, username, password, daysago=90,
+                        daysend=None):
+        """Returns a complete OFX credit card statement request document.  The
+        statement starts 'daysago' days back and, if 'daysend' is given,
+        ends 'daysend' days back instead of today."""
         dt_start = datetime.datetime.now() - datetime.timedelta(days=daysago)
         return self._message(account.institution, username, password,
             CREDITCARDMSGSRQV1(
@@ -135,6 +148,7 @@ class Request:
                             ACCTID(account.acct_number)),
                         INCTRAN(
                             DTSTART(self._format_date(date=dt_start)),
+                            self._dt_end(daysend),
                             INCLUDE("Y"))))))
 
     def creditcard_closing(self, account, username, password):
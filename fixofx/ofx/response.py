@@ -16,11 +16,80 @@
 #
 #  ofx.response - access to contents of an OFX response document.
 #
+import pickle
+import re
+
 from fixofx.ofx import Document, Parser, Account, Error
+from fixofx.ofx.instrument import stage
+from fixofx.ofx.results import dumps
+
+_header_re = re.compile(r"^\s*ENCODING:[ \t]*([^\r\n]*)", re.MULTILINE)
+
+
+# Message sets whose children are statements (see get_statements).
+_statement_sets = ("BANKMSGSRSV1", "CREDITCARDMSGSRSV1")
+
+
+def _child_aggregates(text, start, end):
+    """Returns (tag, start, end) for each aggregate directly inside
+    text[start:end], which should be the contents of an aggregate, stopping
+    at the first close tag of that enclosing aggregate.  Returns None if
+    the contents don't cut up cleanly (an unclosed child, or a child that
+    isn't an aggregate)."""
+    children = []
+    pos = start
+    while True:
+        begin = text.find("<", pos, end)
+        if begin == -1:
+            return children
+        close = text.find(">", begin, end)
+        if close == -1:
+            return None
+        tag = text[begin + 1:close]
+        if tag.startswith("/"):
+            return children
+        finish = text.find("</%s>" % tag, close, end)
+        if finish == -1:
+            return None
+        finish += len(tag) + 3
+        children.append((tag, begin, finish))
+        pos = finish
+
+
+def _parse_statement(parser, tag, block, instrument=None):
+    """Parses the raw text of one statement (a STMTTRNRS or CCSTMTTRNRS
+    aggregate) from message set 'tag', returning the parse result that a
+    full parse would have for it."""
+    fragment = "<OFX>\n<%s>\n%s\n</%s>\n</OFX>" % (tag, block, tag)
+    body = parser.parse_body(fragment, instrument=instrument)
+    return body["OFX"][0].asDict()[tag][0]
+
+
+# Each worker process builds its Parser once.
+_worker_parser = None
+
+
+def _parse_statement_in_worker(tag, block, debug):
+    global _worker_parser
+    if _worker_parser is None:
+        _worker_parser = Parser(debug)
+    return dumps(_parse_statement(_worker_parser, tag, block))
 
 
 class Response(Document):
-    def __init__(self, response, debug=False):
+    def __init__(self, response, debug=False, instrument=None, lazy=False,
+                 parser=None):
+        """Reads an OFX response document, parsing it all now and raising
+        any ParseException from the constructor.  With lazy=True, parsing
+        waits until something needs it, and then covers as little as it
+        can: the top-level message sets (SIGNONMSGSRSV1, BANKMSGSRSV1, and
+        so on) are indexed by position, and check_signon_status() parses
+        only the signon message set, get_statements() only the statements
+        it reaches, and get_accounts() only the signup message set.
+        as_dict(), as_xml() and parse_dict parse the whole document.  A
+        lazy Response raises a ParseException from whichever of these
+        first reaches the bad part.  Pass an ofx.Parser as 'parser' to
+        reuse it rather than building a new one."""
         # Bank of America (California) seems to be putting out bad Content-type
         # headers on manual OFX download.  I'm special-casing this out since
         # B of A is such a large bank.
@@ -40,9 +109,77 @@ class Response(Document):
         # FIs are causing it, though.
         self.raw_response = self.raw_response.replace('****OFX download terminated due to exception: Null or zero length FITID****', '')
 
-        parser = Parser(debug)
-        self.parse_dict = parser.parse(self.raw_response)
-        self.ofx = self.parse_dict["body"]["OFX"][0].asDict()
+        self.debug      = debug
+        self.instrument = instrument
+        self._parser    = parser
+        self._reset()
+        if not lazy:
+            self._parse()
+
+    def _reset(self, parse_dict=None):
+        self._parse_dict = parse_dict
+        self._ofx        = None
+        self._sections   = {}
+        self._index      = None
+        if parse_dict is not None:
+            self._ofx = parse_dict["body"]["OFX"][0].asDict()
+
+    def _get_parser(self):
+        if self._parser is None:
+            self._parser = Parser(self.debug)
+        return self._parser
+
+    def _parse(self):
+        parse_dict = self._get_parser().parse(self.raw_response,
+                                              instrument=self.instrument)
+        self._reset(parse_dict)
+
+    @property
+    def parse_dict(self):
+        if self._parse_dict is None:
+            self._parse()
+        return self._parse_dict
+
+    @property
+    def ofx(self):
+        if self._ofx is None:
+            self._parse()
+        return self._ofx
+
+    def _message_set_index(self):
+        """Returns (tag, start, end) for each top-level message set in the
+        raw response, or None if the body can't be cut up that way."""
+        if self._index is None:
+            start = self.raw_response.find("<OFX>")
+            if start == -1:
+                self._index = (None,)
+            else:
+                self._index = (_child_aggregates(self.raw_response, start + 5,
+                                                 len(self.raw_response)),)
+        return self._index[0]
+
+    def _parse_fragment(self, fragment):
+        body = self._get_parser().parse_body("<OFX>\n" + fragment + "\n</OFX>",
+                                             instrument=self.instrument)
+        return body["OFX"][0].asDict()
+
+    def _message_set(self, tag):
+        """Returns the message set 'tag' as as_dict()[tag] would, or None if
+        the response has none, parsing only that message set if it can."""
+        if self._ofx is not None:
+            return self._ofx.get(tag)
+
+        if tag not in self._sections:
+            message_sets = self._message_set_index()
+            if message_sets is None:
+                return self.ofx.get(tag)
+            self._sections[tag] = None
+            for (name, start, end) in message_sets:
+                if name == tag:
+                    fragment = self.raw_response[start:end]
+                    self._sections[tag] = self._parse_fragment(fragment)[tag]
+                    break
+        return self._sections[tag]
 
     def as_dict(self):
         return self.ofx
@@ -51,38 +188,102 @@ class Response(Document):
         return self.raw_response
 
     def get_encoding(self):
-        return self.parse_dict["header"]["ENCODING"]
-
-    def get_statements(self):
+        header = _header_re.search(self.raw_response, 0, max(self.raw_response.find("<OFX>"), 0))
+        if header is None:
+            return self.parse_dict["header"]["ENCODING"]
+        return header.group(1)
+
+    def get_statements(self, workers=None):
+        """Returns the statements in the response, in document order.  Given
+        a number of 'workers', statements that haven't been parsed yet are
+        parsed in that many worker processes -- worth it for downloads with
+        many accounts in them, not for one or two."""
         # This allows us to parse out all statements from an OFX file
         # that contains multiple statements.
 
         # FIXME: I'm not positive this is legitimate.  Are there tagsets
         # a bank might use inside a bank or creditcard response *other*
         # than statements?  I bet there are.
-        statements = []
-        for tag in list(self.ofx.keys()):
-            if tag == "BANKMSGSRSV1" or tag == "CREDITCARDMSGSRSV1":
-                for sub_tag in self.ofx[tag]:
-                    statements.append(Statement(sub_tag))
+        if not workers or workers < 2:
+            return list(self.iter_statements())
+
+        sources = list(self._statement_sources())
+        blocks = [source for source in sources if isinstance(source, tuple)]
+        if len(blocks) < 2:
+            return [self._statement(source) for source in sources]
+
+        # Imported here since it's slow to import and rarely needed.
+        from concurrent.futures import ProcessPoolExecutor
+        with stage(self.instrument, "ofx_parse") as timer:
+            timer.count = len(blocks)
+            with ProcessPoolExecutor(min(workers, len(blocks))) as executor:
+                parsed = executor.map(_parse_statement_in_worker,
+                                      [tag for (tag, block) in blocks],
+                                      [block for (tag, block) in blocks],
+                                      [self.debug] * len(blocks))
+                statements = []
+                for source in sources:
+                    if isinstance(source, tuple):
+                        source = pickle.loads(next(parsed))
+                    statements.append(Statement(source))
         return statements
 
+    def iter_statements(self):
+        """Yields the statements of get_statements() one at a time.  When
+        the response hasn't been parsed yet, each statement is cut out of
+        the raw text and parsed only as it is reached."""
+        for source in self._statement_sources():
+            yield self._statement(source)
+
+    def _statement(self, source):
+        if isinstance(source, tuple):
+            (tag, block) = source
+            source = _parse_statement(self._get_parser(), tag, block,
+                                      instrument=self.instrument)
+        return Statement(source)
+
+    def _statement_sources(self):
+        """Yields each statement in document order, either as its parse
+        result or, if it hasn't been parsed, as (message set tag, raw
+        text of the statement) for _parse_statement()."""
+        message_sets = self._message_set_index()
+        if self._ofx is not None or message_sets is None:
+            for tag in list(self.ofx.keys()):
+                if tag in _statement_sets:
+                    for sub_tag in self.ofx[tag]:
+                        yield sub_tag
+            return
+
+        text = self.raw_response
+        for (tag, start, end) in message_sets:
+            if tag not in _statement_sets:
+                continue
+            blocks = None
+            if tag not in self._sections:
+                blocks = _child_aggregates(text, start + len(tag) + 2, end)
+            if blocks is None:
+                for sub_tag in self._message_set(tag):
+                    yield sub_tag
+                continue
+            for (name, block_start, block_end) in blocks:
+                yield (tag, text[block_start:block_end])
+
     def get_accounts(self):
         accounts = []
-        for tag in list(self.ofx.keys()):
-            if tag == "SIGNUPMSGSRSV1":
-                signup = self.ofx[tag].asDict()
-                for signup_tag in signup:
-                    if signup_tag == "ACCTINFOTRNRS":
-                        accttrns = signup[signup_tag].asDict()
-                        for accttrns_tag in accttrns:
-                            if accttrns_tag == "ACCTINFORS":
-                                acctrs = accttrns[accttrns_tag]
-                                for acct in acctrs:
-                                    if acct[0] == "ACCTINFO":
-                                        account = self._extract_account(acct)
-                                        if account is not None:
-                                            accounts.append(account)
+        signup = self._message_set("SIGNUPMSGSRSV1")
+        if signup is not None:
+            signup = signup.asDict()
+            for signup_tag in signup:
+                if signup_tag == "ACCTINFOTRNRS":
+                    accttrns = signup[signup_tag].asDict()
+                    for accttrns_tag in accttrns:
+                        if accttrns_tag == "ACCTINFORS":
+                            acctrs = accttrns[accttrns_tag]
+                            for acct in acctrs:
+                                if acct[0] == "ACCTINFO":
+                                    account = self._extract_account(acct)
+                                    if account is not None:
+                                        accounts.append(account)
         return accounts
 
     def _extract_account(self, acct_block):
@@ -107,7 +308,10 @@ class Response(Document):
             return None
 
     def check_signon_status(self):
-        status = self.ofx["SIGNONMSGSRSV1"]["SONRS"]["STATUS"]
+        signon = self._message_set("SIGNONMSGSRSV1")
+        if signon is None:
+            raise KeyError("SIGNONMSGSRSV1")
+        status = signon["SONRS"]["STATUS"]
         # This will throw an ofx.Error if the signon did not succeed.
         self._check_status(status, "signon")
         # If no exception was thrown, the signon succeeded.
@@ -125,7 +329,7 @@ class Response(Document):
 
         # Code "0" is "Success"; code "1" is "data is up-to-date."  Anything
         # else represents an error.
-        if code is not "0" and code is not "1":
+        if code != "0" and code != "1":
             # Try to find information about the error.  If the bank didn't
             # provide status information, return the value "NONE," which
             # should be both clear to a user and a marker of a lack of
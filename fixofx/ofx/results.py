@@ -0,0 +1,49 @@
+#coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+#  ofx.results - pickling of pyparsing parse results.
+#
+
+import copyreg
+import io
+import pickle
+
+from pyparsing import ParseResults
+
+
+def _new_parse_results():
+    return object.__new__(ParseResults)
+
+
+def _reduce_parse_results(results):
+    # The pyparsing ParseResults constructor requires arguments, so pickle
+    # can't recreate one by default; build an empty one and restore its
+    # state instead.
+    return (_new_parse_results, (), results.__getstate__())
+
+
+def dump(obj, file):
+    """Pickles 'obj', which may hold ParseResults, to 'file'.  The result
+    can be read back with plain pickle.load()."""
+    pickler = pickle.Pickler(file, pickle.HIGHEST_PROTOCOL)
+    pickler.dispatch_table = copyreg.dispatch_table.copy()
+    pickler.dispatch_table[ParseResults] = _reduce_parse_results
+    pickler.dump(obj)
+
+
+def dumps(obj):
+    """Like dump(), returning the pickle as bytes."""
+    buffer = io.BytesIO()
+    dump(obj, buffer)
+    return buffer.getvalue()
@@ -0,0 +1,47 @@
+#coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+#  ofx.status - read STATUS blocks from raw OFX text without parsing it.
+#
+
+import re
+
+_field_re = re.compile(r"<(CODE|SEVERITY|MESSAGE)>([^<\r\n]*)")
+
+
+def scan_status(text, tag, limit=2048):
+    """Returns the fields (CODE, SEVERITY, MESSAGE) of the STATUS
+    aggregate in the first <tag> aggregate of 'text' -- SONRS, STMTTRNRS,
+    CCSTMTTRNRS, ACCTINFOTRNRS and the like -- as a dict, or None if
+    'text' has no such tag.  STATUS comes right after the tag in these
+    aggregates, so only the next 'limit' characters are looked at; if no
+    STATUS turns up there, the dict is empty."""
+    start = text.find("<%s>" % tag)
+    if start == -1:
+        return None
+
+    window = text[start:start + limit]
+    begin = window.find("<STATUS>")
+    if begin == -1:
+        return {}
+    end = window.find("</STATUS>", begin)
+    if end == -1:
+        end = len(window)
+
+    status = {}
+    for (name, value) in _field_re.findall(window, begin, end):
+        # Empty tags are dropped, as the Parser does.
+        if value.strip():
+            status.setdefault(name, value.strip())
+    return status
@@ -0,0 +1,101 @@
+#coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+#  ofx.trace - sampled logging of parse failures.
+#
+
+import logging
+import random
+import re
+
+log = logging.getLogger("fixofx.trace")
+
+_tag_re = re.compile(r"<(/?)([\w.]+)>([^<\r\n]*)")
+
+
+class FailureTrace:
+    """Records parse failures to the 'fixofx.trace' logger, along with the
+    tags (or QIF/IIF header) open at the point of failure and the lines
+    around it.  Nothing is recorded, and nothing is computed, unless that
+    logger is enabled for DEBUG; of the failures that could be recorded,
+    only a 'rate' fraction are, so tracing can be left on in a busy
+    worker."""
+
+    def __init__(self, rate=1.0, context_lines=2):
+        self.rate          = rate
+        self.context_lines = context_lines
+
+    def wanted(self, force=False):
+        if not log.isEnabledFor(logging.DEBUG):
+            return False
+        return force or self.rate >= 1.0 or random.random() < self.rate
+
+    def record(self, source, text, exc, force=False):
+        """Record the pyparsing exception 'exc' raised while parsing 'text'
+        as 'source' (OFX, OFC, QIF, IIF).  A true 'force' ignores the sample
+        rate, as the parsers' debug flag does."""
+        if not self.wanted(force):
+            return
+
+        loc = min(exc.loc, len(text))
+        lines = text.splitlines()
+        lineno = text.count("\n", 0, loc) + 1
+        first = max(lineno - 1 - self.context_lines, 0)
+        near = "\n".join("  %5d: %s" % (first + i + 1, line) for (i, line)
+                         in enumerate(lines[first:lineno + self.context_lines]))
+
+        log.debug("%s parse failure at line %d, column %d: %s\n"
+                  "  inside: %s\n%s", source, lineno, exc.col, exc.msg,
+                  open_context(text, loc), near)
+
+
+def open_context(text, loc):
+    """Describe what is open at 'loc' in 'text': the stack of aggregate
+    tags for OFX and OFC (content tags like <NAME>foo don't count), or the
+    last bang header for QIF and IIF."""
+    stack = []
+    for match in _tag_re.finditer(text, 0, loc):
+        (closing, tag, content) = match.groups()
+        if closing:
+            if tag in stack:
+                while stack.pop() != tag:
+                    pass
+        elif content.strip() == "":
+            stack.append(tag)
+
+    if stack:
+        return " > ".join(stack)
+
+    header = text.rfind("\n!", 0, loc)
+    if header == -1 and text.startswith("!"):
+        header = 0
+    elif header != -1:
+        header += 1
+    if header != -1:
+        end = text.find("\n", header)
+        return text[header:end if end != -1 else len(text)].strip()
+    return "(top level)"
+
+
+_failures = FailureTrace()
+
+
+def parse_failure(source, text, exc, force=False):
+    """Hand a parse failure to the shared FailureTrace."""
+    _failures.record(source, text, exc, force)
+
+
+def set_sample_rate(rate):
+    """Record only a 'rate' fraction (0.0 to 1.0) of parse failures."""
+    _failures.rate = rate
@@ -17,6 +17,49 @@
 # ofx.validators - Classes to validate certain financial data types.
 #
 
+import sys
+from collections import namedtuple
+from functools import lru_cache
+from time import perf_counter
+
+# The type and Federal Reserve region of each routing number prefix (its
+# first two digits), indexed by prefix; None for prefixes not in use.
+_FED_REGIONS = ["Boston", "New York", "Philadelphia", "Cleveland", "Richmond",
+                "Atlanta", "Chicago", "St. Louis", "Minneapolis", "Kansas City",
+                "Dallas", "San Francisco"]
+
+ROUTING_TYPES   = [None] * 100
+ROUTING_REGIONS = [None] * 100
+ROUTING_TYPES[0] = ROUTING_REGIONS[0] = "United States Government"
+for (_start, _type) in ((1, "Primary"), (21, "Thrift"), (61, "Electronic")):
+    for (_offset, _region) in enumerate(_FED_REGIONS):
+        ROUTING_TYPES[_start + _offset]   = _type
+        ROUTING_REGIONS[_start + _offset] = _region
+ROUTING_TYPES[80] = ROUTING_REGIONS[80] = "Traveller's Cheque"
+
+_WEIGHTS = (3, 7, 1, 3, 7, 1, 3, 7, 1)
+
+RoutingCheck = namedtuple("RoutingCheck", "valid type region")
+
+# Every result check_routing_numbers() can give, made once: by validity
+# and prefix string, and (for NumPy) as a list indexed by
+# valid * 101 + prefix, where prefix 100 is a number that isn't one.
+_UNCONVERTED = RoutingCheck(False, None, None)
+_CHECKS = { True: {}, False: {} }
+_CHECK_LIST = []
+for _valid in (False, True):
+    for _code in range(100):
+        _check = RoutingCheck(_valid, ROUTING_TYPES[_code], ROUTING_REGIONS[_code])
+        _CHECKS[_valid]["%02d" % _code] = _check
+        _CHECK_LIST.append(_check)
+    _CHECK_LIST.append(_UNCONVERTED)
+
+# The weighted digit sum of each three-digit string; a routing number is
+# three of them, and a string not in the table isn't three ASCII digits.
+_TRIPLES = dict(("%03d" % _number, (_number // 100) * 3 + (_number // 10 % 10) * 7
+                 + _number % 10) for _number in range(1000))
+
+
 class RoutingNumber:
     def __init__(self, number):
         self.number = number
@@ -47,52 +90,14 @@ class RoutingNumber:
         return (checksum % 10 == 0)
 
     def get_type(self):
-        # Remember that range() stops one short of the second argument.
-        # In other words, "x in range(1, 13)" means "x >= 1 and x < 13".
-        if self.region_code == 0:
-            return "United States Government"
-        elif self.region_code in range(1, 13):
-            return "Primary"
-        elif self.region_code in range(21, 33):
-            return "Thrift"
-        elif self.region_code in range(61, 73):
-            return "Electronic"
-        elif self.region_code == 80:
-            return "Traveller's Cheque"
-        else:
+        if self.region_code is None:
             return None
+        return ROUTING_TYPES[self.region_code]
 
     def get_region(self):
-        if self.region_code == 0:
-            return "United States Government"
-        elif self.region_code in [1, 21, 61]:
-            return "Boston"
-        elif self.region_code in [2, 22, 62]:
-            return "New York"
-        elif self.region_code in [3, 23, 63]:
-            return "Philadelphia"
-        elif self.region_code in [4, 24, 64]:
-            return "Cleveland"
-        elif self.region_code in [5, 25, 65]:
-            return "Richmond"
-        elif self.region_code in [6, 26, 66]:
-            return "Atlanta"
-        elif self.region_code in [7, 27, 67]:
-            return "Chicago"
-        elif self.region_code in [8, 28, 68]:
-            return "St. Louis"
-        elif self.region_code in [9, 29, 69]:
-            return "Minneapolis"
-        elif self.region_code in [10, 30, 70]:
-            return "Kansas City"
-        elif self.region_code in [11, 31, 71]:
-            return "Dallas"
-        elif self.region_code in [12, 32, 72]:
-            return "San Francisco"
-        elif self.region_code == 80:
-            return "Traveller's Cheque"
-        else:
+        if self.region_code is None:
             return None
+        return ROUTING_REGIONS[self.region_code]
 
     def to_s(self):
         return str(self.number) + " (valid: %s; type: %s; region: %s)" % \
@@ -101,3 +106,168 @@ class RoutingNumber:
     def __repr__(self):
         return self.to_s()
 
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def check_routing_numbers(numbers, vectorize=None):
+    """Checks many routing numbers at once, and returns a list with a
+    RoutingCheck (valid, type, region) for each, as RoutingNumber would
+    give them.  'numbers' is any iterable of strings, bytes (read as
+    Latin-1) or numbers, or a NumPy array of them.  Numbers are ASCII
+    digits; surrounding whitespace is ignored.  With NumPy installed, the
+    checksums are worked out for the whole batch at once, unless
+    'vectorize' is False; with 'vectorize' True, NumPy is required.  The
+    RoutingChecks are shared, so the results of millions of numbers take
+    little more than the list."""
+    numpy = None
+    if vectorize or vectorize is None:
+        numpy = _numpy()
+        if numpy is None and vectorize:
+            raise ImportError("Vectorized routing number checks need NumPy; "
+                              "install numpy, or pass vectorize=False.")
+    if numpy is not None:
+        return _check_array(numpy, numbers)
+
+    triples = _TRIPLES
+    valid   = _CHECKS[True]
+    checks  = []
+    append  = checks.append
+    for number in numbers:
+        # The usual case, nine digits and a good checksum, in a few
+        # lookups; anything else goes the long way round.
+        try:
+            if len(number) == 9 and (triples[number[0:3]] + triples[number[3:6]]
+                                     + triples[number[6:9]]) % 10 == 0:
+                append(valid[number[0:2]])
+                continue
+        except (KeyError, TypeError):
+            pass
+        append(_check_one(number))
+    return checks
+
+
+# How many routing numbers check_routing_number() remembers.  A process
+# converts statements from a few hundred banks at most, and from a few
+# of them most of the time.
+ROUTING_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=ROUTING_CACHE_SIZE)
+def check_routing_number(number):
+    """Returns the RoutingCheck of one routing number, as
+    check_routing_numbers() would.  Results are remembered, for the whole
+    process, for the ROUTING_CACHE_SIZE numbers most recently checked;
+    cache_info() tells how often they are used."""
+    return _check_one(number)
+
+
+def _text(number):
+    # Bytes are read as text, the same way on either path, rather than
+    # as str() would show them.
+    if isinstance(number, (bytes, bytearray)):
+        return number.decode("latin-1")
+    return number
+
+
+def _check_one(number):
+    number = str(_text(number)).strip()
+    if len(number) < 2 or not (number.isdigit() and number.isascii()):
+        return _UNCONVERTED
+    valid = (len(number) == 9 and (_TRIPLES[number[0:3]] + _TRIPLES[number[3:6]]
+                                   + _TRIPLES[number[6:9]]) % 10 == 0)
+    return _CHECKS[valid][number[0:2]]
+
+
+def _check_array(numpy, numbers):
+    if not isinstance(numbers, numpy.ndarray):
+        # NumPy makes text of a plain list quickest; bytes among str are
+        # decoded as ASCII, which Latin-1 agrees with.  Anything else,
+        # bytes alone or bytes it can't decode, goes one at a time.
+        numbers = list(numbers)
+        try:
+            array = numpy.array(numbers)
+        except (ValueError, UnicodeError):
+            array = None
+        if array is None or array.ndim != 1 or array.dtype.kind != "U":
+            array = numpy.empty(len(numbers), dtype=object)
+            array[:] = numbers
+        numbers = array
+    if numbers.dtype.kind == "S":
+        numbers = numpy.char.decode(numbers, "latin-1")
+    elif numbers.dtype.kind == "O":
+        numbers = numpy.array([_text(number) for number in numbers.ravel()], dtype=object)
+    if numbers.dtype.kind != "U":
+        numbers = numbers.astype("U")
+    numbers = numpy.char.strip(numbers.ravel())
+    if len(numbers) == 0:
+        return []
+    lengths = numpy.char.str_len(numbers)
+
+    # View the strings as a matrix of character codes, at least nine wide;
+    # past the end of a string, the codes are zero.
+    numbers = numbers.astype("U%d" % max(numbers.itemsize // 4, 9))
+    codes = numpy.ascontiguousarray(numbers).view(numpy.uint32)
+    digits = codes.reshape(len(numbers), -1).astype(numpy.int64) - ord("0")
+
+    beyond = numpy.arange(digits.shape[1]) >= lengths[:, None]
+    converted = ((((digits >= 0) & (digits <= 9)) | beyond).all(axis=1)
+                 & (lengths >= 2))
+    checksums = (digits[:, :9] * numpy.array(_WEIGHTS)).sum(axis=1) % 10
+    valid = converted & (lengths == 9) & (checksums == 0)
+    prefixes = numpy.where(converted, digits[:, 0] * 10 + digits[:, 1], 100)
+
+    check_list = numpy.empty(len(_CHECK_LIST), dtype=object)
+    check_list[:] = _CHECK_LIST
+    return check_list[valid * 101 + prefixes].tolist()
+
+
+def _benchmark_numbers(count, seed=0):
+    # Mostly good numbers, as a migration would have them, with a few
+    # typos among them.
+    import random
+
+    generator = random.Random(seed)
+    numbers = []
+    for index in range(count):
+        body = "%02d%06d" % (generator.choice((1, 7, 11, 21, 26, 61, 0)),
+                             generator.randrange(1000000))
+        total = sum(int(digit) * weight for (digit, weight) in zip(body, _WEIGHTS))
+        number = body + str(-total % 10)
+        if index % 50 == 0:
+            number = number[:-1] + str((int(number[-1]) + 1) % 10)
+        numbers.append(number)
+    return numbers
+
+
+def benchmark(count=1000000):
+    """Checks 'count' made-up routing numbers with RoutingNumber, then with
+    check_routing_numbers() in plain Python and (if NumPy is installed)
+    vectorized, and returns the numbers per second of each, by name."""
+    numbers = _benchmark_numbers(count)
+    runs = [("RoutingNumber", lambda: [(number.is_valid(), number.get_type(),
+                                        number.get_region())
+                                       for number in map(RoutingNumber, numbers)]),
+            ("plain", lambda: check_routing_numbers(numbers, vectorize=False))]
+    if _numpy() is not None:
+        array = _numpy().array(numbers)
+        runs.append(("numpy", lambda: check_routing_numbers(numbers, vectorize=True)))
+        runs.append(("numpy array", lambda: check_routing_numbers(array, vectorize=True)))
+    rates = {}
+    for (name, run) in runs:
+        started = perf_counter()
+        run()
+        rates[name] = count / (perf_counter() - started)
+    return rates
+
+
+if __name__ == "__main__":
+    # python -m fixofx.ofx.validators [COUNT]
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    for (name, rate) in benchmark(count).items():
+        print("%-14s %12.0f numbers/s" % (name, rate))
@@ -17,6 +17,7 @@
 #  ofx.IifConverter - translate IIF files into OFX files.
 #
 
+import logging
 import re
 import sys
 import xml.sax.saxutils as sax
@@ -25,9 +26,14 @@ from time import localtime, strftime
 
 import dateutil.parser
 
-from fixofx.ofxtools.iif_parser import IifParser
+from fixofx.ofxtools.iif_parser import IifParser, check_splits
 from fixofx.ofx import Response
 from fixofx.ofx.builder import *
+from fixofx.ofx.columns import make_row
+from fixofx.ofx.fitid import ContentIds, check_strategy
+from fixofx.ofx.instrument import stage
+
+log = logging.getLogger(__name__)
 
 
 class IifConverter:
@@ -70,7 +76,13 @@ class IifConverter:
 
     def __init__(self, iif, fid="UNKNOWN", org="UNKNOWN", bankid="UNKNOWN",
                  accttype="UNKNOWN", acctid="UNKNOWN", balance="UNKNOWN",
-                 curdef=None, lang="ENG", dayfirst=False, debug=False):
+                 curdef=None, lang="ENG", dayfirst=False, debug=False,
+                 instrument=None, parser=None, fitids="position", splits="discard"):
+        """Converts the IIF document 'iif', given as text or as a text
+        file object.  A file is read a transaction at a time, so neither
+        its text nor its parsed lines are held; the cleaned transactions
+        are, since the statement lists them by date and their date format
+        is settled by looking at all of them."""
         self.iif      = iif
         self.fid      = fid
         self.org      = org
@@ -82,17 +94,32 @@ class IifConverter:
         self.lang     = lang
         self.debug    = debug
         self.dayfirst = dayfirst
-
-        self.parsed_iif = None
+        self.instrument = instrument
+        self.fitids   = check_strategy(fitids)
+        # SPL lines are dropped as they are read unless asked for; they
+        # are most of a QuickBooks export, and a statement doesn't use them.
+        # "compact" keeps them, cut down, for split_rows().
+        if check_splits(splits) == "keep":
+            raise ValueError("IifConverter keeps splits only as \"compact\" records.")
+        self.splits   = splits
+
+        if parser is None:
+            parser = IifParser(debug=debug)
+        self.parser     = parser
 
         self.txns_by_date = {}
 
-        if self.debug: sys.stderr.write("Parsing document.\n")
+        log.debug("Parsing document.")
 
-        parser = IifParser(debug=debug)
-        self.parsed_iif = parser.parse(self.iif)
+        if isinstance(self.iif, str):
+            groups = self.parser.groups(self.iif, self.splits)
+        else:
+            groups = self.parser.read(self.iif, self.splits)
+        with stage(self.instrument, "iif_parse") as timer:
+            txn_list = self._extract_txn_list(groups)
+            timer.count = len(txn_list)
 
-        if self.debug: sys.stderr.write("Cleaning transactions.\n")
+        log.debug("Cleaning transactions.")
 
         # We do a two-pass conversion in order to check the dates of all
         # transactions in the statement, and convert all the dates using
@@ -100,15 +127,16 @@ class IifConverter:
         # at dates; the second actually applies the date conversion and
         # all other conversions, and extracts information needed for
         # the final output (like date range).
-        txn_list = self._extract_txn_list(self.parsed_iif)
-        self._guess_formats(txn_list)
-        #self._clean_txn_list(txn_list)
+        with stage(self.instrument, "guess_formats") as timer:
+            timer.count = len(txn_list)
+            self._guess_formats(txn_list)
+
+        with stage(self.instrument, "clean_txns") as timer:
+            timer.count = len(txn_list)
+            self._clean_txn_list(txn_list)
 
     def _extract_txn_list(self, iif):
-        # TODO Handle the case for multiple transaction header+records blocks
-        trns_block  = iif["TRANSACTS"][0][0]
-        txn_list = IifParser.get_txn_list(trns_block)
-        return txn_list
+        return IifParser.get_txn_list(iif)
 
 
 
@@ -188,9 +216,17 @@ class IifConverter:
     #
 
     def _clean_txn_list(self, txn_list):
+        if self.fitids == "content":
+            content_ids = ContentIds()
+        else:
+            content_ids = None
         for txn in txn_list:
             try:
                 self._clean_txn(txn)
+                if content_ids is not None:
+                    txn["ID"] = content_ids.make(txn.get("Date"), txn.get("Amount"),
+                                                 txn.get("Payee"), txn.get("Memo"),
+                                                 txn.get("Number"))
                 txn_date = txn["Date"]
                 txn_date_list = self.txns_by_date.get(txn_date, [])
                 txn_date_list.append(txn)
@@ -200,8 +236,7 @@ class IifConverter:
                 # that are inherently unclean and are unable to be purified.
                 # In these cases it will reject the transaction by throwing
                 # a ValueError, which signals us not to store the transaction.
-                if self.debug: sys.stderr.write("Skipping transaction '%s'." %
-                                                str(txn))
+                log.debug("Skipping transaction '%s'.", txn)
 
         if len(txn_list) > 0:
             # Sort the dates (in YYYYMMDD format) and choose the lowest
@@ -420,28 +455,57 @@ class IifConverter:
     #
 
     def to_ofx102(self):
-        if self.debug: sys.stderr.write("Making OFX/1.02.\n")
-        return DOCUMENT(self._ofx_header(),
-                        OFX(self._ofx_signon(),
-                            self._ofx_stmt()))
-
-    def to_xml(self):
-        ofx102 = self.to_ofx102()
-
-        if self.debug:
-            sys.stderr.write(ofx102 + "\n")
-            sys.stderr.write("Parsing OFX/1.02.\n")
-        response = Response(ofx102) #, debug=self.debug)
-
-        if self.debug: sys.stderr.write("Making OFX/2.0.\n")
+        log.debug("Making OFX/1.02.")
+        with stage(self.instrument, "ofx102") as timer:
+            ofx102 = DOCUMENT(self._ofx_header(),
+                              OFX(self._ofx_signon(),
+                                  self._ofx_stmt()))
+            timer.count = len(ofx102)
+        return ofx102
+
+    def to_xml(self, ofx102=None):
+        # 'ofx102' is the to_ofx102() document, if the caller made it already.
+        if ofx102 is None:
+            ofx102 = self.to_ofx102()
+
+        log.debug("OFX/1.02 document:\n%s", ofx102)
+        log.debug("Parsing OFX/1.02.")
+        response = Response(ofx102, instrument=self.instrument) #, debug=self.debug)
+
+        log.debug("Making OFX/2.0.")
         if self.dayfirst:
             date_format = "DD/MM/YY"
         else:
             date_format = "MM/DD/YY"
-        xml = response.as_xml(original_format="QIF", date_format=date_format)
+        with stage(self.instrument, "format_xml"):
+            xml = response.as_xml(original_format="QIF", date_format=date_format)
 
         return xml
 
+    def rows(self):
+        """Yields the statement's transactions as ofx.columns rows, straight
+        from the cleaned transactions, without making any OFX."""
+        if self.accttype == "CREDITCARD":
+            bankid = None
+        else:
+            bankid = self.bankid
+        for txn in self._statement_txns():
+            yield make_row(fitid=txn.get("ID"), date=txn.get("Date"),
+                           amount=txn.get("Amount"), type=txn.get("Type"),
+                           payee=txn.get("Payee"), memo=txn.get("Memo"),
+                           checknum=txn.get("Number"), bankid=bankid,
+                           acctid=self.acctid, accttype=self.accttype)
+
+    def split_rows(self):
+        """Yields the SPL lines of the statement's transactions, for a
+        converter made with splits="compact", as dicts of the FITID of
+        their transaction and their account, name, amount and memo."""
+        for txn in self._statement_txns():
+            for split in txn.get("Splits", ()):
+                yield { "fitid": txn.get("ID"), "account": split.account,
+                        "name": split.name, "amount": split.amount,
+                        "memo": split.memo }
+
     # FIXME: Move the remaining methods to ofx.Document or ofx.Response.
 
     def _ofx_header(self):
@@ -523,7 +587,16 @@ class IifConverter:
 
     def _ofx_txns(self):
         txns = ""
+        for txn in self._statement_txns():
+            txns += self._ofx_txn(txn)
 
+        # FIXME: This should respect the type of statement being generated.
+        return BANKTRANLIST(
+            DTSTART(self.start_date),
+            DTEND(self.end_date),
+            txns)
+
+    def _statement_txns(self):
         # OFX transactions appear most recent first, and oldest last,
         # so we do a reverse sort of the dates in this statement.
         date_list = list(self.txns_by_date.keys())
@@ -537,19 +610,15 @@ class IifConverter:
                 txn_amt  = txn.get("Amount", "00.00")
 
                 # Make a synthetic transaction ID using as many
-                # uniqueness guarantors as possible.
-                txn["ID"] = "%s-%s-%s-%s-%s" % (self.org, self.accttype,
-                                                txn_date, txn_index,
-                                                txn_amt)
-                txns += self._ofx_txn(txn)
+                # uniqueness guarantors as possible.  (Content IDs were
+                # made while cleaning.)
+                if self.fitids == "position":
+                    txn["ID"] = "%s-%s-%s-%s-%s" % (self.org, self.accttype,
+                                                    txn_date, txn_index,
+                                                    txn_amt)
+                yield txn
                 txn_index -= 1
 
-        # FIXME: This should respect the type of statement being generated.
-        return BANKTRANLIST(
-            DTSTART(self.start_date),
-            DTEND(self.end_date),
-            txns)
-
     def _ofx_txn(self, txn):
         fields = []
         if self._check_field("Type", txn):
@@ -583,9 +652,8 @@ class IifConverter:
 
 
 def _main():
-    f = open(sys.argv[1], 'r', encoding="latin-1")
-    text = f.read()
-    iifc = IifConverter(text, debug=0)
+    with open(sys.argv[1], 'r', encoding="latin-1", newline="") as f:
+        iifc = IifConverter(f, debug=0)
 
 if __name__ == "__main__":
     import sys
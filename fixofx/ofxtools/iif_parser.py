@@ -17,27 +17,77 @@
 #  ofx.IifParser - Parsing Quickbook IIF.
 #
 
-from pyparsing import *
-from collections import ChainMap
+import csv
+import io
+import logging
+from collections import namedtuple
 
-from fixofx.ofxtools import _ofxtoolsStartDebugAction, _ofxtoolsSuccessDebugAction, _ofxtoolsExceptionDebugAction
+from pyparsing import ParseException
 
-def _WT(token):    #Modify pyparsing tokens to keep whitespace and tabs intact
-    token.parseWithTabs()
-    token.leaveWhitespace()
-    return token
+from fixofx.ofx.trace import parse_failure
 
-def mk_dict_fn(tag):
-    return (lambda t : {tag : t.asList()})
+log = logging.getLogger(__name__)
+
+
+class _Unprintable(dict):
+    # A str.translate() table that deletes characters that aren't
+    # printable.  Latin-1 is filled in up front; other characters are
+    # looked up once, the first time they turn up, and remembered.
+    def __missing__(self, code):
+        if chr(code).isprintable():
+            self[code] = code
+        else:
+            self[code] = None
+        return self[code]
+
+_unprintable = _Unprintable((code, code if chr(code).isprintable() else None)
+                            for code in range(256))
 
-def dropQuotes(t):
-    tok = t[0]
-    if isinstance(tok, str):
-        if (tok[0]=='"' and tok[-1]=='"') or (tok[0]=="'" and tok[-1]=="'"):
-            return tok[1:-1]
 
 def remove_non_ascii(text):
-    return ''.join(c for c in text if c.isprintable())
+    """Strips the characters of 'text' that aren't printable (tabs and
+    line breaks among them)."""
+    if text.isprintable():
+        return text
+    return text.translate(_unprintable)
+
+
+def _clean(value):
+    # csv has already unquoted "double-quoted" fields; QuickBooks quotes
+    # with single quotes now and then, too.
+    if len(value) > 1 and value[0] == "'" and value[-1] == "'":
+        value = value[1:-1]
+    return remove_non_ascii(value)
+
+
+# What parse() and read() do with a transaction's SPL lines: "keep" them as
+# dicts of every field, "discard" them unread, or make "compact" IifSplit
+# records of the fields a statement can use.
+SPLIT_MODES = ("keep", "discard", "compact")
+
+IifSplit = namedtuple("IifSplit", "parent account name amount memo")
+IifSplit.__doc__ = """One SPL line, cut down: 'parent' is the position of its
+transaction in the file, counting from 0."""
+
+
+def check_splits(splits):
+    if splits not in SPLIT_MODES:
+        raise ValueError("Unknown split mode '%s'; use one of %s." %
+                         (splits, ", ".join(SPLIT_MODES)))
+    return splits
+
+
+class IIF(csv.Dialect):
+    """QuickBooks IIF: tab-separated, with double quotes around fields
+    that need them."""
+    delimiter        = "\t"
+    quotechar        = '"'
+    doublequote      = True
+    skipinitialspace = False
+    lineterminator   = "\r\n"
+    quoting          = csv.QUOTE_MINIMAL
+    strict           = False
+
 
 class IifParser:
     trns_items = {
@@ -75,78 +125,130 @@ class IifParser:
         "VALDAJ"    : "Valdaj"}
 
     def __init__(self, debug=False):
-
-        sep = Suppress('\t')
-        eol = Suppress(ZeroOrMore(White(" \t")) + LineEnd())
-        item = Regex("[^\t\r\n]*").setParseAction(dropQuotes)
-        merge_dict_fn = lambda t: dict(ChainMap(*t))
-
-        # Parse TRNS records
-        trns_fields = delimitedList(oneOf(list(IifParser.trns_items)), sep).setParseAction(mk_dict_fn("TRNS_FLDS"))
-        spl_fields  = delimitedList(oneOf(list(IifParser.spl_items)), sep).setParseAction(mk_dict_fn("SPL_FLDS"))
-        trns_header = Suppress("!TRNS") + sep + trns_fields + eol +\
-                      Suppress("!SPL") + sep + spl_fields + eol +\
-                      Suppress("!ENDTRNS") + eol
-
-        spl_entry = Suppress("SPL") + sep + Group(delimitedList(item, sep)) + eol
-        trns_entry = Suppress("TRNS") + sep + delimitedList(item, sep).setParseAction(mk_dict_fn("TRN")) + eol +\
-                     OneOrMore(spl_entry).setParseAction(mk_dict_fn("SPL")) + \
-                     Suppress("ENDTRNS") + eol
-        trns_entry.setParseAction(merge_dict_fn)
-
-        trns_entries = (trns_header + ZeroOrMore(trns_entry).setParseAction(mk_dict_fn("TRNS"))).setParseAction(merge_dict_fn)
-        transactions = Group(trns_entries)("TRANSACTS*")
-
-        self.parser = transactions
-
-
-        self.parser.leaveWhitespace()
-        self.parser.parseWithTabs()
-
-        if (debug):
-            self.parser.setDebugActions(_ofxtoolsStartDebugAction,
-                                        _ofxtoolsSuccessDebugAction,
-                                        _ofxtoolsExceptionDebugAction)
-
-    def parse(self, iif):
-        return self.parser.parseString(iif)
+        self.debug = debug
+
+    def parse(self, iif, splits="keep"):
+        """Reads the IIF document 'iif' and returns its transactions as a
+        list of (trns, splits) pairs; see read().  Raises a ParseException
+        for transaction lines that don't fit the headers."""
+        return list(self.groups(iif, splits))
+
+    def groups(self, iif, splits="keep"):
+        """Like parse(), but yields the transactions of 'iif' one at a
+        time, so that only one transaction's lines are held at once."""
+        check_splits(splits)
+        try:
+            for group in self._read(io.StringIO(iif), iif, splits):
+                yield group
+        except ParseException as exc:
+            parse_failure("IIF", iif, exc, force=self.debug)
+            raise
+
+    def read(self, lines, splits="keep"):
+        """Yields each transaction in 'lines' (a text file, or any iterable
+        of lines) as it is read, as a pair of its TRNS line and its SPL
+        lines.  The TRNS line is a dict of field values keyed by the names
+        in the !TRNS header.  With 'splits' "keep", the SPL lines are a
+        list of such dicts too; with "compact", a list of IifSplit; with
+        "discard", an empty tuple.  Any number of header blocks may come
+        before the transactions they describe; lines of other kinds (the
+        account and name lists of a full export, say) are skipped.  Field
+        values are unquoted and stripped of unprintable characters."""
+        return self._read(lines, None, check_splits(splits))
+
+    def _read(self, lines, text, splits):
+        trns_fields = None
+        spl_fields  = None
+        spl_columns = None
+        trns        = None
+        group       = None
+        parent      = -1
+        reader = csv.reader(lines, IIF)
+        for row in reader:
+            if not row:
+                continue
+            kind = row[0].strip()
+
+            if kind == "TRNS":
+                if trns_fields is None:
+                    raise self._error("TRNS line before a !TRNS header", reader, text)
+                if trns is not None:
+                    log.debug("Missing ENDTRNS before line %d.", reader.line_num)
+                    yield (trns, group)
+                trns   = dict(zip(trns_fields, map(_clean, row[1:])))
+                group  = () if splits == "discard" else []
+                parent += 1
+
+            elif kind == "SPL":
+                if trns is None:
+                    raise self._error("SPL line outside a transaction", reader, text)
+                if spl_fields is None:
+                    raise self._error("SPL line before a !SPL header", reader, text)
+                if splits == "keep":
+                    group.append(dict(zip(spl_fields, map(_clean, row[1:]))))
+                elif splits == "compact":
+                    group.append(IifSplit(parent, *[_clean(row[column])
+                                                    if 0 < column < len(row) else None
+                                                    for column in spl_columns]))
+
+            elif kind == "ENDTRNS":
+                if trns is not None:
+                    yield (trns, group)
+                trns  = None
+                group = None
+
+            elif kind == "!TRNS":
+                trns_fields = [field.strip() for field in row[1:]]
+            elif kind == "!SPL":
+                spl_fields  = [field.strip() for field in row[1:]]
+                spl_columns = [spl_fields.index(field) + 1 if field in spl_fields else 0
+                               for field in ("ACCNT", "NAME", "AMOUNT", "MEMO")]
+
+        if trns is not None:
+            log.debug("Missing ENDTRNS at end of file.")
+            yield (trns, group)
+
+    def _error(self, message, reader, text):
+        # Returns a pyparsing exception, so that callers handle IIF errors
+        # the way they handle the other formats', placed at the start of
+        # the line if the whole text is at hand.
+        line = reader.line_num
+        if text is None:
+            return ParseException("", 0, "%s (line %d)" % (message, line))
+        loc = 0
+        for index in range(line - 1):
+            loc = text.find("\n", loc) + 1
+        return ParseException(text, loc, message)
 
     @classmethod
-    def get_txn_list(cls, trns_block):
+    def get_txn_list(cls, transactions):
+        """Returns the TRNS lines of 'transactions' (as parse() or
+        groups() make them) as converter transactions, keyed by
+        trns_items' names.  Split lines, if there are any, go in each
+        transaction's "Splits"."""
         txn_list = []
-        trns_fields = trns_block["TRNS_FLDS"]
-        trns = trns_block["TRNS"]
-        if not len(trns):
-            return txn_list
-
-        for trn_rec in trns:
-            trn = trn_rec["TRN"]
+        for (trns, splits) in transactions:
             txn = {}
-            for i, fld in enumerate(trn):
-                txn[IifParser.trns_items[trns_fields[i]]] = remove_non_ascii(fld)
+            for (field, value) in trns.items():
+                name = cls.trns_items.get(field)
+                if name is not None:
+                    txn[name] = value
+            if splits:
+                txn["Splits"] = splits
             txn_list.append(txn)
-
         return txn_list
 
 
 def _main():
-    f = open(sys.argv[1], 'r', encoding="latin-1")
-    """
-    for line in f:
-       print(":".join("{:02x}".format(ord(c)) for c in line))
-       break
-    return
-    """
-    
-    text = f.read()
-    iifp = IifParser(debug=0)
-    p = iifp.parse(text)
-
-    import json
-    #print(json.dumps(p["TRANSACTS"].asList()))
-    print((p["TRANSACTS"][0][0]))
-    #p.dump()
+    import sys
+
+    parser = IifParser(debug=True)
+    with open(sys.argv[1], 'r', encoding="latin-1") as source:
+        for (trns, splits) in parser.read(source):
+            print(trns)
+            for split in splits:
+                print("    %s" % split)
+
 
 if __name__ == "__main__":
-    import sys
     _main()
@@ -17,22 +17,30 @@
 #
 #  ofx.OfcConverter - translate OFC files into OFX files.
 #
-import sys
+import logging
 
 from fixofx.ofxtools.ofc_parser import OfcParser
 from fixofx.ofx import Response
 from fixofx.ofx.builder import *
+from fixofx.ofx.columns import make_row
+from fixofx.ofx.fitid import ContentIds, check_strategy
+from fixofx.ofx.instrument import stage
+
+log = logging.getLogger(__name__)
 
 
 class OfcConverter:
     def __init__(self, ofc, fid="UNKNOWN", org="UNKNOWN", curdef=None,
-                 lang="ENG", debug=False):
+                 lang="ENG", debug=False, instrument=None, parser=None,
+                 fitids="position"):
         self.ofc      = ofc
         self.fid      = fid
         self.org      = org
         self.curdef   = curdef
         self.lang     = lang
         self.debug    = debug
+        self.instrument = instrument
+        self.fitids   = check_strategy(fitids)
 
         self.bankid     = "UNKNOWN"
         self.accttype   = "UNKNOWN"
@@ -66,12 +74,13 @@ class OfcConverter:
                             "11" : "DIRECTDEP",
                             "12" : "OTHER" }
 
-        if self.debug: sys.stderr.write("Parsing document.\n")
+        log.debug("Parsing document.")
 
-        parser = OfcParser(debug=debug)
-        self.parsed_ofc = parser.parse(self.ofc)
+        if parser is None:
+            parser = OfcParser(debug=debug)
+        self.parsed_ofc = parser.parse(self.ofc, instrument=self.instrument)
 
-        if self.debug: sys.stderr.write("Extracting document properties.\n")
+        log.debug("Extracting document properties.")
 
         if 'TRNRS' in self.parsed_ofc["document"]["OFC"].asDict():
             #TRNRS has almost the same info of ACCTSTMT. Just with another name. Damn you Banks!
@@ -97,30 +106,51 @@ class OfcConverter:
         self.start_date = self.parsed_ofc["document"]["OFC"]["ACCTSTMT"]["STMTRS"]["DTSTART"]
         self.end_date   = self.parsed_ofc["document"]["OFC"]["ACCTSTMT"]["STMTRS"]["DTEND"]
 
+        log.debug("Cleaning transactions.")
+
+        with stage(self.instrument, "clean_txns") as timer:
+            self.txn_list = self._clean_txn_list()
+            timer.count = len(self.txn_list)
+
     #
     # Conversion methods
     #
 
     def to_ofx102(self):
-        if self.debug: sys.stderr.write("Making OFX/1.02.\n")
-        return DOCUMENT(self._ofx_header(),
-                        OFX(self._ofx_signon(),
-                            self._ofx_stmt()))
+        log.debug("Making OFX/1.02.")
+        with stage(self.instrument, "ofx102") as timer:
+            ofx102 = DOCUMENT(self._ofx_header(),
+                              OFX(self._ofx_signon(),
+                                  self._ofx_stmt()))
+            timer.count = len(ofx102)
+        return ofx102
 
-    def to_xml(self):
-        ofx102 = self.to_ofx102()
+    def to_xml(self, ofx102=None):
+        # 'ofx102' is the to_ofx102() document, if the caller made it already.
+        if ofx102 is None:
+            ofx102 = self.to_ofx102()
 
-        if self.debug:
-            sys.stderr.write(ofx102 + "\n")
-            sys.stderr.write("Parsing OFX/1.02.\n")
-        response = Response(ofx102, debug=self.debug)
+        log.debug("OFX/1.02 document:\n%s", ofx102)
+        log.debug("Parsing OFX/1.02.")
+        response = Response(ofx102, debug=self.debug, instrument=self.instrument)
 
-        if self.debug: sys.stderr.write("Making OFX/2.0.\n")
+        log.debug("Making OFX/2.0.")
 
-        xml = response.as_xml(original_format="OFC")
+        with stage(self.instrument, "format_xml"):
+            xml = response.as_xml(original_format="OFC")
 
         return xml
 
+    def rows(self):
+        """Yields the statement's transactions as ofx.columns rows, straight
+        from the parsed OFC, without making any OFX."""
+        for txn in self._statement_txns():
+            yield make_row(fitid=txn.get("FITID"), date=txn.get("DTPOSTED"),
+                           amount=txn.get("TRNAMT"), type=txn.get("TRNTYPE"),
+                           payee=txn.get("NAME"), memo=txn.get("MEMO"),
+                           checknum=txn.get("CHECKNUM"), bankid=self.bankid,
+                           acctid=self.acctid, accttype=self.accttype)
+
     # FIXME: Move the remaining methods to ofx.Document or ofx.Response.
 
     def _ofx_header(self):
@@ -202,8 +232,22 @@ class OfcConverter:
 
     def _ofx_txns(self):
         txns = ""
+        for txn in self._statement_txns():
+            txns += self._ofx_txn(txn)
+
+        return BANKTRANLIST(
+            DTSTART(self.start_date),
+            DTEND(self.end_date),
+            txns)
+
+    def _clean_txn_list(self):
+        # Fills in missing transaction types and makes up the FITIDs, once,
+        # so that rows() and the OFX output see the same transactions.
+        txn_list  = []
         last_date = None
         txn_index = 1
+        if self.fitids == "content":
+            content_ids = ContentIds()
 
         for item in self.parsed_ofc["document"]["OFC"]["ACCTSTMT"]["STMTRS"]:
             if item[0] == "STMTTRN":
@@ -226,16 +270,19 @@ class OfcConverter:
 
                 # Make a synthetic transaction ID using as many
                 # uniqueness guarantors as possible.
-                txn["FITID"] = "%s-%s-%s-%s-%s" % (self.org, self.accttype,
-                                                   txn_date, txn_index,
-                                                   txn_amt)
-                txns += self._ofx_txn(txn)
+                if self.fitids == "content":
+                    txn["FITID"] = content_ids.make(txn_date, txn_amt, txn.get("NAME"),
+                                                    txn.get("MEMO"), txn.get("CHECKNUM"))
+                else:
+                    txn["FITID"] = "%s-%s-%s-%s-%s" % (self.org, self.accttype,
+                                                       txn_date, txn_index,
+                                                       txn_amt)
+                txn_list.append(txn)
                 txn_index += 1
+        return txn_list
 
-        return BANKTRANLIST(
-            DTSTART(self.start_date),
-            DTEND(self.end_date),
-            txns)
+    def _statement_txns(self):
+        return iter(self.txn_list)
 
     def _ofx_txn(self, txn):
         fields = []
@@ -23,9 +23,16 @@ from pyparsing import (alphanums, CharsNotIn, Dict, Forward, Group,
                        Literal, OneOrMore, White, Word, ZeroOrMore)
 from pyparsing import ParseException
 
-from fixofx.ofxtools import _ofxtoolsStartDebugAction, _ofxtoolsSuccessDebugAction, _ofxtoolsExceptionDebugAction
+from fixofx.ofx.budget import recursion_limit
+from fixofx.ofx.instrument import stage
+from fixofx.ofx.trace import parse_failure
 from fixofx.ofxtools.util import strip_empty_tags
 
+_ledger_re      = re.compile(r'<LEDGER>')
+_digit_re       = re.compile(r'\d')
+_closing_tag_re = re.compile(r'</\w+>')
+_word_re        = re.compile(r'\w')
+
 
 class OfcParser:
     """Dirt-simple OFC parser for interpreting OFC documents."""
@@ -39,10 +46,7 @@ class OfcParser:
             + aggregate_close_tag)
 
         self.parser = Group(aggregate).setResultsName("document")
-        if (debug):
-            self.parser.setDebugActions(_ofxtoolsStartDebugAction,
-                                        _ofxtoolsSuccessDebugAction,
-                                        _ofxtoolsExceptionDebugAction)
+        self.debug = debug
 
     def _tag(self, closed=True):
         """Generate parser definitions for OFX tags."""
@@ -54,34 +58,71 @@ class OfcParser:
         else:
             return openTag
 
-    def parse(self, ofc):
+    def parse(self, ofc, instrument=None):
         """Parse a string argument and return a tree structure representing
         the parsed document."""
-        ofc = self.add_zero_to_empty_ledger_tag(ofc)
-        ofc = self.remove_inline_closing_tags(ofc)
-        ofc = strip_empty_tags(ofc)
-        ofc = self._translate_chknum_to_checknum(ofc)
+        with stage(instrument, "ofc_cleanup") as timer:
+            timer.count = len(ofc)
+            ofc = self.add_zero_to_empty_ledger_tag(ofc)
+            ofc = self.remove_inline_closing_tags(ofc)
+            ofc = strip_empty_tags(ofc)
+            ofc = self._translate_chknum_to_checknum(ofc)
         # if you don't have a good stomach, skip this part
         # XXX:needs better solution
-        import sys
-        sys.setrecursionlimit(5000)
-        try:
-          return self.parser.parseString(ofc).asDict()
-        except ParseException:
-          fixed_ofc = self.fix_ofc(ofc)
-          return self.parser.parseString(fixed_ofc).asDict()
+        # The OFC grammar recurses once per level of nesting, which needs
+        # more stack than Python allows by default.
+        with stage(instrument, "ofc_parse"), recursion_limit(5000):
+            try:
+              return self.parser.parseString(ofc).asDict()
+            except ParseException as exc:
+              parse_failure("OFC", ofc, exc, force=self.debug)
+              fixed_ofc = self.fix_ofc(ofc)
+              try:
+                return self.parser.parseString(fixed_ofc).asDict()
+              except ParseException as exc:
+                parse_failure("OFC (after fix_ofc)", fixed_ofc, exc,
+                              force=self.debug)
+                raise
 
     def add_zero_to_empty_ledger_tag(self, ofc):
         """
-        Fix an OFC, by adding zero to LEDGER blank tag
+        Fix an OFC, by adding zero to LEDGER blank tag (one with a line end
+        between it and the next digit)
         """
-        return re.compile(r'<LEDGER>(\D*\n)', re.UNICODE).sub(r'<LEDGER>0\1', ofc)
+        parts = []
+        last = 0
+        consumed = 0
+        digit = None
+        for ledger in _ledger_re.finditer(ofc):
+            if ledger.start() < consumed:
+                continue
+            if digit is None or digit.start() < ledger.end():
+                digit = _digit_re.search(ofc, ledger.end())
+            end = digit.start() if digit is not None else len(ofc)
+            newline = ofc.rfind("\n", ledger.end(), end)
+            if newline != -1:
+                parts.append(ofc[last:ledger.end()])
+                parts.append("0")
+                last = ledger.end()
+                consumed = newline + 1
+        parts.append(ofc[last:])
+        return "".join(parts)
 
     def remove_inline_closing_tags(self, ofc):
         """
-        Fix an OFC, by removing inline closing 'tags'
+        Fix an OFC, by removing inline closing 'tags' (the last one on each
+        line that has a word character before it)
         """
-        return re.compile(r'(\w+.*)<\/\w+>', re.UNICODE).sub(r'\1', ofc)
+        lines = ofc.split("\n")
+        for (index, line) in enumerate(lines):
+            if "</" not in line:
+                continue
+            closing = None
+            for closing in _closing_tag_re.finditer(line):
+                pass
+            if closing is not None and _word_re.search(line, 0, closing.start()):
+                lines[index] = line[:closing.start()] + line[closing.end():]
+        return "\n".join(lines)
 
     def fix_ofc(self, ofc):
         """
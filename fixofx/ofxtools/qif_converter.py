@@ -17,23 +17,111 @@
 #  ofx.QifConverter - translate QIF files into OFX files.
 #
 
+import logging
 import re
-import sys
 import xml.sax.saxutils as sax
 from decimal import Decimal
 from time import localtime, strftime
 
 import dateutil.parser
+from pyparsing import ParseException
 
 from fixofx.ofxtools.qif_parser import QifParser
 from fixofx.ofx import Response
 from fixofx.ofx.builder import *
+from fixofx.ofx.columns import make_row
+from fixofx.ofx.fitid import ContentIds, check_strategy
+from fixofx.ofx.instrument import stage
+
+log = logging.getLogger(__name__)
+
+# The header that starts the transactions in a QIF file, an account
+# block (which runs to the end of its first record) at the very start of
+# one without a header, and account blocks anywhere, such as between the
+# sections of a file with several accounts.
+_type_header_re    = re.compile("!Type", re.IGNORECASE)
+_account_block_re  = re.compile(r"\s*!Account[^^]*\^\s*", re.IGNORECASE)
+_account_blocks_re = re.compile(r"^[ \t]*!Account[^^]*\^[^\n]*\n?",
+                                re.IGNORECASE | re.MULTILINE)
+
+# Each worker process builds its QifParser once.
+_worker_parser = None
+
+
+def _clean_chunk(chunk, accttype, dayfirst):
+    """Parses and cleans a chunk of records for QifConverter's parallel
+    mode.  Returns the number of records and the cleaned transactions in
+    file order, or None if the chunk doesn't parse all the way through."""
+    global _worker_parser
+    if _worker_parser is None:
+        _worker_parser = QifParser()
+    try:
+        parsed = _worker_parser.parse(chunk, parse_all=True)
+    except ParseException:
+        return None
+
+    converter = QifConverter.__new__(QifConverter)
+    converter.accttype = accttype
+    converter.dayfirst = dayfirst
+    txn_list = converter._extract_txn_list(parsed)
+    txns = []
+    for txn_obj in txn_list:
+        try:
+            txns.append(converter._clean_txn(txn_obj))
+        except ValueError:
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Skipping transaction '%s'.", txn_obj.asDict())
+    return (len(txn_list), txns)
 
 
 class QifConverter:
+    # This is a list of possible transaction types embedded in the
+    # QIF Payee or Memo field (depending on bank and, it seems,
+    # other factors).  The keys are used to match possible fields
+    # that we can identify.  The values are used as substitutions,
+    # since banks will use their own vernacular (like "DBT"
+    # instead of "DEBIT") for some transaction types.  All of the
+    # types in the values column (except "ACH", which is given
+    # special treatment) are OFX-2.0 standard transaction types;
+    # the keys are not all standard.  To add a new translation,
+    # find the QIF name for the transaction type, and add it to
+    # the keys column, then add the appropriate value from the
+    # OFX-2.0 spec (see page 180 of doc/ofx/ofx-2.0/ofx20.pdf).
+    # The substitution will be made if either the payee or memo
+    # field begins with one of the keys followed by a "/", OR if
+    # the payee or memo field exactly matches a key.
+    txn_types = { "ACH"         : "ACH",
+                  "CHECK CARD"  : "POS",
+                  "CREDIT"      : "CREDIT",
+                  "DBT"         : "DEBIT",
+                  "DEBIT"       : "DEBIT",
+                  "INT"         : "INT",
+                  "DIV"         : "DIV",
+                  "FEE"         : "FEE",
+                  "SRVCHG"      : "SRVCHG",
+                  "DEP"         : "DEP",
+                  "DEPOSIT"     : "DEP",
+                  "ATM"         : "ATM",
+                  "POS"         : "POS",
+                  "XFER"        : "XFER",
+                  "CHECK"       : "CHECK",
+                  "PAYMENT"     : "PAYMENT",
+                  "CASH"        : "CASH",
+                  "DIRECTDEP"   : "DIRECTDEP",
+                  "DIRECTDEBIT" : "DIRECTDEBIT",
+                  "REPEATPMT"   : "REPEATPMT",
+                  "OTHER"       : "OTHER"        }
+
     def __init__(self, qif, fid="UNKNOWN", org="UNKNOWN", bankid="UNKNOWN",
                  accttype="UNKNOWN", acctid="UNKNOWN", balance="UNKNOWN",
-                 curdef=None, lang="ENG", dayfirst=False, debug=False):
+                 curdef=None, lang="ENG", dayfirst=False, debug=False,
+                 instrument=None, workers=None, parser=None, fitids="position"):
+        """Converts the QIF document 'qif'.  Given a number of 'workers',
+        a large single-account statement is split into chunks of records
+        that are parsed and cleaned in that many worker processes; the
+        result is the same as converting it in one piece.  Pass a QifParser
+        as 'parser' to reuse it rather than building a new one.  'fitids'
+        is how transaction IDs are made up (see ofx.fitid)."""
         self.qif      = qif
         self.fid      = fid
         self.org      = org
@@ -45,88 +133,33 @@ class QifConverter:
         self.lang     = lang
         self.debug    = debug
         self.dayfirst = dayfirst
+        self.instrument = instrument
+        self.fitids   = check_strategy(fitids)
 
+        if parser is None:
+            parser = QifParser(debug=debug)
+        self.parser     = parser
         self.parsed_qif = None
 
         # FIXME: Move this to one of the OFX generation classes (Document or Response).
         self.txns_by_date = {}
 
-        # This is a list of possible transaction types embedded in the
-        # QIF Payee or Memo field (depending on bank and, it seems,
-        # other factors).  The keys are used to match possible fields
-        # that we can identify.  The values are used as substitutions,
-        # since banks will use their own vernacular (like "DBT"
-        # instead of "DEBIT") for some transaction types.  All of the
-        # types in the values column (except "ACH", which is given
-        # special treatment) are OFX-2.0 standard transaction types;
-        # the keys are not all standard.  To add a new translation,
-        # find the QIF name for the transaction type, and add it to
-        # the keys column, then add the appropriate value from the
-        # OFX-2.0 spec (see page 180 of doc/ofx/ofx-2.0/ofx20.pdf).
-        # The substitution will be made if either the payee or memo
-        # field begins with one of the keys followed by a "/", OR if
-        # the payee or memo field exactly matches a key.
-        self.txn_types = { "ACH"         : "ACH",
-                           "CHECK CARD"  : "POS",
-                           "CREDIT"      : "CREDIT",
-                           "DBT"         : "DEBIT",
-                           "DEBIT"       : "DEBIT",
-                           "INT"         : "INT",
-                           "DIV"         : "DIV",
-                           "FEE"         : "FEE",
-                           "SRVCHG"      : "SRVCHG",
-                           "DEP"         : "DEP",
-                           "DEPOSIT"     : "DEP",
-                           "ATM"         : "ATM",
-                           "POS"         : "POS",
-                           "XFER"        : "XFER",
-                           "CHECK"       : "CHECK",
-                           "PAYMENT"     : "PAYMENT",
-                           "CASH"        : "CASH",
-                           "DIRECTDEP"   : "DIRECTDEP",
-                           "DIRECTDEBIT" : "DIRECTDEBIT",
-                           "REPEATPMT"   : "REPEATPMT",
-                           "OTHER"       : "OTHER"        }
+        with stage(self.instrument, "qif_cleanup") as timer:
+            timer.count = len(self.qif)
+            self._clean_header()
+            self._close_last_record()
 
-        # Some joker British bank starts QIF with a single bang and nothing
-        # else.
-        if re.match("!\n", self.qif) is not None:
-            if self.debug: sys.stderr.write("Fixing typeless bang header.\n")
-            self.qif = self.qif.replace("!", "!Type:Bank", 1)
+        if workers is not None and workers > 1 and self._convert_in_parallel(workers):
+            return
 
-        # Chase does not provide a Type header, so force one in the
-        # case where it is omitted.
-        if re.search("!Type:", self.qif, re.IGNORECASE) == None:
-            if self.debug: sys.stderr.write("Forcing bank type header.\n")
-            self.qif = "!Type:Bank\n" + self.qif
+        log.debug("Parsing document.")
 
-        acctblock = re.search("(!Account.*?\^\s*)", self.qif, re.DOTALL | re.IGNORECASE | re.MULTILINE)
-        if acctblock is not None:
-            block = acctblock.group(1)
-            if self.debug:
-                sys.stderr.write("Discarding account block from QIF file:\n%s" % block)
-            self.qif = self.qif.replace(block, '', 1)
-
-        # Some other personal finance program puts out a spurious transaction
-        # showing current balance, but not as a balance -- instead as a
-        # transaction before the type header.  And, there are a bunch of other
-        # cases where crap before the type header is messing us up right now.
-        # So, this is an awfully big hammer but one that at least lets people
-        # import from other finance programs and broken banks.
-        straycrap = re.search("^(.*?)!Type", self.qif, re.DOTALL | re.IGNORECASE | re.MULTILINE)
-        if straycrap is not None:
-            crap = straycrap.group(1)
-            if len(crap) > 0:
-              if self.debug:
-                  sys.stderr.write("Discarding stray crap from beginning of QIF file:\n%s" % crap)
-              self.qif = self.qif.replace(crap, '', 1)
-
-        if self.debug: sys.stderr.write("Parsing document.\n")
-
-        parser = QifParser(debug=debug)
-        self.parsed_qif = parser.parse(self.qif)
-
-        if self.debug: sys.stderr.write("Cleaning transactions.\n")
+        with stage(self.instrument, "qif_parse") as timer:
+            self.parsed_qif = self.parser.parse(self.qif)
+            txn_list = self._extract_txn_list(self.parsed_qif)
+            timer.count = len(txn_list)
+
+        log.debug("Cleaning transactions.")
 
         # We do a two-pass conversion in order to check the dates of all
         # transactions in the statement, and convert all the dates using
@@ -134,9 +167,154 @@ class QifConverter:
         # at dates; the second actually applies the date conversion and
         # all other conversions, and extracts information needed for
         # the final output (like date range).
-        txn_list = self._extract_txn_list(self.parsed_qif)
-        self._guess_formats(txn_list)
-        self._clean_txn_list(txn_list)
+        with stage(self.instrument, "guess_formats") as timer:
+            timer.count = len(txn_list)
+            self._guess_formats(txn_list)
+
+        with stage(self.instrument, "clean_txns") as timer:
+            timer.count = len(txn_list)
+            self._clean_txn_list(txn_list)
+
+    def _clean_header(self):
+        # Some joker British bank starts QIF with a single bang and nothing
+        # else.
+        if self.qif.startswith("!\n"):
+            log.debug("Fixing typeless bang header.")
+            self.qif = "!Type:Bank" + self.qif[1:]
+
+        header = _type_header_re.search(self.qif)
+        if header is not None:
+            # Some other personal finance program puts out a spurious
+            # transaction showing current balance, but not as a balance --
+            # instead as a transaction before the type header.  And, there
+            # are a bunch of other cases where crap before the type header
+            # is messing us up right now, account blocks among them.  So,
+            # this is an awfully big hammer but one that at least lets
+            # people import from other finance programs and broken banks.
+            if header.start() > 0:
+                log.debug("Discarding stray crap from beginning of QIF file:\n%s",
+                          self.qif[:header.start()])
+                self.qif = self.qif[header.start():]
+            self._drop_account_blocks()
+            return
+
+        # Chase does not provide a Type header, so force one in the
+        # case where it is omitted, after dropping any account block.
+        acctblock = _account_block_re.match(self.qif)
+        if acctblock is not None:
+            log.debug("Discarding account block from QIF file:\n%s", acctblock.group(0))
+            self.qif = self.qif[acctblock.end():]
+        log.debug("Forcing bank type header.")
+        self.qif = "!Type:Bank\n" + self.qif
+        self._drop_account_blocks()
+
+    def _drop_account_blocks(self):
+        # An account block between two sections would stop the parser,
+        # quietly, and lose every transaction after it.
+        (self.qif, count) = _account_blocks_re.subn("", self.qif)
+        if count:
+            log.debug("Discarded %d account blocks from QIF file.", count)
+
+    def _close_last_record(self):
+        # Some files end without the "^" after their last record, which
+        # the parser would then quietly leave out.
+        last = self.qif.rstrip()
+        last = last[last.rfind("\n") + 1:].lstrip()
+        if last and not last.startswith(("^", "!")):
+            log.debug("Closing unterminated last record.")
+            self.qif = self.qif.rstrip() + "\n^\n"
+
+    #
+    # Parallel conversion methods
+    #
+
+    def _convert_in_parallel(self, workers):
+        # The records of a statement can be parsed and cleaned independently
+        # once the date format and currency are settled, so settle those
+        # with a quick scan of the raw records, then hand out chunks of
+        # records to the workers.  Returns False, having changed nothing,
+        # for anything that isn't one plain statement section, or that the
+        # serial conversion might treat differently (records that don't
+        # parse, dates that don't convert); the caller then falls back to
+        # the serial conversion.
+        saved = (self.accttype, self.dayfirst, self.curdef)
+        if self._convert_chunks(workers):
+            return True
+        (self.accttype, self.dayfirst, self.curdef) = saved
+        return False
+
+    def _convert_chunks(self, workers):
+        (header, newline, body) = self.qif.lstrip().partition("\n")
+        if re.search(r"^[ \t\r]*!", body, re.MULTILINE) is not None:
+            return False
+
+        try:
+            self._extract_txn_list(self.parser.parse(header + "\n", parse_all=True))
+        except ParseException:
+            return False
+
+        with stage(self.instrument, "guess_formats") as timer:
+            try:
+                records = self._scan_records(body)
+            except ValueError:
+                return False
+            timer.count = len(records or ())
+        if records is None or len(records) < 2:
+            return False
+
+        chunk_count = min(len(records), workers * 4)
+        chunks = []
+        for index in range(chunk_count):
+            start = len(records) * index // chunk_count
+            end   = len(records) * (index + 1) // chunk_count
+            chunks.append(header + "\n" + "".join(records[start:end]))
+
+        log.debug("Converting %d records in %d chunks.", len(records), chunk_count)
+        # Imported here since it's slow to import and rarely needed.
+        from concurrent.futures import ProcessPoolExecutor
+        with stage(self.instrument, "clean_txns") as timer:
+            timer.count = len(records)
+            with ProcessPoolExecutor(min(workers, chunk_count)) as executor:
+                results = list(executor.map(_clean_chunk, chunks,
+                                            [self.accttype] * chunk_count,
+                                            [self.dayfirst] * chunk_count))
+            if None in results:
+                return False
+
+            txn_count = 0
+            content_ids = self._content_ids()
+            for (count, txns) in results:
+                txn_count += count
+                for txn in txns:
+                    if content_ids is not None:
+                        self._set_content_id(content_ids, txn)
+                    self.txns_by_date.setdefault(txn["Date"], []).append(txn)
+            self._set_date_range(txn_count)
+        return True
+
+    def _scan_records(self, body):
+        # Splits the body of a statement into the raw text of its records,
+        # applying _guess_formats() to each record's Date and Currency
+        # fields as the parser would read them.  Returns None if there is
+        # an unterminated record at the end.
+        records = []
+        lines = []
+        txn_date = "UNKNOWN"
+        for line in body.splitlines(True):
+            lines.append(line)
+            field = line.lstrip(" \t\r")
+            if field[:1] in ("D", "d"):
+                txn_date = field[1:].rstrip("\n")
+            elif field.startswith("^"):
+                self._check_date_format(self._parse_date(txn_date), txn_date)
+                if self.curdef is None and field.startswith("^EUR"):
+                    self.curdef = 'EUR'
+                records.append("".join(lines))
+                lines = []
+                txn_date = "UNKNOWN"
+        if "".join(lines).strip():
+            return None
+        return records
 
     def _extract_txn_list(self, qif):
         stmt_obj = qif.asDict()["QifStatement"]
@@ -230,9 +408,12 @@ class QifConverter:
     #
 
     def _clean_txn_list(self, txn_list):
+        content_ids = self._content_ids()
         for txn_obj in txn_list:
             try:
                 txn = self._clean_txn(txn_obj)
+                if content_ids is not None:
+                    self._set_content_id(content_ids, txn)
                 txn_date = txn["Date"]
                 txn_date_list = self.txns_by_date.get(txn_date, [])
                 txn_date_list.append(txn)
@@ -242,10 +423,23 @@ class QifConverter:
                 # that are inherently unclean and are unable to be purified.
                 # In these cases it will reject the transaction by throwing
                 # a ValueError, which signals us not to store the transaction.
-                if self.debug: sys.stderr.write("Skipping transaction '%s'." %
-                                                str(txn_obj.asDict()))
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("Skipping transaction '%s'.", txn_obj.asDict())
+
+        self._set_date_range(len(txn_list))
+
+    def _content_ids(self):
+        if self.fitids == "content":
+            return ContentIds()
+        return None
 
-        if len(txn_list) > 0:
+    def _set_content_id(self, content_ids, txn):
+        txn["ID"] = content_ids.make(txn.get("Date"), txn.get("Amount"),
+                                     txn.get("Payee"), txn.get("Memo"),
+                                     txn.get("Number"))
+
+    def _set_date_range(self, txn_count):
+        if txn_count > 0:
             # Sort the dates (in YYYYMMDD format) and choose the lowest
             # date as our start date, and the highest date as our end
             # date.
@@ -475,28 +669,47 @@ class QifConverter:
     #
 
     def to_ofx102(self):
-        if self.debug: sys.stderr.write("Making OFX/1.02.\n")
-        return DOCUMENT(self._ofx_header(),
-                        OFX(self._ofx_signon(),
-                            self._ofx_stmt()))
-
-    def to_xml(self):
-        ofx102 = self.to_ofx102()
-
-        if self.debug:
-            sys.stderr.write(ofx102 + "\n")
-            sys.stderr.write("Parsing OFX/1.02.\n")
-        response = Response(ofx102) #, debug=self.debug)
-
-        if self.debug: sys.stderr.write("Making OFX/2.0.\n")
+        log.debug("Making OFX/1.02.")
+        with stage(self.instrument, "ofx102") as timer:
+            ofx102 = DOCUMENT(self._ofx_header(),
+                              OFX(self._ofx_signon(),
+                                  self._ofx_stmt()))
+            timer.count = len(ofx102)
+        return ofx102
+
+    def to_xml(self, ofx102=None):
+        # 'ofx102' is the to_ofx102() document, if the caller made it already.
+        if ofx102 is None:
+            ofx102 = self.to_ofx102()
+
+        log.debug("OFX/1.02 document:\n%s", ofx102)
+        log.debug("Parsing OFX/1.02.")
+        response = Response(ofx102, instrument=self.instrument) #, debug=self.debug)
+
+        log.debug("Making OFX/2.0.")
         if self.dayfirst:
             date_format = "DD/MM/YY"
         else:
             date_format = "MM/DD/YY"
-        xml = response.as_xml(original_format="QIF", date_format=date_format)
+        with stage(self.instrument, "format_xml"):
+            xml = response.as_xml(original_format="QIF", date_format=date_format)
 
         return xml
 
+    def rows(self):
+        """Yields the statement's transactions as ofx.columns rows, straight
+        from the cleaned transactions, without making any OFX."""
+        if self.accttype == "CREDITCARD":
+            bankid = None
+        else:
+            bankid = self.bankid
+        for txn in self._statement_txns():
+            yield make_row(fitid=txn.get("ID"), date=txn.get("Date"),
+                           amount=txn.get("Amount"), type=txn.get("Type"),
+                           payee=txn.get("Payee"), memo=txn.get("Memo"),
+                           checknum=txn.get("Number"), bankid=bankid,
+                           acctid=self.acctid, accttype=self.accttype)
+
     # FIXME: Move the remaining methods to ofx.Document or ofx.Response.
 
     def _ofx_header(self):
@@ -578,7 +791,16 @@ class QifConverter:
 
     def _ofx_txns(self):
         txns = ""
+        for txn in self._statement_txns():
+            txns += self._ofx_txn(txn)
+
+        # FIXME: This should respect the type of statement being generated.
+        return BANKTRANLIST(
+            DTSTART(self.start_date),
+            DTEND(self.end_date),
+            txns)
 
+    def _statement_txns(self):
         # OFX transactions appear most recent first, and oldest last,
         # so we do a reverse sort of the dates in this statement.
         date_list = list(self.txns_by_date.keys())
@@ -592,19 +814,15 @@ class QifConverter:
                 txn_amt  = txn.get("Amount", "00.00")
 
                 # Make a synthetic transaction ID using as many
-                # uniqueness guarantors as possible.
-                txn["ID"] = "%s-%s-%s-%s-%s" % (self.org, self.accttype,
-                                                txn_date, txn_index,
-                                                txn_amt)
-                txns += self._ofx_txn(txn)
+                # uniqueness guarantors as possible.  (Content IDs were
+                # made while cleaning.)
+                if self.fitids == "position":
+                    txn["ID"] = "%s-%s-%s-%s-%s" % (self.org, self.accttype,
+                                                    txn_date, txn_index,
+                                                    txn_amt)
+                yield txn
                 txn_index -= 1
 
-        # FIXME: This should respect the type of statement being generated.
-        return BANKTRANLIST(
-            DTSTART(self.start_date),
-            DTEND(self.end_date),
-            txns)
-
     def _ofx_txn(self, txn):
         fields = []
         if self._check_field("Type", txn):
@@ -18,10 +18,10 @@
 #
 
 from pyparsing import (CaselessLiteral, Group, LineEnd,
-                       oneOf, OneOrMore, Or, restOfLine,
+                       oneOf, OneOrMore, Or, ParseException, restOfLine,
                        White, ZeroOrMore)
 
-from fixofx.ofxtools import _ofxtoolsStartDebugAction, _ofxtoolsSuccessDebugAction, _ofxtoolsExceptionDebugAction
+from fixofx.ofx.trace import parse_failure
 
 
 class QifParser:
@@ -119,10 +119,7 @@ class QifParser:
                             ZeroOrMore(White()).suppress()
                             ).setResultsName("QifStatement")
 
-        if (debug):
-            self.parser.setDebugActions(_ofxtoolsStartDebugAction,
-                                        _ofxtoolsSuccessDebugAction,
-                                        _ofxtoolsExceptionDebugAction)
+        self.debug = debug
 
 
     def _items(self, items, name="Transaction"):
@@ -140,6 +137,10 @@ class QifParser:
                restOfLine.setResultsName(name) + \
                LineEnd().suppress()
 
-    def parse(self, qif):
-        return self.parser.parseString(qif)
+    def parse(self, qif, parse_all=False):
+        try:
+            return self.parser.parseString(qif, parseAll=parse_all)
+        except ParseException as exc:
+            parse_failure("QIF", qif, exc, force=self.debug)
+            raise
 
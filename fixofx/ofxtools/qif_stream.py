@@ -0,0 +1,289 @@
+#coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+#  ofx.QifStreamConverter - translate QIF files into OFX files a record at a time.
+#
+
+import io
+import logging
+import shutil
+import tempfile
+from time import localtime, strftime
+
+from pyparsing import ParseException
+
+from fixofx.ofxtools.qif_converter import QifConverter
+from fixofx.ofxtools.qif_parser import QifParser
+from fixofx.ofx.builder import *
+from fixofx.ofx.columns import make_row
+from fixofx.ofx.fitid import check_strategy
+from fixofx.ofx.instrument import stage
+
+log = logging.getLogger(__name__)
+
+# Stands in for the transaction list in the statement skeleton; see
+# write_ofx102().
+_TXNS_MARKER = "\0TXNS\0"
+
+
+class QifStreamConverter(QifConverter):
+    """Converts a QIF statement read from a text file object, holding only
+    a bounded number of records in memory at a time.
+
+    QifConverter decides between day-first and month-first dates after
+    looking at every transaction; this converter holds transactions back
+    only until a date settles the question (a first number from 13 to 31
+    means day-first, a second one means month-first), or until
+    'lookahead' transactions have gone by, after which it keeps the
+    format it has.  Records before the type header are likewise held back
+    for up to 'lookahead' records, and dropped if a header turns up.
+    Records the parser can't read are skipped rather than ending the
+    statement, and transactions come out in file order.
+
+    FITIDs are always made from content ('fitids' "content", see
+    ofx.fitid), the same as QifConverter makes them with that strategy.
+    Position IDs number a day's transactions by their place in the
+    day's full list, which a stream doesn't have until the end, so they
+    would come out different from QifConverter's, and an import that
+    switched between the two would take the same transactions twice.
+    Asking for them is a ValueError."""
+
+    def __init__(self, stream, fid="UNKNOWN", org="UNKNOWN", bankid="UNKNOWN",
+                 accttype="UNKNOWN", acctid="UNKNOWN", balance="UNKNOWN",
+                 curdef=None, lang="ENG", dayfirst=False, lookahead=1000,
+                 debug=False, instrument=None, fitids="content"):
+        self.stream     = stream
+        self.fid        = fid
+        self.org        = org
+        self.bankid     = bankid
+        self.accttype   = accttype
+        self.acctid     = acctid
+        self.balance    = balance
+        self.curdef     = curdef
+        self.lang       = lang
+        self.debug      = debug
+        self.dayfirst   = dayfirst
+        self.lookahead  = lookahead
+        self.instrument = instrument
+        self.fitids     = check_strategy(fitids)
+        if self.fitids != "content":
+            raise ValueError("QifStreamConverter makes content FITIDs only; "
+                             "use QifConverter for \"%s\" ones." % self.fitids)
+
+        self.parser     = QifParser(debug=debug)
+        self.start_date = None
+        self.end_date   = None
+
+    def transactions(self):
+        """Yields the cleaned transactions of the statement, as the
+        dictionaries QifConverter keeps in txns_by_date, in file order.
+        Once the generator is exhausted, start_date, end_date, curdef and
+        dayfirst describe the whole statement."""
+        pending = []
+        settled = self.dayfirst
+        self._stream_ids = self._content_ids()
+        for txn_obj in self._parsed_transactions():
+            txn = txn_obj.asDict()
+            if self.curdef is None and txn.get("Currency", "UNKNOWN") == '^EUR':
+                self.curdef = 'EUR'
+
+            if settled:
+                txn = self._clean_stream_txn(txn_obj)
+                if txn is not None:
+                    yield txn
+                continue
+
+            txn_date    = txn.get("Date", "UNKNOWN")
+            parsed_date = self._parse_date(txn_date)
+            self._check_date_format(parsed_date, txn_date)
+            settled = self.dayfirst or (parsed_date not in (None, "UNKNOWN") and
+                                        parsed_date.day >= 13)
+            pending.append(txn_obj)
+            if not settled and len(pending) >= self.lookahead:
+                log.debug("No telling date in the first %d transactions; "
+                          "assuming month-first dates.", len(pending))
+                settled = True
+            if settled:
+                for txn_obj in pending:
+                    txn = self._clean_stream_txn(txn_obj)
+                    if txn is not None:
+                        yield txn
+                pending = []
+
+        for txn_obj in pending:
+            txn = self._clean_stream_txn(txn_obj)
+            if txn is not None:
+                yield txn
+
+        if self.start_date is None:
+            # See QifConverter._set_date_range().
+            self.start_date = strftime("%Y%m%d", localtime())
+            self.end_date   = self.start_date
+
+    def write_ofx102(self, output):
+        """Writes the statement as OFX/1.02 to the text file object
+        'output'.  Transactions are spooled to a temporary file until the
+        statement dates are known.  Returns the number of transactions."""
+        log.debug("Making OFX/1.02.")
+        with stage(self.instrument, "ofx102") as timer, \
+                tempfile.TemporaryFile("w+") as spool:
+            count = 0
+            for txn in self.transactions():
+                spool.write(self._ofx_txn(txn))
+                count += 1
+            timer.count = count
+
+            document = DOCUMENT(self._ofx_header(),
+                                OFX(self._ofx_signon(),
+                                    self._ofx_stmt()))
+            (head, tail) = document.split(_TXNS_MARKER)
+            output.write(head)
+            spool.seek(0)
+            shutil.copyfileobj(spool, output)
+            output.write(tail)
+        return count
+
+    def to_ofx102(self):
+        output = io.StringIO()
+        self.write_ofx102(output)
+        return output.getvalue()
+
+    def rows(self):
+        """Yields the transactions as ofx.columns rows, in file order, as
+        they are read."""
+        for txn in self.transactions():
+            if self.accttype == "CREDITCARD":
+                bankid = None
+            else:
+                bankid = self.bankid
+            yield make_row(fitid=txn.get("ID"), date=txn.get("Date"),
+                           amount=txn.get("Amount"), type=txn.get("Type"),
+                           payee=txn.get("Payee"), memo=txn.get("Memo"),
+                           checknum=txn.get("Number"), bankid=bankid,
+                           acctid=self.acctid, accttype=self.accttype)
+
+    def _ofx_txns(self):
+        return BANKTRANLIST(
+            DTSTART(self.start_date),
+            DTEND(self.end_date),
+            _TXNS_MARKER)
+
+    def _clean_stream_txn(self, txn_obj):
+        try:
+            txn = self._clean_txn(txn_obj)
+        except ValueError:
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Skipping transaction '%s'.", txn_obj.asDict())
+            return None
+
+        txn_date = txn["Date"]
+        if self.start_date is None or txn_date < self.start_date:
+            self.start_date = txn_date
+        if self.end_date is None or txn_date > self.end_date:
+            self.end_date = txn_date
+
+        # Content IDs are the same as QifConverter's.
+        self._set_content_id(self._stream_ids, txn)
+        return txn
+
+    def _parsed_transactions(self):
+        for (header, record) in self._records():
+            try:
+                parsed = self.parser.parse(header + "\n" + record, parse_all=True)
+            except ParseException:
+                log.debug("Skipping unreadable record:\n%s", record)
+                continue
+            for txn_obj in self._extract_txn_list(parsed):
+                yield txn_obj
+
+    def _records(self):
+        # Yields (type header, raw record) for each record of the
+        # transaction sections, dealing with the header trouble that
+        # QifConverter._clean_header() fixes up along the way.
+        header   = None
+        preamble = []
+        lines    = []
+        skipping = False
+        for line in self.stream:
+            field = line.lstrip(" \t\r\n")
+            if skipping:
+                # Inside an account block, which runs to its first "^".
+                skipping = not field.startswith("^")
+                continue
+
+            if field.startswith("!"):
+                name = field.rstrip().lower()
+                if name.startswith("!account"):
+                    skipping = True
+                    continue
+                elif name.startswith("!option"):
+                    continue
+                elif name == "!" and header is None:
+                    # Some joker British bank starts QIF with a single bang
+                    # and nothing else.
+                    field = "!Type:Bank"
+                elif not name.startswith("!type") or \
+                        name.startswith(("!type:cat", "!type:class")):
+                    # Category and class lists end the transactions.
+                    break
+
+                if header is None:
+                    # Whatever came before the first type header is junk.
+                    self._set_accttype(field.rstrip())
+                    preamble = None
+                    lines = []
+                header = field.rstrip()
+                continue
+
+            lines.append(line)
+            if not field.startswith("^"):
+                continue
+            record = "".join(lines)
+            lines = []
+            if header is not None:
+                yield (header, record)
+                continue
+
+            preamble.append(record)
+            if len(preamble) > self.lookahead:
+                header = self._headerless()
+                for record in preamble:
+                    yield (header, record)
+                preamble = None
+        else:
+            # The last record may have no "^" after it; close it, as
+            # QifConverter._close_last_record() does.
+            record = "".join(lines).rstrip()
+            if record:
+                log.debug("Closing unterminated last record.")
+                record += "\n^\n"
+                if header is not None:
+                    yield (header, record)
+                else:
+                    preamble.append(record)
+
+        if header is None:
+            header = self._headerless()
+            for record in preamble:
+                yield (header, record)
+
+    def _headerless(self):
+        # Chase does not provide a Type header, so force one in the
+        # case where it is omitted.
+        log.debug("Forcing bank type header.")
+        self._set_accttype("!Type:Bank")
+        return "!Type:Bank"
+
+    def _set_accttype(self, header):
+        self._extract_txn_list(self.parser.parse(header + "\n", parse_all=True))
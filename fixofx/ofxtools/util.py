@@ -1,8 +1,11 @@
 #coding: utf-8
 import re
 
+# Tag names can't contain '<', which keeps a failed match from running past
+# the next tag, and so keeps the search linear in the length of the text.
+_empty_tag_re = re.compile(r'<(?P<tag>[^<>]+)>\s*</(?P=tag)>')
+
 def strip_empty_tags(ofx):
     """Strips open/close tags that have no content."""
-    strip_search = '<(?P<tag>[^>]+)>\s*</(?P=tag)>'
-    return re.sub(strip_search, '', ofx)
+    return _empty_tag_re.sub('', ofx)
 
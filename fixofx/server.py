@@ -0,0 +1,348 @@
+#coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+#  fixofx.server - a resident converter speaking newline-delimited JSON.
+#
+
+import json
+import logging
+import os
+import socketserver
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from pyparsing import ParseException
+
+from fixofx.conversion import HINTS, _parser, convert
+from fixofx.ofx import Budget, BudgetExceeded, Parser
+from fixofx.ofxtools.iif_parser import IifParser
+from fixofx.ofxtools.ofc_parser import OfcParser
+from fixofx.ofxtools.qif_parser import QifParser
+
+log = logging.getLogger(__name__)
+
+
+def _warm_up():
+    # Build this process's parsers before the first job needs them.
+    for parser_class in (Parser, OfcParser, QifParser, IifParser):
+        _parser(parser_class)
+
+
+def _ping():
+    return os.getpid()
+
+
+def _run_job(data, hints, limits, cache=None):
+    # Runs one conversion, in the server process or a worker, and returns
+    # the body of its reply.
+    started = perf_counter()
+    try:
+        with Budget(**limits) as budget:
+            budget.check_size(data)
+            result = convert(data, hints=hints, instrument=budget, cache=cache)
+    except ParseException as detail:
+        reply = { "ok": False, "error": "parse", "message": str(detail) }
+    except BudgetExceeded as detail:
+        reply = { "ok": False, "error": "budget", "message": str(detail) }
+    except (TypeError, ValueError) as detail:
+        reply = { "ok": False, "error": "unsupported", "message": str(detail) }
+    else:
+        reply = { "ok"          : True,
+                  "ofx"         : result.ofx,
+                  "filetype"    : result.filetype,
+                  "date_format" : result.date_format,
+                  "txn_count"   : result.txn_count }
+        if result.bankids is not None:
+            reply["bankids"] = dict((bankid, check._asdict())
+                                    for (bankid, check) in result.bankids.items())
+    reply["convert_seconds"] = round(perf_counter() - started, 6)
+    return reply
+
+
+class _Done:
+    # An already-finished job, standing in for a Future when the server
+    # converts in its own process.  Like a Future, it keeps an exception
+    # the job raised and raises it again from result(), so that a job
+    # that fails unexpectedly gets an "internal" reply here too.
+    def __init__(self, function, *args):
+        self._exception = None
+        try:
+            self._result = function(*args)
+        except Exception as detail:
+            self._result = None
+            self._exception = detail
+
+    def result(self):
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def add_done_callback(self, callback):
+        callback(self)
+
+
+class Server:
+    """Converts jobs read as newline-delimited JSON from a stream or a Unix
+    socket, writing one JSON reply line per job.  A job looks like
+
+        {"id": 7, "data": "<file contents>", "hints": {"acctid": "1234"}}
+
+    with "file" in place of "data" for a file in the directory 'files'
+    (relative to it, or an absolute path inside it).  Without 'files',
+    "file" jobs are refused: a client on the socket could otherwise read
+    any file the server can.  The hints are those of fixofx.convert(); 'hints' given to the
+    Server are defaults that each job's own hints override.  The reply
+    echoes the job's id and has "ok", then either "ofx", "filetype",
+    "date_format" and "txn_count" (and with the "check_bankid" hint,
+    "bankids", mapping each BANKID to its "valid", "type" and "region"),
+    or "error" ("request", "parse",
+    "unsupported", "budget" or "internal") and "message".  Every reply carries
+    "latency", the seconds from reading the job to writing the reply, and
+    "convert_seconds", the part of that spent converting.
+
+    With 'workers', jobs run in that many worker processes, each with
+    its parsers built ahead of time, and clients may pipeline: jobs are
+    read and handed out without waiting for earlier ones, up to
+    'max_pending' at a time, and replies come back as jobs finish, which
+    need not be the order they were sent in.  Without workers, jobs run
+    one at a time in the server process.  'limits' are Budget keyword
+    arguments (max_bytes, max_seconds, max_memory) applied to each job.
+    With 'cache', an ofx.ConversionCache, jobs seen before are answered
+    from the cache, which the workers share."""
+
+    def __init__(self, hints=None, workers=None, max_pending=None, limits=None,
+                 cache=None, files=None):
+        unknown = set(hints or ()) - set(HINTS)
+        if unknown:
+            raise ValueError("Unknown conversion hints: %s" % ", ".join(sorted(unknown)))
+        self.hints    = dict(hints or ())
+        self.workers  = workers
+        self.limits   = dict(limits or ())
+        self.cache    = cache
+        self.files    = files
+        if max_pending is None:
+            max_pending = 4 * (workers or 1)
+        self.max_pending = max_pending
+        self.executor = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def start(self):
+        """Starts the worker processes, if any, and waits until they are
+        ready to convert."""
+        if self.workers and self.executor is None:
+            self.executor = ProcessPoolExecutor(self.workers, initializer=_warm_up)
+            pings = [self.executor.submit(_ping) for index in range(self.workers)]
+            log.debug("Started workers %s.", sorted(set(ping.result() for ping in pings)))
+        else:
+            _warm_up()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def serve_stream(self, rfile, wfile):
+        """Reads jobs from the binary file 'rfile' until it ends, writing
+        replies to the binary file 'wfile', and returns once every job
+        has been answered."""
+        lock    = threading.Lock()
+        pending = threading.BoundedSemaphore(self.max_pending)
+        idle    = threading.Condition(lock)
+        running = [0]
+
+        def write(reply, received):
+            reply["latency"] = round(perf_counter() - received, 6)
+            line = json.dumps(reply).encode("utf-8") + b"\n"
+            with lock:
+                wfile.write(line)
+                wfile.flush()
+
+        def finished(job_id, received):
+            def callback(future):
+                try:
+                    reply = future.result()
+                except Exception as detail:
+                    # A worker that died, or a job that failed in a way
+                    # _run_job doesn't expect.
+                    log.exception("Job %r failed.", job_id)
+                    reply = { "ok": False, "error": "internal",
+                              "message": str(detail) }
+                reply["id"] = job_id
+                try:
+                    write(reply, received)
+                finally:
+                    with lock:
+                        running[0] -= 1
+                        idle.notify_all()
+                    pending.release()
+            return callback
+
+        for line in rfile:
+            if not line.strip():
+                continue
+            received = perf_counter()
+            job_id = None
+            try:
+                job = json.loads(line.decode("utf-8"))
+                job_id = job.get("id")
+                (data, hints) = self._read_job(job)
+            except (ValueError, TypeError, AttributeError, OSError) as detail:
+                write({ "id": job_id, "ok": False, "error": "request",
+                        "message": str(detail) }, received)
+                continue
+
+            pending.acquire()
+            with lock:
+                running[0] += 1
+            if self.executor is not None:
+                future = self.executor.submit(_run_job, data, hints, self.limits,
+                                              self.cache)
+            else:
+                future = _Done(_run_job, data, hints, self.limits, self.cache)
+            future.add_done_callback(finished(job_id, received))
+
+        with lock:
+            while running[0]:
+                idle.wait()
+
+    def socket_server(self, path):
+        """Returns a socketserver listening on the Unix socket 'path' (which
+        is replaced if it exists), serving each connection as a stream of
+        jobs.  Connections share the workers."""
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                server.serve_stream(self.rfile, self.wfile)
+
+        if os.path.exists(path):
+            os.unlink(path)
+        listener = socketserver.ThreadingUnixStreamServer(path, Handler)
+        listener.daemon_threads = True
+        return listener
+
+    def serve_socket(self, path):
+        """Serves jobs on the Unix socket 'path' until interrupted."""
+        listener = self.socket_server(path)
+        try:
+            listener.serve_forever()
+        finally:
+            listener.server_close()
+            os.unlink(path)
+
+    def _read_job(self, job):
+        if not isinstance(job, dict):
+            raise ValueError("A job must be a JSON object.")
+        hints = dict(self.hints)
+        hints.update(job.get("hints") or {})
+        unknown = set(hints) - set(HINTS)
+        if unknown:
+            raise ValueError("Unknown conversion hints: %s" % ", ".join(sorted(unknown)))
+
+        if "data" in job:
+            data = job["data"]
+            if not isinstance(data, str):
+                raise ValueError("A job's data must be a string.")
+        elif "file" in job:
+            with open(self._job_path(job["file"]), encoding="latin-1") as source:
+                data = source.read()
+        else:
+            raise ValueError("A job needs 'data' or 'file'.")
+        return (data, hints)
+
+    def _job_path(self, name):
+        if self.files is None:
+            raise ValueError("This server doesn't take 'file' jobs.")
+        root = os.path.realpath(self.files)
+        path = os.path.realpath(os.path.join(root, name))
+        if os.path.commonpath([root, path]) != root:
+            raise ValueError("'%s' is outside the server's files directory." % name)
+        return path
+
+
+def main(argv=None):
+    """The fixofx-serve command: a Server on STDIN and STDOUT, or on a Unix
+    socket, until interrupted.  (ofxfix.py --serve does the same, taking
+    the default hints as ofxfix.py options.)"""
+    from optparse import OptionParser
+
+    parser = OptionParser(usage="%prog [options]",
+                          description="Converts newline-delimited JSON jobs from "
+                          "STDIN (or a Unix socket), writing replies to STDOUT.")
+    parser.add_option("--socket", dest="socket", default=None, metavar="PATH",
+                      help="take jobs on the Unix socket PATH")
+    parser.add_option("--workers", dest="workers", type="int", default=None,
+                      metavar="N", help="convert in N worker processes")
+    parser.add_option("--files", dest="files", default=None, metavar="DIR",
+                      help="allow \"file\" jobs for files in DIR")
+    parser.add_option("--hints", dest="hints", default=None, metavar="JSON",
+                      help="default hints for every job, as a JSON object")
+    parser.add_option("--cache", dest="cache", default=None, metavar="DIR",
+                      help="keep conversions in DIR, and reuse them")
+    parser.add_option("--cache-size", dest="cache_size", type="int",
+                      default=256 * 1024 * 1024, metavar="BYTES",
+                      help="(--cache only) evict the least recently used "
+                      "conversions beyond BYTES")
+    parser.add_option("--max-size", dest="max_size", type="int", default=None,
+                      metavar="BYTES", help="refuse jobs larger than BYTES")
+    parser.add_option("--max-time", dest="max_time", type="float", default=None,
+                      metavar="SECONDS", help="give up on a job after SECONDS (a long call into "
+                      "C, such as a regular expression match, finishes first)")
+    parser.add_option("--max-memory", dest="max_memory", type="int", default=None,
+                      metavar="BYTES", help="give up on a job that grows memory by BYTES")
+    parser.add_option("-d", "--debug", action="store_true", dest="debug",
+                      default=False, help="log debugging output to STDERR")
+    (options, args) = parser.parse_args(argv)
+
+    logging.basicConfig(stream=sys.stderr,
+                        level=logging.DEBUG if options.debug else logging.WARNING,
+                        format="%(name)s: %(message)s")
+    try:
+        hints = json.loads(options.hints) if options.hints else None
+    except ValueError as detail:
+        parser.error("--hints isn't JSON: %s" % detail)
+    cache = None
+    if options.cache:
+        from fixofx.ofx.cache import ConversionCache
+        cache = ConversionCache(options.cache, max_bytes=options.cache_size)
+    limits = { "max_bytes"   : options.max_size,
+               "max_seconds" : options.max_time,
+               "max_memory"  : options.max_memory }
+    try:
+        server = Server(hints=hints, workers=options.workers, limits=limits,
+                        cache=cache, files=options.files)
+    except (ValueError, TypeError) as detail:
+        parser.error(str(detail))
+    with server:
+        try:
+            if options.socket:
+                server.serve_socket(options.socket)
+            else:
+                server.serve_stream(sys.stdin.buffer, sys.stdout.buffer)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
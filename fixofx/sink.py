@@ -0,0 +1,221 @@
+#coding: utf-8
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+#  fixofx.sink - bulk-load converted transactions into SQLite.
+#
+
+import logging
+import sqlite3
+import sys
+from itertools import islice
+from time import gmtime, perf_counter, strftime
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    id        INTEGER PRIMARY KEY,
+    bankid    TEXT NOT NULL,
+    acctid    TEXT NOT NULL,
+    accttype  TEXT NOT NULL,
+    UNIQUE (bankid, acctid, accttype)
+);
+CREATE TABLE IF NOT EXISTS statements (
+    id        INTEGER PRIMARY KEY,
+    account   INTEGER NOT NULL REFERENCES accounts (id),
+    source    TEXT,
+    filetype  TEXT,
+    imported  TEXT NOT NULL,
+    dtstart   TEXT,
+    dtend     TEXT,
+    txn_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    account   INTEGER NOT NULL REFERENCES accounts (id),
+    fitid     TEXT,
+    statement INTEGER NOT NULL REFERENCES statements (id),
+    date      TEXT,
+    amount    TEXT,
+    type      TEXT,
+    payee     TEXT,
+    memo      TEXT,
+    checknum  TEXT,
+    PRIMARY KEY (account, fitid)
+);
+"""
+
+# A FITID seen again for the same account replaces the earlier row, so
+# importing a file twice (or overlapping statements) leaves one copy.
+_INSERT = ("INSERT OR REPLACE INTO transactions (account, fitid, statement, date,"
+           " amount, type, payee, memo, checknum) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+
+class SqliteSink:
+    """Writes transaction rows (as made by fixofx.transactions()) into an
+    SQLite database of accounts, statements and transactions.
+
+    Each call to write() or load() is one database transaction: a file
+    is either all in or not in at all.  Rows go in with executemany() in
+    batches of 'batch_size', so memory stays flat however long the file.
+    Transactions are keyed by (account, FITID), and a re-imported FITID
+    replaces the old row; rows without a FITID can't be matched up, and
+    are always added.
+
+    'database' is a path or an open sqlite3 connection; a connection is
+    left open by close(), with its isolation_level as it was.  With 'fast',
+    the database is put in WAL mode with relaxed syncing, which is much
+    quicker for bulk loads and still safe against application crashes
+    (though not against power loss)."""
+
+    def __init__(self, database, batch_size=10000, fast=True):
+        if isinstance(database, sqlite3.Connection):
+            self.connection = database
+            self._owned     = False
+        else:
+            self.connection = sqlite3.connect(database)
+            self._owned     = True
+        # Transactions are begun and committed explicitly; the caller's
+        # setting is put back by close().
+        self._isolation_level = self.connection.isolation_level
+        self.connection.isolation_level = None
+        self.batch_size = batch_size
+        if fast:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self._accounts = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        if self._owned:
+            self.connection.close()
+        else:
+            self.connection.isolation_level = self._isolation_level
+
+    def load(self, data, hints=None, source=None, debug=False, instrument=None):
+        """Converts 'data' (anything fixofx.convert() takes) and writes its
+        transactions, returning the number written.  'source' (a file
+        name, say) is recorded with each statement."""
+        from fixofx.conversion import transactions
+        rows = transactions(data, hints=hints, debug=debug, instrument=instrument)
+        return self.write(rows, source=source,
+                          filetype=(hints or {}).get("filetype"))
+
+    def write(self, rows, source=None, filetype=None):
+        """Writes 'rows' in one database transaction, with a statement for
+        each account they belong to, and returns the number written.  If
+        anything goes wrong, none of them are."""
+        cursor = self.connection.cursor()
+        cursor.execute("BEGIN")
+        try:
+            statements = {}
+            values = self._values(rows, cursor, statements, source, filetype)
+            count = 0
+            while True:
+                batch = list(islice(values, self.batch_size))
+                if not batch:
+                    break
+                cursor.executemany(_INSERT, batch)
+                count += len(batch)
+            cursor.executemany("UPDATE statements SET txn_count = ?, dtstart = ?,"
+                               " dtend = ? WHERE id = ?",
+                               [(stats[1], stats[2], stats[3], stats[0])
+                                for stats in statements.values()])
+            cursor.execute("COMMIT")
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            # Accounts made in the rolled-back transaction are gone again.
+            self._accounts = {}
+            raise
+        log.debug("Wrote %d transactions for %d accounts.", count, len(statements))
+        return count
+
+    def _values(self, rows, cursor, statements, source, filetype):
+        # Yields the insert parameters for each row, making accounts and
+        # statements as they turn up.  'statements' maps account ids to
+        # [statement id, count, first date, last date].
+        imported = strftime("%Y%m%d%H%M%S", gmtime())
+        last_key = None
+        for row in rows:
+            key = (row["bankid"] or "", row["acctid"] or "", row["accttype"] or "")
+            if key != last_key:
+                account = self._account(cursor, key)
+                stats = statements.get(account)
+                if stats is None:
+                    cursor.execute("INSERT INTO statements (account, source, filetype,"
+                                   " imported) VALUES (?, ?, ?, ?)",
+                                   (account, source, filetype, imported))
+                    stats = statements[account] = [cursor.lastrowid, 0, None, None]
+                last_key = key
+
+            date = row["date"]
+            if date is not None:
+                if stats[2] is None or date < stats[2]:
+                    stats[2] = date
+                if stats[3] is None or date > stats[3]:
+                    stats[3] = date
+            stats[1] += 1
+            yield (account, row["fitid"], stats[0], date, row["amount"],
+                   row["type"], row["payee"], row["memo"], row["checknum"])
+
+    def _account(self, cursor, key):
+        account = self._accounts.get(key)
+        if account is None:
+            cursor.execute("INSERT OR IGNORE INTO accounts (bankid, acctid, accttype)"
+                           " VALUES (?, ?, ?)", key)
+            cursor.execute("SELECT id FROM accounts WHERE bankid = ? AND acctid = ?"
+                           " AND accttype = ?", key)
+            account = self._accounts[key] = cursor.fetchone()[0]
+        return account
+
+
+def _benchmark_rows(count, accounts=10):
+    for index in range(count):
+        yield { "fitid"    : "%012d" % index,
+                "date"     : "2009%02d%02d" % (index % 12 + 1, index % 28 + 1),
+                "amount"   : "%d.%02d" % (index % 1000 - 500, index % 100),
+                "type"     : "DEBIT",
+                "payee"    : "Payee %d" % (index % 5000),
+                "memo"     : None,
+                "checknum" : None,
+                "bankid"   : "123456789",
+                "acctid"   : "%010d" % (index % accounts),
+                "accttype" : "CHECKING" }
+
+
+def benchmark(count=1000000, database=":memory:", batch_size=10000):
+    """Writes 'count' made-up rows into 'database', then writes them
+    again (all updates), and returns the rows per second of each pass."""
+    rates = []
+    with SqliteSink(database, batch_size=batch_size) as sink:
+        for attempt in range(2):
+            started = perf_counter()
+            sink.write(_benchmark_rows(count))
+            rates.append(count / (perf_counter() - started))
+    return rates
+
+
+if __name__ == "__main__":
+    # python -m fixofx.sink [ROWS [DATABASE]]
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    database = sys.argv[2] if len(sys.argv) > 2 else ":memory:"
+    (insert, upsert) = benchmark(count, database)
+    print("%d rows: %.0f rows/s inserted, %.0f rows/s re-imported" %
+          (count, insert, upsert))
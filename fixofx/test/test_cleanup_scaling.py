@@ -0,0 +1,59 @@
+#coding: utf-8
+import time
+import unittest
+
+from fixofx.ofx import Parser
+from fixofx.ofxtools.ofc_parser import OfcParser
+from fixofx.ofxtools.qif_converter import QifConverter
+from fixofx.ofxtools.util import strip_empty_tags
+
+
+def best_time(function, text, repeat=3):
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function(text)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+class CleanupScalingTests(unittest.TestCase):
+    """Runs each text cleanup step over hostile input and over four times
+    as much of it.  Linear steps take about four times as long; a step
+    that backtracks quadratically takes sixteen times as long (or, on
+    inputs this size, effectively forever)."""
+
+    size = 20000
+
+    def assertLinear(self, function, unit):
+        small = best_time(function, unit * self.size)
+        large = best_time(function, unit * (self.size * 4))
+        # Allow for timer noise on very fast steps.
+        self.assertTrue(large < small * 8 + 0.01,
+                        "%s took %.4fs on %d bytes but %.4fs on four times that." %
+                        (function.__name__, small, len(unit) * self.size, large))
+
+    def test_ofc_cleanup(self):
+        parser = OfcParser()
+        for unit in ("word ", "a</", "<LEDGER>\n", "x" * 50 + "</a>\n"):
+            self.assertLinear(parser.remove_inline_closing_tags, unit)
+            self.assertLinear(parser.add_zero_to_empty_ledger_tag, unit)
+
+    def test_empty_tags(self):
+        for unit in ("<", "<a", "<a> ", "<a>\n"):
+            self.assertLinear(strip_empty_tags, unit)
+
+    def test_close_tags(self):
+        parser = Parser()
+        for unit in ("<", "<a", "<a> ", " \n", "<a>x </b"):
+            self.assertLinear(parser.strip_close_tags, unit)
+
+    def test_qif_header(self):
+        def convert(junk):
+            return QifConverter(junk + "\n!Type:Bank\n")
+        self.assertLinear(convert, "junk\n")
+        self.assertLinear(convert, "!Account\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
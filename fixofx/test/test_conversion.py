@@ -0,0 +1,119 @@
+#coding: utf-8
+import io
+import shutil
+import tempfile
+import threading
+import unittest
+
+import fixofx
+from fixofx.conversion import _parser
+from fixofx.ofx import ConversionCache, RoutingCheck, check_routing_number
+from fixofx.ofxtools.qif_parser import QifParser
+from fixofx.test.ofx_test_utils import get_checking_stmt
+from fixofx.test.test_ofxtools_qif_converter import make_statement
+
+
+class ConvertTests(unittest.TestCase):
+    def setUp(self):
+        self.qif = make_statement(20)
+
+    def test_inputs(self):
+        expected = fixofx.convert(self.qif).ofx
+        self.assertEqual(expected, fixofx.convert(self.qif.encode("latin-1")).ofx)
+        self.assertEqual(expected, fixofx.convert(io.StringIO(self.qif)).ofx)
+        self.assertEqual(expected, fixofx.convert(io.BytesIO(self.qif.encode("latin-1"))).ofx)
+        self.assertRaises(TypeError, fixofx.convert, 42)
+
+    def test_qif(self):
+        result = fixofx.convert(self.qif, hints={"acctid": "1234", "org": "Test Bank"})
+        self.assertEqual("QIF", result.filetype)
+        self.assertEqual("MM/DD/YY", result.date_format)
+        # One of the records is a Home Depot duplicate, which is dropped.
+        self.assertEqual(19, result.txn_count)
+        self.assertTrue("<ACCTID>1234</ACCTID>" in result.ofx)
+        self.assertTrue("<ORG>Test Bank</ORG>" in result.ofx)
+
+        dayfirst = fixofx.convert(self.qif.replace("D01/12/2009", "D25/12/2009"))
+        self.assertEqual("DD/MM/YY", dayfirst.date_format)
+
+        # The OFX/1.02 the QIF went through, if asked for.
+        self.assertEqual(None, result.ofx102)
+        kept = fixofx.convert(self.qif, ofx102=True)
+        self.assertEqual(fixofx.convert(self.qif).ofx, kept.ofx)
+        self.assertTrue(kept.ofx102.startswith("OFXHEADER:100"))
+        self.assertEqual(19, kept.ofx102.count("<STMTTRN>"))
+
+    def test_ofx(self):
+        result = fixofx.convert(get_checking_stmt())
+        self.assertEqual("OFX/1.02", result.filetype)
+        self.assertEqual(None, result.date_format)
+        self.assertEqual(result.txn_count, result.ofx.count("</STMTTRN>"))
+        self.assertTrue(result.txn_count > 0)
+
+        # OFX 2 passes through, less blank lines.
+        passed = fixofx.convert(result.ofx)
+        self.assertEqual("OFX/2.00", passed.filetype)
+        self.assertEqual(result.ofx.strip(), passed.ofx)
+        self.assertEqual(None, fixofx.convert(get_checking_stmt(), ofx102=True).ofx102)
+
+        # A known type skips the guess.
+        hinted = fixofx.convert(get_checking_stmt(), hints={"filetype": "OFX/1.03"})
+        self.assertEqual("OFX/1.03", hinted.filetype)
+
+    def test_bad_hints(self):
+        self.assertRaises(ValueError, fixofx.convert, self.qif, hints={"acctnum": "1"})
+        self.assertRaises(TypeError, fixofx.convert, self.qif, hints={"filetype": "XLS"})
+
+    def test_check_bankid(self):
+        self.assertEqual(None, fixofx.convert(self.qif).bankids)
+        self.assertEqual({}, fixofx.convert(self.qif, hints={"check_bankid": True}).bankids)
+
+        hints = {"bankid": "314074269", "check_bankid": True}
+        result = fixofx.convert(self.qif, hints=hints)
+        self.assertEqual({"314074269": RoutingCheck(True, "Thrift", "Dallas")}, result.bankids)
+        hits = check_routing_number.cache_info().hits
+        fixofx.convert(self.qif, hints=hints)
+        self.assertEqual(hits + 1, check_routing_number.cache_info().hits)
+
+        # BANKIDs from the file itself, and from the cache.
+        ofx = fixofx.convert(get_checking_stmt(), hints={"check_bankid": True})
+        # 987987987 passes the checksum, but 98 is no prefix in use.
+        self.assertEqual({"987987987": RoutingCheck(True, None, None)}, ofx.bankids)
+        directory = tempfile.mkdtemp()
+        try:
+            cache = ConversionCache(directory)
+            for attempt in range(2):
+                cached = fixofx.convert(self.qif, hints=hints, cache=cache)
+                self.assertEqual(result.bankids, cached.bankids)
+            self.assertEqual(1, cache.hits)
+        finally:
+            shutil.rmtree(directory)
+
+        # Rows carry the BANKID as is; transactions() can't report on it.
+        self.assertRaises(ValueError, fixofx.transactions, self.qif, hints=hints)
+        rows = list(fixofx.transactions(self.qif, hints={"bankid": "314074269"}))
+        self.assertEqual("314074269", rows[0]["bankid"])
+
+    def test_parsers_per_thread(self):
+        parser = _parser(QifParser)
+        self.assertTrue(parser is _parser(QifParser))
+        self.assertFalse(parser is _parser(QifParser, debug=True))
+
+        expected = fixofx.convert(self.qif).ofx
+        results = []
+        parsers = []
+        def work():
+            parsers.append(_parser(QifParser))
+            for index in range(5):
+                results.append(fixofx.convert(self.qif).ofx)
+        threads = [threading.Thread(target=work) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([expected] * 20, results)
+        self.assertEqual(5, len(set(id(each) for each in parsers + [parser])))
+
+
+if __name__ == '__main__':
+    unittest.main()
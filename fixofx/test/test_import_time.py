@@ -0,0 +1,96 @@
+#coding: utf-8
+import os
+import subprocess
+import sys
+import unittest
+
+import fixofx.ofx
+from fixofx.ofx import builder
+from fixofx.ofx.builder import STMTTRN
+from fixofx.ofx.response import Response
+from fixofx.test.test_ofxtools_qif_converter import make_statement
+
+ROOT   = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+OFXFIX = os.path.join(ROOT, "bin", "ofxfix.py")
+
+
+def import_times(*args, stdin=""):
+    """Runs ofxfix.py under 'python -X importtime' and returns a dict of
+    the cumulative import time, in seconds, of each module it loaded."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([ROOT] + env.get("PYTHONPATH", "").split(os.pathsep))
+    process = subprocess.run([sys.executable, "-X", "importtime", "-W", "ignore",
+                              OFXFIX] + list(args),
+                             input=stdin.encode("latin-1"), env=env,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    times = {}
+    for line in process.stderr.decode("utf-8", "replace").splitlines():
+        if not line.startswith("import time:"):
+            continue
+        (self_time, cumulative, module) = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[module.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def fixofx_time(times):
+    # Nested imports are counted twice, which is fine for an upper bound.
+    return sum(seconds for (module, seconds) in times.items()
+               if module.startswith("fixofx"))
+
+
+class ImportTimeTests(unittest.TestCase):
+    """Start-up cost regression checks: what ofxfix.py imports for a file
+    type query and for a plain QIF conversion, and how long the fixofx
+    package takes to import in each case.  The time targets are loose,
+    well above what either takes, to catch modules that creep back in
+    eagerly rather than to benchmark the machine."""
+
+    def setUp(self):
+        self.qif = make_statement(10)
+
+    def test_type_query(self):
+        times = import_times("--type", stdin=self.qif)
+        self.assertTrue("fixofx.ofx.filetyper" in times)
+        for module in ("pyparsing", "dateutil", "urllib.request", "asyncio",
+                       "fixofx.conversion", "fixofx.ofx.builder",
+                       "fixofx.ofx.parser", "fixofx.ofx.client",
+                       "fixofx.ofxtools.qif_converter"):
+            self.assertFalse(module in times, "%s was imported" % module)
+        self.assertTrue(fixofx_time(times) < 0.1)
+
+    def test_qif_conversion(self):
+        times = import_times(stdin=self.qif)
+        self.assertTrue("fixofx.ofxtools.qif_converter" in times)
+        for module in ("asyncio", "concurrent.futures.process",
+                       "fixofx.ofx.client", "fixofx.ofx.async_client",
+                       "fixofx.ofx.generator", "fixofx.ofxtools.ofc_converter",
+                       "fixofx.ofxtools.iif_converter"):
+            self.assertFalse(module in times, "%s was imported" % module)
+        self.assertTrue(fixofx_time(times) < 0.5)
+
+    def test_lazy_attributes(self):
+        self.assertTrue(fixofx.ofx.Response is Response)
+        self.assertTrue(fixofx.ofx.STMTTRN is STMTTRN)
+        self.assertTrue("Client" in dir(fixofx.ofx))
+        self.assertRaises(AttributeError, getattr, fixofx.ofx, "Missing")
+        self.assertRaises(AttributeError, getattr, fixofx.ofx, "NOTATAG")
+
+    def test_star_import(self):
+        # Everything 'from fixofx.ofx import *' gave when the package
+        # imported it all up front.
+        names = {}
+        exec("from fixofx.ofx import *", names)
+        for name in ("Account", "Client", "Document", "Error", "FileTyper",
+                     "Generator", "Institution", "Parser", "Request", "Response",
+                     "RoutingNumber", "Statement", "Transaction", "account",
+                     "builder", "client", "document", "error", "filetyper",
+                     "generator", "institution", "parser", "request", "response",
+                     "validators") + tuple(builder.__all__):
+            self.assertTrue(name in names, "%s was not imported" % name)
+        self.assertTrue(names["STMTTRN"] is STMTTRN)
+        self.assertTrue(names["Response"] is Response)
+
+
+if __name__ == '__main__':
+    unittest.main()
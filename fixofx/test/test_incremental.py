@@ -0,0 +1,83 @@
+#coding: utf-8
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import fixofx
+from fixofx.incremental import ImportIndex, txn_key
+from fixofx.test.ofx_test_utils import get_checking_stmt
+from fixofx.test.test_ofxtools_qif_converter import make_statement
+
+
+def qif_rows(count, acctid="1"):
+    return list(fixofx.transactions(make_statement(count), hints={"acctid": acctid}))
+
+
+class ImportIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "index.db")
+        self.index = ImportIndex(self.path, batch_size=4)
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.directory)
+
+    def test_overlap(self):
+        # make_statement() dates run day by day, so a longer statement
+        # overlaps a shorter one and has newer transactions too.
+        first = qif_rows(20)
+        self.assertEqual(first, list(self.index.new_rows(first)))
+        self.assertEqual([], list(self.index.new_rows(qif_rows(20))))
+
+        second = qif_rows(30)
+        seen = set(row["fitid"] for row in first)
+        self.assertEqual([row for row in second if row["fitid"] not in seen],
+                         list(self.index.new_rows(second)))
+        self.assertEqual(max(row["date"] for row in second)[:8],
+                         self.index.watermark("UNKNOWN", "1", "CHECKING"))
+
+        # Other accounts are tracked separately.
+        self.assertEqual(len(first), len(list(self.index.new_rows(qif_rows(20, "2")))))
+
+    def test_persistent(self):
+        rows = list(fixofx.transactions(get_checking_stmt()))
+        list(self.index.new_rows(rows))
+        self.index.close()
+        self.index = ImportIndex(self.path)
+        self.assertEqual([], list(self.index.new_rows(rows + rows)))
+        self.assertEqual((0, len(rows) * 2), (self.index.new, self.index.seen))
+
+    def test_connection(self):
+        db = sqlite3.connect(":memory:", isolation_level="IMMEDIATE")
+        with ImportIndex(db, fast=False) as index:
+            rows = qif_rows(10)
+            self.assertEqual(rows, list(index.new_rows(rows)))
+        self.assertEqual("IMMEDIATE", db.isolation_level)
+        self.assertEqual(len(rows), db.execute("SELECT COUNT(*) FROM import_seen").fetchone()[0])
+
+    def test_abandoned(self):
+        rows = qif_rows(20)
+        generator = self.index.new_rows(rows)
+        next(generator)
+        generator.close()
+        self.assertEqual(None, self.index.watermark("UNKNOWN", "1", "CHECKING"))
+        self.assertEqual(rows, list(self.index.new_rows(rows)))
+
+    def test_keys(self):
+        # 128 bits: 64 would make a collision, and so a dropped
+        # transaction, about one in 370,000 at ten million transactions.
+        self.assertEqual(16, len(txn_key("UNKNOWN-CHECKING-20090102-1--3.50")))
+        self.assertNotEqual(txn_key("1"), txn_key("2"))
+
+    def test_repeats(self):
+        rows = qif_rows(5)
+        nameless = dict(rows[0], fitid=None)
+        self.assertEqual(rows + [nameless, nameless],
+                         list(self.index.new_rows(rows + rows + [nameless, nameless])))
+
+
+if __name__ == '__main__':
+    unittest.main()
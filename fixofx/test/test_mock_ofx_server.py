@@ -15,6 +15,7 @@
 #
 # MockOfxServer - simple mock server for testing
 #
+import asyncio
 import urllib.request, urllib.error, urllib.parse
 from wsgi_intercept.urllib_intercept import install_opener
 import wsgi_intercept
@@ -33,19 +34,80 @@ class MockOfxServer:
         start_response(status, headers)
         if "wsgi.input" in environment:
             request_body = environment["wsgi.input"].read()
-
-            if request_body.find("<ACCTTYPE>CHECKING".encode('utf-8')) != -1:
-                return [get_checking_stmt()]
-            elif request_body.find("<ACCTTYPE>SAVINGS".encode('utf-8')) != -1:
-                return [get_savings_stmt()]
-            else:
-                return [get_creditcard_stmt()]
+            return [stmt_for_request(request_body)]
         else:
             return [get_creditcard_stmt()]
 
     def interceptor(self):
         return self.handleResponse
 
+
+def stmt_for_request(request_body):
+    if request_body.find("<ACCTTYPE>CHECKING".encode('utf-8')) != -1:
+        return get_checking_stmt()
+    elif request_body.find("<ACCTTYPE>SAVINGS".encode('utf-8')) != -1:
+        return get_savings_stmt()
+    else:
+        return get_creditcard_stmt()
+
+
+class AsyncMockOfxServer:
+    """Real keep-alive HTTP server on localhost for the asyncio client,
+    which doesn't go through urllib and so can't be intercepted.  Counts
+    the connections it accepts and the most requests it served at once;
+    'delay' holds each response back so that requests overlap."""
+    def __init__(self, delay=0.0):
+        self.delay       = delay
+        self.connections = 0
+        self.requests    = []
+        self.active      = 0
+        self.max_active  = 0
+        self.server      = None
+        self.port        = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b""):
+                        break
+                    (name, _, value) = line.decode("latin-1").partition(":")
+                    if name.lower() == "content-length":
+                        length = int(value)
+                request_body = await reader.readexactly(length)
+                self.requests.append(request_body)
+
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+                await asyncio.sleep(self.delay)
+                self.active -= 1
+
+                body = stmt_for_request(request_body)
+                writer.write(b"HTTP/1.1 200 OK\r\n"
+                             b"Content-Type: application/ofx\r\n"
+                             b"Content-Length: " + str(len(body)).encode() +
+                             b"\r\n\r\n" + body)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
 import unittest
 
 class MockOfxServerTest(unittest.TestCase):
@@ -0,0 +1,87 @@
+#coding: utf-8
+import asyncio
+import unittest
+
+from fixofx.ofx import Institution, Account, AsyncClient
+from fixofx.test.ofx_test_utils import get_creditcard_stmt, get_savings_stmt, get_checking_stmt
+from fixofx.test.test_mock_ofx_server import AsyncMockOfxServer
+
+
+class AsyncClientTests(unittest.TestCase):
+    def setUp(self):
+        self.username = "username"
+        self.password = "password"
+        self.checking_stmt = get_checking_stmt().decode('utf-8')
+        self.savings_stmt = get_savings_stmt().decode('utf-8')
+        self.creditcard_stmt = get_creditcard_stmt().decode('utf-8')
+
+    def _accounts(self, port):
+        institution = Institution(ofx_org="Test Bank", ofx_fid="99999",
+                                  ofx_url="http://127.0.0.1:%d/" % port)
+        return dict((acct_type, Account(acct_number="1122334455",
+                                        aba_number="12345678",
+                                        acct_type=acct_type,
+                                        institution=institution))
+                    for acct_type in ("Checking", "Savings", "Credit Card"))
+
+    def _run(self, test, delay=0.0, **kwargs):
+        async def main():
+            server = await AsyncMockOfxServer(delay=delay).start()
+            try:
+                async with AsyncClient(**kwargs) as client:
+                    return (server, await test(client, self._accounts(server.port)))
+            finally:
+                await server.stop()
+        return asyncio.run(main())
+
+    def test_stmt_requests(self):
+        async def test(client, accounts):
+            return [(await client.get_statement(accounts[acct_type],
+                                                self.username,
+                                                self.password)).as_string()
+                    for acct_type in ("Checking", "Savings", "Credit Card")]
+
+        (server, results) = self._run(test)
+        self.assertEqual([self.checking_stmt, self.savings_stmt,
+                          self.creditcard_stmt], results)
+        # Sequential requests share one keep-alive connection.
+        self.assertEqual(1, server.connections)
+
+    def test_account_info(self):
+        async def test(client, accounts):
+            institution = accounts["Checking"].institution
+            return await client.get_account_info(institution, self.username,
+                                                 self.password)
+
+        (server, response) = self._run(test)
+        self.assertEqual(self.creditcard_stmt, response.as_string())
+        self.assertTrue(b"<ACCTINFORQ>" in server.requests[0])
+
+    def test_concurrency_limit(self):
+        async def test(client, accounts):
+            return await asyncio.gather(
+                *[client.get_statement(accounts["Savings"], self.username,
+                                       self.password) for i in range(8)])
+
+        (server, responses) = self._run(test, delay=0.02, limit=2)
+        self.assertEqual([self.savings_stmt] * 8,
+                         [response.as_string() for response in responses])
+        self.assertEqual(2, server.max_active)
+        self.assertEqual(2, server.connections)
+
+    def test_split_windows(self):
+        async def test(client, accounts):
+            return await client.get_statement(accounts["Savings"],
+                                              self.username, self.password)
+
+        (server, response) = self._run(test, split_days=100)
+        self.assertEqual(4, len(server.requests))
+        self.assertEqual(3, len([request for request in server.requests
+                                 if b"<DTEND>" in request]))
+        # Every range returned the same transactions, so the merge is
+        # the statement itself.
+        self.assertEqual(self.savings_stmt, response.as_string())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#coding: utf-8
+import sys
+import time
+import unittest
+
+from fixofx.ofx import Budget, BudgetExceeded, TimingLog
+from fixofx.ofx.budget import recursion_limit
+from fixofx.ofx.instrument import stage
+from fixofx.ofxtools.ofc_parser import OfcParser
+from fixofx.ofxtools.qif_converter import QifConverter
+from fixofx.test.test_ofxtools_qif_converter import make_statement
+
+
+def spin(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class BudgetTests(unittest.TestCase):
+    def test_size(self):
+        text = make_statement(10)
+        with Budget(max_bytes=len(text)) as budget:
+            budget.check_size(text)
+        try:
+            with Budget(max_bytes=len(text) - 1) as budget:
+                budget.check_size(text)
+            self.fail("Expected BudgetExceeded.")
+        except BudgetExceeded as error:
+            self.assertEqual(("input", "size"), (error.stage, error.limit))
+
+    def test_time_interrupts_stage(self):
+        started = time.perf_counter()
+        try:
+            with Budget(max_seconds=0.1, interval=0.01) as budget:
+                with stage(budget, "first"):
+                    pass
+                with stage(budget, "slow"):
+                    spin(5)
+            self.fail("Expected BudgetExceeded.")
+        except BudgetExceeded as error:
+            self.assertEqual(("slow", "time"), (error.stage, error.limit))
+        self.assertTrue(time.perf_counter() - started < 2)
+
+    def test_swallowed_interruption(self):
+        # A block that swallows the interruption still goes over budget,
+        # and no interruption is left to go off after it.
+        try:
+            with Budget(max_seconds=0.05, interval=0.01):
+                try:
+                    spin(5)
+                except BaseException:
+                    pass
+            self.fail("Expected BudgetExceeded.")
+        except BudgetExceeded as error:
+            self.assertEqual("time", error.limit)
+        spin(0.2)
+
+    def test_recursion_limit_restored(self):
+        # An interruption that keeps a recursion_limit() block from
+        # cleaning up doesn't leave the limit raised.
+        limit = sys.getrecursionlimit()
+        try:
+            with Budget(max_seconds=0.05, interval=0.01):
+                raised = recursion_limit(limit + 1000)
+                raised.__enter__()
+                self.assertEqual(limit + 1000, sys.getrecursionlimit())
+                spin(5)
+            self.fail("Expected BudgetExceeded.")
+        except BudgetExceeded as error:
+            self.assertEqual("time", error.limit)
+        self.assertEqual(limit, sys.getrecursionlimit())
+        del raised
+
+    def test_time_during_conversion(self):
+        text = make_statement(5000)
+        instrument = TimingLog()
+        try:
+            with Budget(max_seconds=0.05, instrument=instrument) as budget:
+                QifConverter(text, instrument=budget).to_xml()
+            self.fail("Expected BudgetExceeded.")
+        except BudgetExceeded as error:
+            self.assertEqual("time", error.limit)
+            self.assertTrue(error.stage in ("qif_cleanup", "qif_parse",
+                                            "guess_formats", "clean_txns"))
+        # The inner instrument saw the stages that ran.
+        self.assertTrue(len(instrument.stages) > 0)
+
+    def test_within_budget(self):
+        text = make_statement(10)
+        instrument = TimingLog()
+        with Budget(max_bytes=len(text), max_seconds=60, max_memory=1 << 30,
+                    instrument=instrument) as budget:
+            xml = QifConverter(text, instrument=budget).to_xml()
+        self.assertTrue(xml.startswith("<?xml"))
+        self.assertEqual([], budget.stages)
+        self.assertTrue("format_xml" in [name for (name, elapsed, count) in instrument.stages])
+
+    def test_recursion(self):
+        limit = sys.getrecursionlimit()
+        parser = OfcParser()
+        parser.parse("<OFC>\n<ACCTSTMT>\n<STMTRS>\n<LEDGER>1\n</STMTRS>\n</ACCTSTMT>\n</OFC>")
+        self.assertEqual(limit, sys.getrecursionlimit())
+
+        nested = "<OFC>\n" + "<A>\n" * 3000 + "<B>1\n" + "</A>\n" * 3000 + "</OFC>"
+        try:
+            with Budget() as budget:
+                parser.parse(nested, instrument=budget)
+            self.fail("Expected BudgetExceeded.")
+        except BudgetExceeded as error:
+            self.assertEqual(("ofc_parse", "recursion"), (error.stage, error.limit))
+        self.assertEqual(limit, sys.getrecursionlimit())
+
+
+if __name__ == '__main__':
+    unittest.main()
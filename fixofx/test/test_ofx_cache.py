@@ -0,0 +1,204 @@
+#coding: utf-8
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+import fixofx
+from fixofx.conversion import HINTS
+from fixofx.ofx import Institution, Account, Client, Response, ResponseCache, ConversionCache
+from fixofx.test.ofx_test_utils import get_checking_stmt, get_savings_stmt
+from fixofx.test.test_mock_ofx_server import MockOfxServer
+from fixofx.test.test_ofxtools_qif_converter import make_statement
+
+
+def convert_cached(directory, max_bytes, count):
+    # Runs in a worker process.
+    cache = ConversionCache(directory, max_bytes=max_bytes)
+    for index in range(count):
+        result = fixofx.convert(make_statement(10 + index % 5), cache=cache)
+        if result.ofx != fixofx.convert(make_statement(10 + index % 5)).ofx:
+            return False
+    return True
+
+
+class CountingClient(Client):
+    def __init__(self, **kwargs):
+        Client.__init__(self, **kwargs)
+        self.posts = 0
+
+    def _post(self, url, request_body):
+        self.posts += 1
+        return Client._post(self, url, request_body)
+
+
+class ResponseCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.port = 9488
+        self.server = MockOfxServer(port=self.port)
+        self.institution = Institution(ofx_org="Test Bank", ofx_fid="99999",
+                                       ofx_url="http://localhost:%d/" % self.port)
+        self.checking = Account(acct_number="1122334455", aba_number="12345678",
+                                acct_type="Checking", institution=self.institution)
+        self.savings = Account(acct_number="1122334455", aba_number="12345678",
+                               acct_type="Savings", institution=self.institution)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        cache = ResponseCache(self.directory)
+        response = Response(get_checking_stmt())
+        cache.put("key", response)
+
+        cached = cache.get("key")
+        self.assertEqual(response.as_string(), cached.as_string())
+        self.assertEqual(response.as_xml(), cached.as_xml())
+        self.assertEqual(response.get_encoding(), cached.get_encoding())
+        self.assertEqual(response.get_statements()[0].get_balance(),
+                         cached.get_statements()[0].get_balance())
+        self.assertTrue(cached.check_signon_status())
+        self.assertEqual(None, cache.get("other"))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+    def test_lazy(self):
+        # Storing a lazy Response doesn't parse it, and what comes back
+        # is parsed only as far as it is used.
+        cache = ResponseCache(self.directory)
+        response = Response(get_checking_stmt(), lazy=True)
+        cache.put("key", response)
+        self.assertEqual(None, response._parse_dict)
+        cached = cache.get("key")
+        self.assertEqual(None, cached._parse_dict)
+        self.assertEqual(response.get_statements()[0].get_balance(),
+                         cached.get_statements()[0].get_balance())
+
+    def test_client_reuses_responses(self):
+        cache = ResponseCache(self.directory)
+        client = CountingClient(cache=cache)
+        first = client.get_bank_statement(self.checking, "user", "pass")
+        second = client.get_bank_statement(self.checking, "user", "pass")
+        self.assertEqual(1, client.posts)
+        self.assertEqual(first.as_string(), second.as_string())
+
+        # A different account, user or password is a different request.
+        client.get_bank_statement(self.savings, "user", "pass")
+        client.get_bank_statement(self.checking, "other", "pass")
+        self.assertEqual(3, client.posts)
+
+    def test_password_misses(self):
+        # A wrong password mustn't be answered with the statement fetched
+        # with the right one; nor may the password show in the key.
+        cache = ResponseCache(self.directory)
+        client = CountingClient(cache=cache)
+        client.get_bank_statement(self.checking, "user", "pass")
+        client.get_bank_statement(self.checking, "user", "wrong")
+        self.assertEqual(2, client.posts)
+        client.get_bank_statement(self.checking, "user", "pass")
+        self.assertEqual(2, client.posts)
+
+        body = "<USERID>user<USERPASS>pass<ACCTID>1"
+        key = cache.key("http://bank/", body)
+        self.assertEqual(key, ResponseCache(self.directory).key("http://bank/", body))
+        self.assertNotEqual(key, cache.key("http://bank/", body.replace("pass", "wrong")))
+        other = tempfile.mkdtemp()
+        try:
+            self.assertNotEqual(key, ResponseCache(other).key("http://bank/", body))
+        finally:
+            shutil.rmtree(other)
+
+    def test_ttl(self):
+        cache = ResponseCache(self.directory, ttl=60)
+        cache.put("key", Response(get_checking_stmt()))
+        path = os.path.join(self.directory, "key.pickle")
+        old = time.time() - 120
+        os.utime(path, (old, old))
+        self.assertEqual(None, cache.get("key"))
+        self.assertFalse(os.path.exists(path))
+
+    def test_size_eviction(self):
+        cache = ResponseCache(self.directory)
+        cache.put("first", Response(get_checking_stmt()))
+        size = os.path.getsize(os.path.join(self.directory, "first.pickle"))
+        cache.max_bytes = size * 2 + size // 2
+        cache.put("second", Response(get_savings_stmt()))
+
+        # Reading 'first' makes 'second' the least recently used.
+        past = time.time() - 10
+        os.utime(os.path.join(self.directory, "second.pickle"), (past, time.time()))
+        cache.get("first")
+        cache.put("third", Response(get_checking_stmt()))
+
+        self.assertNotEqual(None, cache.get("first"))
+        self.assertEqual(None, cache.get("second"))
+        self.assertNotEqual(None, cache.get("third"))
+
+    def test_unreadable_entry(self):
+        cache = ResponseCache(self.directory)
+        with open(os.path.join(self.directory, "key.pickle"), "wb") as entry:
+            entry.write(b"not a pickle")
+        self.assertEqual(None, cache.get("key"))
+
+
+class ConversionCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ConversionCache(self.directory)
+        self.qif = make_statement(20)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_hit(self):
+        first = fixofx.convert(self.qif, hints={"acctid": "1"}, cache=self.cache)
+        second = fixofx.convert(self.qif.encode("latin-1"), hints={"acctid": "1"},
+                                cache=self.cache)
+        self.assertEqual((first.ofx, first.filetype, first.date_format, first.txn_count),
+                         (second.ofx, second.filetype, second.date_format, second.txn_count))
+        stats = self.cache.stats()
+        self.assertEqual((1, 1, 0.5, 1), (stats["hits"], stats["misses"],
+                                          stats["hit_rate"], stats["entries"]))
+
+    def test_key(self):
+        options = dict(HINTS)
+        key = self.cache.key(self.qif, options)
+        self.assertEqual(key, self.cache.key(self.qif, dict(HINTS)))
+        self.assertNotEqual(key, self.cache.key(self.qif + "\n", options))
+        self.assertNotEqual(key, self.cache.key(self.qif, dict(options, dayfirst=True)))
+
+        fixofx.convert(self.qif, cache=self.cache)
+        fixofx.convert(self.qif, hints={"acctid": "2"}, cache=self.cache)
+        self.assertEqual((0, 2), (self.cache.hits, self.cache.misses))
+
+        version = fixofx.__version__
+        fixofx.__version__ = "0.0"
+        try:
+            self.assertNotEqual(key, self.cache.key(self.qif, options))
+        finally:
+            fixofx.__version__ = version
+
+    def test_eviction(self):
+        fixofx.convert(self.qif, cache=self.cache)
+        size = self.cache.stats()["bytes"]
+        self.cache.max_bytes = size * 2 + size // 2
+        for count in (21, 22, 23):
+            fixofx.convert(make_statement(count), cache=self.cache)
+        self.assertTrue(self.cache.stats()["bytes"] <= self.cache.max_bytes)
+        self.assertEqual(None, self.cache.get(self.cache.key(self.qif, dict(HINTS))))
+
+    def test_processes(self):
+        # Several processes sharing a small cache, storing and evicting
+        # under each other, still get correct conversions.
+        with ProcessPoolExecutor(3) as executor:
+            results = [executor.submit(convert_cached, self.directory, 20000, 15)
+                       for index in range(3)]
+            self.assertEqual([True] * 3, [result.result() for result in results])
+        self.assertEqual([], [name for name in os.listdir(self.directory)
+                              if name.endswith(".tmp")])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -11,8 +11,14 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import datetime
+import re
 import unittest
-from fixofx.ofx import Institution, Account, Client
+
+from wsgi_intercept.urllib_intercept import install_opener
+import wsgi_intercept
+
+from fixofx.ofx import Institution, Account, Client, Error
 from fixofx.test.ofx_test_utils import get_creditcard_stmt, get_savings_stmt, get_checking_stmt
 from fixofx.test.test_mock_ofx_server import MockOfxServer
 
@@ -79,5 +85,95 @@ class ClientTests(unittest.TestCase):
         self.assertEqual(creditcard_response.as_string(), self.creditcard_stmt)
     
 
+class WindowedOfxServer:
+    """Mock server that rejects statement requests covering more than
+    'max_days' days, and gives each older date range (requests with a
+    DTEND) one transaction of its own on top of the checking fixture."""
+    def __init__(self, port, max_days):
+        self.max_days = max_days
+        self.requests = []
+        install_opener()
+        wsgi_intercept.add_wsgi_intercept('localhost', port, lambda: self.respond)
+
+    def respond(self, environment, start_response):
+        start_response("200 OK", [('Content-Type', 'application/ofx')])
+        request = environment["wsgi.input"].read().decode('utf-8')
+        self.requests.append(request)
+
+        start = re.search("<DTSTART>(\\d+)", request).group(1)
+        end = re.search("<DTEND>(\\d+)", request)
+        stmt = get_checking_stmt().decode('utf-8')
+        days = (self._date(end.group(1)) if end else self._today()) - self._date(start)
+        if days.days > self.max_days:
+            # Fail the STMTTRNRS status, leaving signon alone.
+            stmt = stmt.replace("<CODE>0", "<CODE>2000", 2).replace("<CODE>2000", "<CODE>0", 1)
+        elif end is not None:
+            stmt = stmt.replace("<FITID>FAKEOFX-CHECKING-20100723-1--22.04",
+                                "<FITID>OLDER-" + end.group(1), 1)
+        return [stmt.encode('utf-8')]
+
+    def _date(self, value):
+        return datetime.datetime.strptime(value, "%Y%m%d")
+
+    def _today(self):
+        return datetime.datetime.strptime(
+            datetime.datetime.now().strftime("%Y%m%d"), "%Y%m%d")
+
+
+class ClientWindowTests(unittest.TestCase):
+    def setUp(self):
+        self.port = 9487
+        self.institution = Institution(ofx_org="Test Bank", ofx_fid="99999",
+                                       ofx_url="http://localhost:%d/" % self.port)
+        self.account = Account(acct_number="1122334455", aba_number="12345678",
+                               acct_type="Checking", institution=self.institution)
+        self.checking_stmt = get_checking_stmt().decode('utf-8')
+
+    def tearDown(self):
+        wsgi_intercept.remove_wsgi_intercept('localhost', self.port)
+
+    def test_remembers_window(self):
+        server = WindowedOfxServer(self.port, max_days=100)
+        client = Client()
+        response = client.get_bank_statement(self.account, "user", "pass")
+        self.assertEqual(self.checking_stmt, response.as_string())
+        self.assertEqual(2, len(server.requests))
+        self.assertEqual(90, client.window_memory[self.institution.ofx_url])
+
+        client.get_bank_statement(self.account, "user", "pass")
+        self.assertEqual(3, len(server.requests))
+
+    def test_shared_window_memory(self):
+        server = WindowedOfxServer(self.port, max_days=40)
+        windows = {}
+        Client(window_memory=windows).get_bank_statement(self.account, "user", "pass")
+        self.assertEqual(3, len(server.requests))
+        Client(window_memory=windows).get_bank_statement(self.account, "user", "pass")
+        self.assertEqual(4, len(server.requests))
+
+    def test_all_windows_rejected(self):
+        server = WindowedOfxServer(self.port, max_days=10)
+        client = Client()
+        self.assertRaises(Error, client.get_bank_statement, self.account,
+                          "user", "pass")
+        self.assertEqual(3, len(server.requests))
+        self.assertFalse(self.institution.ofx_url in client.window_memory)
+
+    def test_split_windows(self):
+        server = WindowedOfxServer(self.port, max_days=400)
+        client = Client(split_days=100)
+        response = client.get_bank_statement(self.account, "user", "pass")
+        self.assertEqual(4, len(server.requests))
+
+        # The three older ranges each add one transaction; everything else
+        # is deduplicated by FITID.
+        merged = response.as_string()
+        self.assertEqual(self.checking_stmt.count("<STMTTRN>") + 3,
+                         merged.count("<STMTTRN>"))
+        self.assertEqual(3, merged.count("<FITID>OLDER-"))
+        self.assertEqual(1, merged.count("<FITID>FAKEOFX-CHECKING-20100723-1--22.04"))
+        self.assertEqual(len(response.get_statements()), 1)
+
+
 if __name__ == '__main__':
     unittest.main()
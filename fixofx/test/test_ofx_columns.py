@@ -0,0 +1,104 @@
+#coding: utf-8
+import csv
+import io
+import json
+import unittest
+from os.path import dirname, join, realpath
+
+import fixofx
+from fixofx.ofx.columns import COLUMNS, make_row, write_rows, xml_rows
+from fixofx.ofxtools.qif_stream import QifStreamConverter
+from fixofx.test.ofx_test_utils import get_checking_stmt, get_creditcard_stmt
+from fixofx.test.test_ofxtools_qif_converter import make_statement
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class ColumnsTests(unittest.TestCase):
+    def setUp(self):
+        self.hints = { "acctid": "1122334455", "bankid": "123456789" }
+
+    def assertSameRows(self, data):
+        rows = list(fixofx.transactions(data, hints=self.hints))
+        expected = list(xml_rows(fixofx.convert(data, hints=self.hints).ofx))
+        self.assertTrue(len(rows) > 0)
+        self.assertEqual(expected, rows)
+        return rows
+
+    def test_qif(self):
+        rows = self.assertSameRows(make_statement(30))
+        self.assertEqual(("1122334455", "123456789"), (rows[0]["acctid"], rows[0]["bankid"]))
+        rows = self.assertSameRows(make_statement(30, header="!Type:CCard"))
+        self.assertEqual(("CREDITCARD", None), (rows[0]["accttype"], rows[0]["bankid"]))
+
+    def test_ofx(self):
+        self.assertSameRows(get_checking_stmt())
+        self.assertSameRows(get_creditcard_stmt())
+
+    def test_ofx2(self):
+        ofx2 = fixofx.convert(make_statement(10)).ofx
+        self.assertEqual(list(xml_rows(ofx2)), list(fixofx.transactions(ofx2)))
+
+    def test_ofc(self):
+        path = join(realpath(dirname(__file__)), "fixtures", "nobankinfo_and_trnrs.ofc")
+        with open(path, encoding="latin-1") as source:
+            self.assertSameRows(source.read())
+
+    def test_qif_stream(self):
+        qif = make_statement(30)
+        stream = QifStreamConverter(io.StringIO(qif), **self.hints)
+        key = lambda row: (row["date"], row["amount"], row["memo"] or "")
+        strip = lambda rows: sorted((dict(row, fitid=None) for row in rows), key=key)
+        self.assertEqual(strip(fixofx.transactions(qif, hints=self.hints)),
+                         strip(stream.rows()))
+
+    def test_make_row(self):
+        row = make_row(fitid="1", amount=" -5.00 ", payee="Tom &amp; Jerry", memo="")
+        self.assertEqual(COLUMNS, tuple(row))
+        self.assertEqual(("-5.00", "Tom & Jerry", None, None),
+                         (row["amount"], row["payee"], row["memo"], row["date"]))
+
+    def test_ndjson(self):
+        rows = list(fixofx.transactions(make_statement(10)))
+        output = io.StringIO()
+        self.assertEqual(len(rows), write_rows(rows, output, "ndjson"))
+        self.assertEqual(rows, [json.loads(line) for line in output.getvalue().splitlines()])
+
+    def test_csv(self):
+        rows = list(fixofx.transactions(make_statement(10)))
+        output = io.StringIO(newline="")
+        self.assertEqual(len(rows), write_rows(rows, output, "csv"))
+        output.seek(0)
+        read = [dict((column, value or None) for (column, value) in row.items())
+                for row in csv.DictReader(output)]
+        self.assertEqual(rows, read)
+
+    def test_bad_format(self):
+        self.assertRaises(ValueError, write_rows, [], io.StringIO(), "xls")
+
+    @unittest.skipIf(pyarrow is not None, "pyarrow is installed")
+    def test_without_pyarrow(self):
+        self.assertRaises(ImportError, write_rows, [], io.BytesIO(), "parquet")
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_arrow(self):
+        import pyarrow.ipc
+        import pyarrow.parquet
+        rows = list(fixofx.transactions(make_statement(10)))
+        output = io.BytesIO()
+        self.assertEqual(len(rows), write_rows(rows, output, "arrow"))
+        table = pyarrow.ipc.open_stream(output.getvalue()).read_all()
+        self.assertEqual(list(COLUMNS), table.column_names)
+        self.assertEqual([row["fitid"] for row in rows], table.column("fitid").to_pylist())
+
+        output = io.BytesIO()
+        write_rows(rows, output, "parquet")
+        table = pyarrow.parquet.read_table(pyarrow.BufferReader(output.getvalue()))
+        self.assertEqual(len(rows), table.num_rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#coding: utf-8
+import io
+import textwrap
+import unittest
+from os.path import dirname, join, realpath
+
+import fixofx
+from fixofx.ofx import Generator
+from fixofx.ofx.fitid import ContentIds
+from fixofx.ofxtools.ofc_converter import OfcConverter
+from fixofx.ofxtools.qif_converter import QifConverter
+from fixofx.ofxtools.qif_stream import QifStreamConverter
+from fixofx.test.test_ofxtools_qif_converter import make_statement
+
+SAME_DAY = textwrap.dedent('''\
+!Type:Bank
+D01/02/2009
+T-3.50
+PCoffee
+^
+D01/02/2009
+T-12.00
+PLunch
+^
+D01/02/2009
+T-3.50
+PCoffee
+^
+D01/03/2009
+T100.00
+PPaycheck
+^
+''')
+
+
+def ids(converter):
+    return [row["fitid"] for row in converter.rows()]
+
+
+class ContentIdsTests(unittest.TestCase):
+    def test_normalized(self):
+        content_ids = ContentIds()
+        first = content_ids.make("20090102", "-3.50", "Coffee  shop", None, None)
+        second = ContentIds().make("20090102120000", "-3.5", " COFFEE shop", "", "")
+        self.assertEqual(first, second)
+        self.assertTrue(first.endswith("-1"))
+
+    def test_occurrences(self):
+        content_ids = ContentIds()
+        first = content_ids.make("20090102", "-3.50", "Coffee")
+        second = content_ids.make("20090102", "-3.50", "Coffee")
+        self.assertEqual(first[:-2] + "-2", second)
+        self.assertNotEqual(first[:-2], content_ids.make("20090102", "-3.51", "Coffee")[:-2])
+
+    def test_unknown_strategy(self):
+        self.assertRaises(ValueError, QifConverter, SAME_DAY, fitids="random")
+
+
+class ConverterIdsTests(unittest.TestCase):
+    def test_reordered_day(self):
+        # The bank lists the same day's transactions in another order:
+        # position IDs move from one transaction to another, content
+        # IDs stay with their transactions.
+        records = SAME_DAY[len("!Type:Bank\n"):].split("^\n")
+        reordered = "!Type:Bank\n" + "^\n".join([records[1], records[0]] + records[2:])
+
+        def by_payee(qif, fitids):
+            rows = QifConverter(qif, fitids=fitids).rows()
+            return sorted((row["payee"], row["amount"], row["fitid"]) for row in rows)
+
+        self.assertEqual(by_payee(SAME_DAY, "content"), by_payee(reordered, "content"))
+        self.assertNotEqual(by_payee(SAME_DAY, "position"), by_payee(reordered, "position"))
+
+        content = ids(QifConverter(SAME_DAY, fitids="content"))
+        self.assertEqual(len(content), len(set(content)))
+
+    def test_overlapping_downloads(self):
+        # make_statement() runs a transaction a day; a longer download
+        # gives the transactions it shares with a shorter one the same IDs.
+        short = set(ids(QifConverter(make_statement(20), fitids="content")))
+        longer = set(ids(QifConverter(make_statement(40), fitids="content")))
+        self.assertTrue(short < longer)
+
+    def test_stream_and_workers(self):
+        qif = make_statement(300) + SAME_DAY.replace("!Type:Bank\n", "")
+        serial = QifConverter(qif, fitids="content")
+        stream = QifStreamConverter(io.StringIO(qif), fitids="content")
+        parallel = QifConverter(qif, fitids="content", workers=2)
+        self.assertEqual(sorted(ids(serial)), sorted(ids(stream)))
+        self.assertEqual(ids(serial), ids(parallel))
+
+    def test_ofc(self):
+        path = join(realpath(dirname(__file__)), "fixtures", "nobankinfo_and_trnrs.ofc")
+        with open(path, encoding="latin-1") as source:
+            ofc = source.read()
+        converter = OfcConverter(ofc, fitids="content")
+        content = ids(converter)
+        self.assertEqual(len(ids(OfcConverter(ofc))), len(set(content)))
+        # Made once, while cleaning: the rows and the OFX agree.
+        xml = converter.to_xml()
+        self.assertEqual(content, ids(converter))
+        for fitid in content:
+            self.assertTrue("<FITID>%s</FITID>" % fitid in xml)
+
+    def test_conversion_hint(self):
+        result = fixofx.convert(SAME_DAY, hints={"fitids": "content"})
+        for fitid in ids(QifConverter(SAME_DAY, fitids="content")):
+            self.assertTrue("<FITID>%s</FITID>" % fitid in result.ofx)
+
+    def test_generator(self):
+        generator = Generator(fitids="content")
+        generator.add_transaction(date="20090102", amount="-3.50", payee="Coffee")
+        generator.add_transaction(date="20090102", amount="-3.50", payee="Coffee")
+        ofx = generator.to_ofx1()
+        expected = ContentIds()
+        for index in range(2):
+            self.assertTrue(expected.make("20090102", "-3.50", "Coffee") in ofx)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#coding: utf-8
+import logging
+import textwrap
+import unittest
+
+from fixofx.ofx import Instrument, TimingLog
+from fixofx.ofx.instrument import stage
+from fixofx.ofxtools.qif_converter import QifConverter
+
+
+class RecordingInstrument(Instrument):
+    def __init__(self):
+        self.events = []
+
+    def stage_started(self, stage):
+        self.events.append(("start", stage))
+
+    def stage_finished(self, stage, elapsed, count=None):
+        self.events.append(("stop", stage, count))
+
+
+class InstrumentTests(unittest.TestCase):
+    def setUp(self):
+        self.qiftext = textwrap.dedent('''\
+        !Type:Bank
+        D01/13/2005
+        T-10.00
+        PCoffee
+        ^
+        D01/14/2005
+        T25.00
+        PRefund
+        ^
+        ''')
+
+    def test_null_stage(self):
+        with stage(None, "anything") as timer:
+            timer.count = 10
+        self.assertIs(stage(None, "one"), stage(None, "two"))
+
+    def test_stage_events(self):
+        instrument = RecordingInstrument()
+        with stage(instrument, "work") as timer:
+            timer.count = 3
+        self.assertEqual([("start", "work"), ("stop", "work", 3)],
+                         instrument.events)
+
+    def test_stage_reported_on_error(self):
+        instrument = RecordingInstrument()
+        try:
+            with stage(instrument, "broken"):
+                raise ValueError("boom")
+        except ValueError:
+            pass
+        self.assertEqual(("stop", "broken", None), instrument.events[-1])
+
+    def test_qif_conversion_stages(self):
+        instrument = RecordingInstrument()
+        converter = QifConverter(self.qiftext, instrument=instrument)
+        converter.to_xml()
+        stopped = [event[1] for event in instrument.events if event[0] == "stop"]
+        self.assertEqual(["qif_cleanup", "qif_parse", "guess_formats",
+                          "clean_txns", "ofx102", "ofx_cleanup", "ofx_parse",
+                          "format_xml"], stopped)
+        counts = dict((event[1], event[2]) for event in instrument.events
+                      if event[0] == "stop")
+        self.assertEqual(2, counts["qif_parse"])
+        self.assertEqual(2, counts["clean_txns"])
+
+    def test_timing_log(self):
+        records = []
+        class ListHandler(logging.Handler):
+            def emit(self, record):
+                records.append(record.getMessage())
+
+        logger = logging.getLogger("fixofx.test.timing")
+        logger.setLevel(logging.INFO)
+        logger.addHandler(ListHandler())
+
+        timing = TimingLog(logger=logger)
+        QifConverter(self.qiftext, instrument=timing).to_xml()
+        self.assertTrue(timing.total() > 0)
+        timing.log("sample.qif")
+
+        self.assertEqual(1, len(records))
+        self.assertTrue(records[0].startswith("Timing for sample.qif:"))
+        self.assertTrue("qif_parse" in records[0])
+        self.assertEqual([], timing.stages)
+
+
+if __name__ == '__main__':
+    unittest.main()
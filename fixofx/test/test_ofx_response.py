@@ -13,10 +13,26 @@
 # limitations under the License.
 import unittest
 import xml.etree.ElementTree as ElementTree
+from unittest import mock
 
+from pyparsing import ParseException
 
-from fixofx.ofx import Response
-from fixofx.test.ofx_test_utils import get_checking_stmt
+from fixofx.ofx import Response, Parser
+from fixofx.test.ofx_test_utils import get_checking_stmt, get_savings_stmt, get_creditcard_stmt
+
+
+def _between(text, start, end):
+    return text[text.index(start):text.index(end) + len(end)]
+
+
+def get_multi_account_stmt():
+    """The checking, savings and credit card statements as one response."""
+    checking = get_checking_stmt().decode('utf-8')
+    savings = _between(get_savings_stmt().decode('utf-8'), "<STMTTRNRS>", "</STMTTRNRS>")
+    creditcard = _between(get_creditcard_stmt().decode('utf-8'),
+                          "<CREDITCARDMSGSRSV1>", "</CREDITCARDMSGSRSV1>")
+    return checking.replace("</STMTTRNRS>\n</BANKMSGSRSV1>",
+                            "</STMTTRNRS>\n" + savings + "\n</BANKMSGSRSV1>\n" + creditcard)
 
 
 class ResponseTests(unittest.TestCase):
@@ -63,5 +79,72 @@ class ResponseTests(unittest.TestCase):
         for org in org_iter:
             self.assertEqual("FAKEOFX", org.text)
 
+
+class LazyResponseTests(unittest.TestCase):
+    def setUp(self):
+        self.text = get_multi_account_stmt()
+
+    def _summary(self, statements):
+        return [(stmt.get_account().acct_number, stmt.get_account().get_ofx_accttype(),
+                 stmt.get_balance(), len(stmt.as_xml())) for stmt in statements]
+
+    def test_matches_full_parse(self):
+        eager = Response(self.text)
+        lazy = Response(self.text, lazy=True)
+        self.assertEqual(3, len(eager.get_statements()))
+        self.assertEqual(self._summary(eager.get_statements()),
+                         self._summary(lazy.get_statements()))
+        self.assertEqual(eager.check_signon_status(), lazy.check_signon_status())
+        self.assertEqual(eager.get_accounts(), lazy.get_accounts())
+        self.assertEqual(eager.get_encoding(), lazy.get_encoding())
+
+    def test_parses_only_what_is_used(self):
+        with mock.patch.object(Parser, "_clean", wraps=Parser()._clean) as clean:
+            response = Response(self.text, lazy=True)
+            self.assertTrue(response.check_signon_status())
+            self.assertEqual(1, clean.call_count)
+            self.assertTrue(len(clean.call_args[0][0]) < 1000)
+
+            statements = response.iter_statements()
+            first = next(statements)
+            self.assertEqual("CHECKING", first.get_account().get_ofx_accttype())
+            self.assertEqual(2, clean.call_count)
+            fragment = clean.call_args[0][0]
+            self.assertEqual(1, fragment.count("<STMTTRNRS>"))
+            self.assertFalse("<CCSTMTTRNRS>" in fragment)
+
+    def test_parallel_statements(self):
+        # Several copies of each statement, so there is work to spread out.
+        bank = _between(self.text, "<BANKMSGSRSV1>\n", "\n</BANKMSGSRSV1>")
+        inner = bank[len("<BANKMSGSRSV1>\n"):-len("\n</BANKMSGSRSV1>")]
+        text = self.text.replace(inner, "\n".join([inner] * 3))
+        serial = Response(text, lazy=True).get_statements()
+        parallel = Response(text, lazy=True).get_statements(workers=2)
+        self.assertEqual(7, len(parallel))
+        self.assertEqual(self._summary(serial), self._summary(parallel))
+
+        # Statements already parsed aren't sent to the workers.
+        response = Response(text)
+        self.assertEqual(self._summary(serial),
+                         self._summary(response.get_statements(workers=2)))
+
+    def test_errors(self):
+        # Eager by default: a bad document fails in the constructor; a
+        # lazy Response fails when the bad part is reached.
+        text = self.text.replace("<STMTRS>", "<STMTRS", 1)
+        self.assertRaises(ParseException, Response, text)
+        response = Response(text, lazy=True)
+        self.assertTrue(response.check_signon_status())
+        self.assertRaises(ParseException, response.get_statements)
+
+    def test_unindexable_falls_back(self):
+        # A leaf element at the top level can't be cut out as an aggregate,
+        # so the whole document is parsed instead.
+        text = self.text.replace("<OFX>\n", "<OFX>\n<NOTE>hello\n", 1)
+        response = Response(text, lazy=True)
+        self.assertEqual(3, len(response.get_statements()))
+        self.assertTrue(response._ofx is not None)
+
+
 if __name__ == '__main__':
     unittest.main()
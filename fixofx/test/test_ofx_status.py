@@ -0,0 +1,61 @@
+#coding: utf-8
+import unittest
+from unittest import mock
+
+from fixofx.ofx import Client, Error, Parser
+from fixofx.ofx.status import scan_status
+from fixofx.test.ofx_test_utils import get_checking_stmt, get_creditcard_stmt
+
+
+class CannedClient(Client):
+    def __init__(self, response):
+        Client.__init__(self)
+        self.response = response
+
+    def _post(self, url, request_body):
+        return self.response
+
+
+class StatusTests(unittest.TestCase):
+    def setUp(self):
+        self.checking = get_checking_stmt().decode('utf-8')
+        self.failed = self.checking.replace(
+            "<CODE>0\n<SEVERITY>INFO\n<MESSAGE>SUCCESS\n</STATUS>\n<STMTRS>",
+            "<CODE>2000\n<SEVERITY>ERROR\n<MESSAGE>\n</STATUS>\n<STMTRS>")
+
+    def test_scan_status(self):
+        self.assertEqual({"CODE": "0", "SEVERITY": "INFO", "MESSAGE": "SUCCESS"},
+                         scan_status(self.checking, "SONRS"))
+        self.assertEqual({"CODE": "0", "SEVERITY": "INFO", "MESSAGE": "SUCCESS"},
+                         scan_status(self.checking, "STMTTRNRS"))
+        self.assertEqual({"CODE": "2000", "SEVERITY": "ERROR"},
+                         scan_status(self.failed, "STMTTRNRS"))
+        self.assertEqual(None, scan_status(self.checking, "CCSTMTTRNRS"))
+
+    def test_scan_is_bounded(self):
+        text = "<SONRS>\n" + "<DTSERVER>20100723\n" * 200 + "<STATUS>\n<CODE>0\n</STATUS>"
+        self.assertEqual({}, scan_status(text, "SONRS"))
+        self.assertEqual({"CODE": "0"}, scan_status(text, "SONRS", limit=len(text)))
+
+    def test_error_rejected_without_parsing(self):
+        client = CannedClient(self.failed)
+        with mock.patch.object(Parser, "_clean") as parse:
+            try:
+                client._send_request("http://localhost/", "")
+                self.fail("Expected an ofx.Error.")
+            except Error as error:
+                self.assertEqual(2000, error.code)
+                self.assertEqual("bank statement", error.summary)
+            self.assertFalse(parse.called)
+
+    def test_parse_deferred(self):
+        client = CannedClient(get_creditcard_stmt())
+        with mock.patch.object(Parser, "_clean", wraps=Parser()._clean) as parse:
+            response = client._send_request("http://localhost/", "")
+            self.assertFalse(parse.called)
+            self.assertEqual(1, len(response.get_statements()))
+            self.assertEqual(1, parse.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+#coding: utf-8
+import logging
+import textwrap
+import unittest
+
+from pyparsing import ParseException
+
+from fixofx.ofx import Parser
+from fixofx.ofx import trace
+from fixofx.ofxtools.qif_parser import QifParser
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class TraceTests(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger("fixofx.trace")
+        self.handler = ListHandler()
+        self.logger.addHandler(self.handler)
+        self.logger.setLevel(logging.DEBUG)
+        trace.set_sample_rate(1.0)
+
+        self.bad_ofx = textwrap.dedent('''\
+        OFXHEADER:100
+        DATA:OFXSGML
+
+        <OFX>
+        <SIGNONMSGSRSV1>
+        <SONRS>
+        <STATUS>
+        <CODE>0
+        <SEVERITY INFO
+        </STATUS>
+        </SONRS>
+        </SIGNONMSGSRSV1>
+        </OFX>
+        ''')
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.logger.setLevel(logging.NOTSET)
+        trace.set_sample_rate(1.0)
+
+    def test_ofx_failure_context(self):
+        self.assertRaises(ParseException, Parser().parse, self.bad_ofx)
+        self.assertEqual(1, len(self.handler.messages))
+        message = self.handler.messages[0]
+        self.assertTrue(message.startswith("OFX parse failure at line"))
+        self.assertTrue("inside: OFX\n" in message)
+        self.assertTrue("<SIGNONMSGSRSV1>" in message)
+
+    def test_qif_failure_context(self):
+        self.assertRaises(ParseException, QifParser().parse, "junk\n")
+        self.assertEqual(1, len(self.handler.messages))
+        self.assertTrue(self.handler.messages[0].startswith(
+            "QIF parse failure at line 1, column 1"))
+
+    def test_sampled_out(self):
+        trace.set_sample_rate(0.0)
+        self.assertRaises(ParseException, Parser().parse, self.bad_ofx)
+        self.assertEqual([], self.handler.messages)
+
+    def test_debug_ignores_sample_rate(self):
+        trace.set_sample_rate(0.0)
+        self.assertRaises(ParseException, Parser(debug=True).parse, self.bad_ofx)
+        self.assertEqual(1, len(self.handler.messages))
+
+    def test_disabled_logger(self):
+        self.logger.setLevel(logging.WARNING)
+        self.assertRaises(ParseException, Parser(debug=True).parse, self.bad_ofx)
+        self.assertEqual([], self.handler.messages)
+
+    def test_open_context(self):
+        text = "<OFX>\n<BANKMSGSRSV1>\n<NAME>Joe\n</BANKMSGSRSV1>\n<SIGNUP>\n"
+        self.assertEqual("OFX > SIGNUP", trace.open_context(text, len(text)))
+        self.assertEqual("(top level)", trace.open_context("junk", 4))
+        text = "!Type:Bank\nD01/01/2005\n^\n!Type:CCard\nD02/01/2005\n"
+        self.assertEqual("!Type:CCard", trace.open_context(text, len(text)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,7 +13,23 @@
 # limitations under the License.
 import unittest
 
-from fixofx.ofx import RoutingNumber
+from fixofx.ofx import RoutingNumber, check_routing_numbers
+from fixofx.ofx.validators import RoutingCheck, _benchmark_numbers, benchmark
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# A good number of each type, bad checksums, and things that aren't
+# routing numbers at all.
+NUMBERS = ["314074269", "011000015", "000000000", "611234561", "800000001",
+           "123456789", "131234567", "01100001", " 314074269 ", "3140742690",
+           "31407426x", "123abd", "", "7", 314074269, None, "٣14074269"]
+
+# The same as bytes, and text that isn't ASCII.
+BYTES = [b"314074269", b" 011000015", b"123456789", b"\xff14074269", b"\xb3\xb9",
+         bytearray(b"011000015"), "３14074269", "3140742６9", "\u00e9"]
 
 
 class ValidatorTests(unittest.TestCase):
@@ -109,6 +125,60 @@ class ValidatorTests(unittest.TestCase):
         self.assertEqual(RoutingNumber("811234567").get_region(), 
                          None)
     
+    def test_check_routing_numbers(self):
+        expected = [RoutingCheck(True, "Thrift", "Dallas"),
+                    RoutingCheck(True, "Primary", "Boston")]
+        self.assertEqual(expected,
+                         check_routing_numbers(["314074269", "011000015"], vectorize=False))
+        self.assertEqual([], check_routing_numbers(iter([]), vectorize=False))
+
+        for number in NUMBERS + _benchmark_numbers(200):
+            if number in ("", "7", "٣14074269"):
+                # RoutingNumber fails on these; only ASCII digits count
+                # in a batch.
+                expected = RoutingCheck(False, None, None)
+            else:
+                aba = RoutingNumber(number)
+                expected = RoutingCheck(aba.is_valid(), aba.get_type(), aba.get_region())
+            self.assertEqual([expected], check_routing_numbers([number], vectorize=False),
+                             repr(number))
+
+        # Bytes are read as Latin-1 text.
+        checks = check_routing_numbers(BYTES, vectorize=False)
+        self.assertEqual(check_routing_numbers([number.decode("latin-1")
+                                                if isinstance(number, (bytes, bytearray))
+                                                else number for number in BYTES],
+                                               vectorize=False), checks)
+        self.assertEqual([True, True, False, False, False, True, False, False, False],
+                         [check.valid for check in checks])
+
+    @unittest.skipUnless(numpy, "NumPy is not installed; requirements-dev.txt has it")
+    def test_vectorized(self):
+        # Both paths, on the same inputs, give the same checks, whatever
+        # the input is held in.
+        numbers = NUMBERS + BYTES + _benchmark_numbers(200)
+        plain = check_routing_numbers(numbers, vectorize=False)
+        self.assertEqual(plain, check_routing_numbers(numbers, vectorize=True))
+        self.assertEqual(plain, check_routing_numbers(numpy.array(numbers, dtype=object)))
+
+        strings = [str(number) for number in NUMBERS] + ["３14074269", "\u00e9"]
+        self.assertEqual(check_routing_numbers(strings, vectorize=False),
+                         check_routing_numbers(numpy.array(strings)))
+        encoded = [number for number in BYTES if isinstance(number, bytes)]
+        self.assertEqual(check_routing_numbers(encoded, vectorize=False),
+                         check_routing_numbers(numpy.array(encoded)))
+        self.assertEqual([], check_routing_numbers([], vectorize=True))
+
+    @unittest.skipIf(numpy, "NumPy is installed")
+    def test_vectorize_without_numpy(self):
+        self.assertRaises(ImportError, check_routing_numbers, ["314074269"], vectorize=True)
+        self.assertEqual([RoutingCheck(True, "Thrift", "Dallas")],
+                         check_routing_numbers(["314074269"]))
+
+    def test_benchmark(self):
+        rates = benchmark(1000)
+        self.assertTrue(rates["plain"] > rates["RoutingNumber"])
+
     def test_aba_string(self):
         self.assertEqual(str(self.good_aba), 
                          "314074269 (valid: True; type: Thrift; region: Dallas)")
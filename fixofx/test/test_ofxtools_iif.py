@@ -0,0 +1,136 @@
+#coding: utf-8
+import io
+import time
+import unittest
+
+from pyparsing import ParseException
+
+import fixofx
+from fixofx.ofxtools.iif_converter import IifConverter
+from fixofx.ofxtools.iif_parser import IifParser, IifSplit, remove_non_ascii
+
+HEADER = ("!TRNS\tTRNSID\tTRNSTYPE\tDATE\tACCNT\tNAME\tAMOUNT\tDOCNUM\tMEMO\n"
+          "!SPL\tSPLID\tTRNSTYPE\tDATE\tACCNT\tNAME\tAMOUNT\tDOCNUM\tMEMO\n"
+          "!ENDTRNS\n")
+
+
+def make_iif(count, start=0):
+    lines = [HEADER]
+    for index in range(start, start + count):
+        lines.append("TRNS\t%d\tCHECK\t7/%d/1998\tChecking\tPayee %d\t-%d.25\t%d\tMemo %d\n"
+                     % (index, index % 28 + 1, index, index, index, index))
+        lines.append("SPL\t%d\tCHECK\t7/%d/1998\tExpenses\tPayee %d\t%d.25\t\t\n"
+                     % (index, index % 28 + 1, index, index))
+        lines.append("ENDTRNS\n")
+    return "".join(lines)
+
+
+class IifParserTests(unittest.TestCase):
+    def setUp(self):
+        self.parser = IifParser()
+
+    def test_read(self):
+        ((trns, splits),) = self.parser.parse(make_iif(1))
+        self.assertEqual(("0", "7/1/1998", "-0.25", "Memo 0"),
+                         (trns["TRNSID"], trns["DATE"], trns["AMOUNT"], trns["MEMO"]))
+        self.assertEqual([("Expenses", "0.25")],
+                         [(split["ACCNT"], split["AMOUNT"]) for split in splits])
+
+    def test_blocks(self):
+        # A second header block with other columns, and account lists
+        # (which aren't transactions) in between.
+        second = ("!ACCNT\tNAME\tACCNTTYPE\nACCNT\tChecking\tBANK\n"
+                  "!TRNS\tDATE\tAMOUNT\tNAME\n!SPL\tDATE\tAMOUNT\n!ENDTRNS\n"
+                  "TRNS\t8/1/1998\t10.00\tRefund\nSPL\t8/1/1998\t-10.00\nENDTRNS\n")
+        txns = IifParser.get_txn_list(self.parser.parse(make_iif(2) + second,
+                                                           splits="discard"))
+        self.assertEqual(["Payee 0", "Payee 1", "Refund"], [txn["Payee"] for txn in txns])
+        self.assertEqual({ "Date": "8/1/1998", "Amount": "10.00", "Payee": "Refund" },
+                         txns[2])
+
+    def test_quoting(self):
+        iif = HEADER + ('TRNS\t1\tCHECK\t7/1/1998\tChecking\t"Smith\tJones, ""Ltd"""'
+                        "\t-5.00\t\t'quoted'\r\nENDTRNS\r\n")
+        ((trns, splits),) = self.parser.parse(iif)
+        self.assertEqual(('SmithJones, "Ltd"', "quoted", []),
+                         (trns["NAME"], trns["MEMO"], splits))
+
+    def test_unprintable(self):
+        self.assertEqual("Caf\xe9 noir", remove_non_ascii("Caf\xe9\x00 noir\x7f\u200b"))
+        self.assertEqual("plain", remove_non_ascii("plain"))
+
+    def test_errors(self):
+        self.assertRaises(ParseException, self.parser.parse, "TRNS\t1\n")
+        try:
+            self.parser.parse(HEADER + "SPL\t1\n")
+        except ParseException as exc:
+            self.assertEqual(4, exc.lineno)
+        else:
+            self.fail("No ParseException")
+
+    def test_streaming(self):
+        source = io.StringIO(make_iif(3))
+        reader = self.parser.read(source)
+        (trns, splits) = next(reader)
+        self.assertEqual("0", trns["TRNSID"])
+        self.assertTrue(source.tell() < len(source.getvalue()))
+        self.assertEqual(["1", "2"], [trns["TRNSID"] for (trns, splits) in reader])
+
+    def test_splits(self):
+        iif = make_iif(2)
+        self.assertEqual([(), ()], [splits for (trns, splits) in
+                                    self.parser.groups(iif, splits="discard")])
+        compact = [splits for (trns, splits) in self.parser.groups(iif, splits="compact")]
+        self.assertEqual([[IifSplit(0, "Expenses", "Payee 0", "0.25", "")],
+                          [IifSplit(1, "Expenses", "Payee 1", "1.25", "")]], compact)
+        self.assertRaises(ValueError, self.parser.parse, iif, splits="some")
+
+        # Columns the !SPL header leaves out are None.
+        short = ("!TRNS\tDATE\tAMOUNT\n!SPL\tAMOUNT\tACCNT\n!ENDTRNS\n"
+                 "TRNS\t8/1/1998\t10.00\nSPL\t-10.00\nENDTRNS\n")
+        self.assertEqual([IifSplit(0, None, None, "-10.00", None)],
+                         self.parser.parse(short, splits="compact")[0][1])
+
+    def test_speed(self):
+        # Loose: tens of thousands of lines a second is csv-module speed;
+        # the pyparsing grammar managed a few hundred.
+        iif = make_iif(5000)
+        started = time.perf_counter()
+        self.assertEqual(5000, len(self.parser.parse(iif)))
+        self.assertTrue(time.perf_counter() - started < 2.0)
+
+
+class IifConverterTests(unittest.TestCase):
+    def test_convert(self):
+        iif = make_iif(10)
+        converter = IifConverter(iif)
+        rows = list(converter.rows())
+        self.assertEqual(10, len(rows))
+        self.assertEqual(("19980710", "-9.25", "9"),
+                         (rows[0]["date"], rows[0]["amount"], rows[0]["checknum"]))
+
+        result = fixofx.convert(iif)
+        self.assertEqual(("IIF", 10), (result.filetype, result.txn_count))
+
+    def test_stream(self):
+        iif = make_iif(10)
+        source = io.StringIO(iif)
+        converter = IifConverter(source, splits="compact")
+        self.assertEqual(list(IifConverter(iif, splits="compact").rows()),
+                         list(converter.rows()))
+        self.assertEqual(len(iif), source.tell())
+
+    def test_split_rows(self):
+        iif = make_iif(3)
+        self.assertEqual([], list(IifConverter(iif).split_rows()))
+        converter = IifConverter(iif, splits="compact")
+        fitids = [row["fitid"] for row in converter.rows()]
+        splits = list(converter.split_rows())
+        self.assertEqual(fitids, [split["fitid"] for split in splits])
+        self.assertEqual({ "fitid": fitids[0], "account": "Expenses", "name": "Payee 2",
+                           "amount": "2.25", "memo": "" }, splits[0])
+        self.assertRaises(ValueError, IifConverter, iif, splits="keep")
+
+
+if __name__ == '__main__':
+    unittest.main()
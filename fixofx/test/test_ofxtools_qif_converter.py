@@ -317,5 +317,75 @@ class QifConverterTests(unittest.TestCase):
         txn = converter.txns_by_date["20070125"][0]
         self.assertEqual(txn.get("Type"), "CHECK")
 
+    def test_header_cleanup(self):
+        txn = "D01/25/2007\nT417.93\n^\n"
+        for (qiftext, cleaned) in [
+                ("!\n" + txn, "!Type:Bank\n" + txn),
+                (txn, "!Type:Bank\n" + txn),
+                ("!Account\nNChecking\n^\n" + txn, "!Type:Bank\n" + txn),
+                ("!Account\nNChecking\n^\nD01/01/2007\nT1.00\n^\n!type:Bank\n" + txn,
+                 "!type:Bank\n" + txn),
+                ("Balance\n!Type:CCard\n" + txn, "!Type:CCard\n" + txn),
+                ("!Type!CCard\n" + txn, "!Type!CCard\n" + txn)]:
+            converter = QifConverter(qiftext)
+            self.assertEqual(cleaned, converter.qif)
+            self.assertEqual(1, len(converter.txns_by_date))
+
+    def test_account_between_sections(self):
+        # An account block between sections mustn't lose the transactions
+        # after it.
+        for header in ("!Type:Bank", "!Type:CCard"):
+            qiftext = ("!Type:Bank\nD01/25/2007\nT417.93\n^\n"
+                       "!Account\nNSavings\nTBank\n^\n"
+                       "%s\nD01/27/2007\nT5.00\n^\n" % header)
+            converter = QifConverter(qiftext)
+            self.assertEqual(["20070125", "20070127"], sorted(converter.txns_by_date))
+            self.assertFalse("!Account" in converter.qif)
+
+
+def make_statement(count, header="!Type:Bank", first_day=1):
+    """A QIF statement of 'count' varied transactions."""
+    records = []
+    for index in range(count):
+        day = (index + first_day) % 12 + 1
+        records.append("D%02d/%02d/2009\nT%s%d.%02d\nN%s\nP%s\nM%s\n%s\n" %
+                       (day, index % 12 + 1, "-" if index % 3 else "", index, index % 100,
+                        ("", "1001", "N/A", "DEBIT")[index % 4],
+                        ("", "Store %d" % index, "ATM/Main St")[index % 3],
+                        ("", "memo %d" % index)[index % 2],
+                        "^EUR" if index == count - 1 else "^"))
+    records[count // 2] = "D05/05/2009\nT-\nPHome Depot\n^\n"
+    return header + "\n" + "".join(records).replace("\nN\n", "\n").replace("\nP\n", "\n").replace("\nM\n", "\n")
+
+
+class ParallelQifConverterTests(unittest.TestCase):
+    def assertSameConversion(self, qiftext, chunked=True, **kwargs):
+        serial = QifConverter(qiftext, **kwargs)
+        parallel = QifConverter(qiftext, workers=2, **kwargs)
+        # Only the serial conversion keeps the whole parse.
+        self.assertEqual(chunked, parallel.parsed_qif is None)
+        self.assertEqual(serial.txns_by_date, parallel.txns_by_date)
+        self.assertEqual((serial.accttype, serial.dayfirst, serial.curdef),
+                         (parallel.accttype, parallel.dayfirst, parallel.curdef))
+        self.assertEqual(serial.to_ofx102(), parallel.to_ofx102())
+        return parallel
+
+    def test_matches_serial(self):
+        converter = self.assertSameConversion(make_statement(60))
+        self.assertEqual("EUR", converter.curdef)
+        # The only day-first date is in the last chunk.
+        converter = self.assertSameConversion("D30/12/2009".join(make_statement(60).rsplit("D01/12/2009", 1)))
+        self.assertTrue(converter.dayfirst)
+        self.assertSameConversion(make_statement(60, header="!Type:CCard"))
+        self.assertSameConversion("Junk\n" + make_statement(60), curdef="USD")
+
+    def test_falls_back(self):
+        # A record the parser stops at, a second section, and a date that
+        # doesn't convert all go the serial way.
+        text = make_statement(60)
+        self.assertSameConversion(text.replace("\nP", "\nZ", 40), chunked=False)
+        self.assertSameConversion(text + "!Type:Cat\nNFood\n^\n", chunked=False)
+        self.assertRaises(ValueError, QifConverter, text.replace("D05/05/2009", "Dbogus"), workers=2)
+
 if __name__ == '__main__':
     unittest.main()
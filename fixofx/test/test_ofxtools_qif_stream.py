@@ -0,0 +1,111 @@
+#coding: utf-8
+import io
+import textwrap
+import unittest
+
+from fixofx.ofx import Response
+from fixofx.ofxtools.qif_converter import QifConverter
+from fixofx.ofxtools.qif_stream import QifStreamConverter
+from fixofx.test.test_ofxtools_qif_converter import make_statement
+
+
+def without_ids(txns):
+    txns = [dict((key, value) for (key, value) in txn.items() if key != "ID")
+            for txn in txns]
+    return sorted(txns, key=lambda txn: sorted(txn.items()))
+
+
+class QifStreamConverterTests(unittest.TestCase):
+    def assertSameTransactions(self, qiftext, **kwargs):
+        serial = QifConverter(qiftext, **kwargs)
+        stream = QifStreamConverter(io.StringIO(qiftext), **kwargs)
+        txns = list(stream.transactions())
+        self.assertEqual(without_ids(sum(serial.txns_by_date.values(), [])),
+                         without_ids(txns))
+        self.assertEqual((serial.accttype, serial.dayfirst, serial.curdef,
+                          serial.start_date, serial.end_date),
+                         (stream.accttype, stream.dayfirst, stream.curdef,
+                          stream.start_date, stream.end_date))
+        return txns
+
+    def test_matches_converter(self):
+        self.assertSameTransactions(make_statement(60))
+        self.assertSameTransactions(make_statement(60, header="!Type:CCard"))
+        self.assertSameTransactions(make_statement(60).replace("D01/12/2009", "D30/12/2009"))
+        self.assertSameTransactions(textwrap.dedent('''\
+        !Account
+        NChecking
+        ^
+        D01/02/2009
+        T1.00
+        ^
+        !Type:Bank
+        D01/03/2009
+        T2.00
+        ^
+        '''))
+        self.assertSameTransactions("D01/13/2009\nT1.00\n^\n")
+        self.assertSameTransactions("!\nD01/13/2009\nT1.00\n^\n")
+        self.assertSameTransactions("!Type:Bank\n")
+
+    def test_unterminated(self):
+        # No "^" after the last record.
+        text = "!Type:Bank\nD01/02/2009\nT1.00\n^\nD01/03/2009\nT2.00\nPLast\n"
+        txns = self.assertSameTransactions(text)
+        self.assertEqual(["1.00", "2.00"], [txn["Amount"] for txn in txns])
+        self.assertEqual(["Last"], [txn["Payee"] for txn in
+                                    self.assertSameTransactions("D01/03/2009\nPLast")])
+        self.assertSameTransactions("!Type:Bank\nD01/03/2009\nT2.00\n^\n\n  \n")
+
+    def test_ids_unique(self):
+        txns = self.assertSameTransactions(make_statement(60))
+        self.assertEqual(len(txns), len(set(txn["ID"] for txn in txns)))
+
+    def test_fitids(self):
+        # Content IDs only, and the same as QifConverter's.  Position IDs
+        # number a day's transactions down from the day's count, which a
+        # stream can't know.
+        text = make_statement(60)
+        txns = list(QifStreamConverter(io.StringIO(text)).transactions())
+        serial = QifConverter(text, fitids="content")
+        self.assertEqual(sorted(txn["ID"] for txn in serial._statement_txns()),
+                         sorted(txn["ID"] for txn in txns))
+        self.assertRaises(ValueError, QifStreamConverter, io.StringIO(text),
+                          fitids="position")
+
+    def test_lookahead(self):
+        # The only day-first date comes late; with a short lookahead the
+        # dates before it have already gone out month-first.
+        text = make_statement(60).replace("D01/12/2009", "D30/12/2009")
+        stream = QifStreamConverter(io.StringIO(text), lookahead=5)
+        txns = list(stream.transactions())
+        self.assertFalse(stream.dayfirst)
+        self.assertTrue("20090201" in [txn["Date"] for txn in txns])
+
+        stream = QifStreamConverter(io.StringIO("!Type:Bank\nD05/13/2009\nT1\n^\n" + text[11:]),
+                                    lookahead=5)
+        list(stream.transactions())
+        self.assertFalse(stream.dayfirst)
+
+    def test_bad_record_skipped(self):
+        text = make_statement(10).replace("\nP", "\nZ", 1)
+        stream = QifStreamConverter(io.StringIO(text))
+        self.assertEqual(8, len(list(stream.transactions())))
+
+    def test_write_ofx102(self):
+        text = make_statement(60)
+        output = io.StringIO()
+        count = QifStreamConverter(io.StringIO(text), org="Org").write_ofx102(output)
+        self.assertEqual(59, count)
+
+        statement = Response(output.getvalue()).get_statements()[0]
+        serial = Response(QifConverter(text, org="Org").to_ofx102()).get_statements()[0]
+        self.assertEqual((serial.get_begin_date(), serial.get_end_date(), serial.get_currency()),
+                         (statement.get_begin_date(), statement.get_end_date(),
+                          statement.get_currency()))
+        self.assertEqual(59, output.getvalue().count("<STMTTRN>"))
+        self.assertTrue(QifStreamConverter(io.StringIO(text)).to_xml().startswith("<?xml"))
+
+
+if __name__ == '__main__':
+    unittest.main()
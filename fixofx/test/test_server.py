@@ -0,0 +1,163 @@
+#coding: utf-8
+import io
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+import fixofx
+from fixofx.server import Server
+from fixofx.test.ofx_test_utils import get_checking_stmt
+from fixofx.test.test_ofxtools_qif_converter import make_statement
+
+
+def jobs(*jobs):
+    return io.BytesIO(b"".join(json.dumps(job).encode("utf-8") + b"\n" for job in jobs))
+
+
+def replies(output):
+    return [json.loads(line) for line in output.getvalue().decode("utf-8").splitlines()]
+
+
+class ServerTests(unittest.TestCase):
+    def setUp(self):
+        self.qif = make_statement(20)
+
+    def test_stream(self):
+        output = io.BytesIO()
+        with Server(hints={"org": "Test Bank"}) as server:
+            server.serve_stream(jobs({"id": 1, "data": self.qif, "hints": {"acctid": "1234"}},
+                                     {"id": 2, "data": get_checking_stmt().decode("utf-8")}),
+                                output)
+        (first, second) = replies(output)
+
+        expected = fixofx.convert(self.qif, hints={"org": "Test Bank", "acctid": "1234"})
+        self.assertEqual(1, first["id"])
+        self.assertTrue(first["ok"])
+        self.assertEqual(expected.ofx, first["ofx"])
+        self.assertEqual(("QIF", "MM/DD/YY", 19),
+                         (first["filetype"], first["date_format"], first["txn_count"]))
+        self.assertTrue(0 <= first["convert_seconds"] <= first["latency"])
+
+        self.assertEqual((2, True, "OFX/1.02"), (second["id"], second["ok"], second["filetype"]))
+        self.assertFalse("bankids" in first)
+
+    def test_check_bankid(self):
+        output = io.BytesIO()
+        with Server(hints={"bankid": "011000015", "check_bankid": True}) as server:
+            server.serve_stream(jobs({"id": 1, "data": self.qif}), output)
+        (reply,) = replies(output)
+        self.assertEqual({"011000015": {"valid": True, "type": "Primary", "region": "Boston"}},
+                         reply["bankids"])
+
+    def test_errors(self):
+        output = io.BytesIO()
+        with Server() as server:
+            stream = jobs({"id": 1},
+                          {"id": 2, "data": self.qif, "hints": {"acctnum": "1"}},
+                          {"id": 3, "data": "hello", "hints": {"filetype": "XLS"}},
+                          {"id": 4, "data": self.qif})
+            server.serve_stream(io.BytesIO(b"not json\n\n" + stream.getvalue()), output)
+        results = [(reply["id"], reply.get("error")) for reply in replies(output)]
+        self.assertEqual([(None, "request"), (1, "request"), (2, "request"),
+                          (3, "unsupported"), (4, None)], results)
+
+    def test_junk(self):
+        # The type guess fails on this with csv.Error, which isn't one of
+        # the errors a job expects; it's an internal error, in the server
+        # process as in a worker, and the stream goes on.
+        for workers in (None, 1):
+            output = io.BytesIO()
+            with Server(workers=workers) as server:
+                server.serve_stream(jobs({"id": 3, "data": "x"}, {"id": 4, "data": self.qif}),
+                                    output)
+            results = [(reply["id"], reply.get("error")) for reply in replies(output)]
+            self.assertEqual([(3, "internal"), (4, None)], sorted(results), workers)
+
+    def test_file_jobs(self):
+        directory = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(directory, "upload.qif"), "w") as upload:
+                upload.write(self.qif)
+            outside = os.path.join(os.path.dirname(directory), "upload.qif")
+            sent = jobs({"id": 1, "file": "upload.qif"},
+                        {"id": 2, "file": os.path.join(directory, "upload.qif")},
+                        {"id": 3, "file": "../upload.qif"},
+                        {"id": 4, "file": outside})
+
+            output = io.BytesIO()
+            with Server() as server:
+                server.serve_stream(io.BytesIO(sent.getvalue()), output)
+            self.assertEqual([(1, "request"), (2, "request"), (3, "request"), (4, "request")],
+                             [(reply["id"], reply.get("error")) for reply in replies(output)])
+
+            output = io.BytesIO()
+            with Server(files=directory) as server:
+                server.serve_stream(io.BytesIO(sent.getvalue()), output)
+            self.assertEqual([(1, None), (2, None), (3, "request"), (4, "request")],
+                             [(reply["id"], reply.get("error")) for reply in replies(output)])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_main(self):
+        # fixofx-serve, as python -m fixofx.server.
+        environment = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        served = subprocess.run([sys.executable, "-m", "fixofx.server",
+                                 "--hints", '{"acctid": "1234"}'],
+                                input=jobs({"id": 1, "data": self.qif}).getvalue(),
+                                stdout=subprocess.PIPE, env=environment, check=True)
+        (reply,) = replies(io.BytesIO(served.stdout))
+        expected = fixofx.convert(self.qif, hints={"acctid": "1234"})
+        self.assertEqual((1, expected.ofx), (reply["id"], reply["ofx"]))
+
+    def test_budget(self):
+        output = io.BytesIO()
+        with Server(limits={"max_bytes": 100}) as server:
+            server.serve_stream(jobs({"id": 1, "data": self.qif}), output)
+        (reply,) = replies(output)
+        self.assertEqual("budget", reply["error"])
+
+    def test_pipelined_workers(self):
+        output = io.BytesIO()
+        sent = [{"id": index, "data": make_statement(5 + index * 10),
+                 "hints": {"acctid": str(index)}} for index in range(6)]
+        with Server(workers=2, max_pending=3) as server:
+            server.serve_stream(jobs(*sent), output)
+        received = dict((reply["id"], reply) for reply in replies(output))
+        self.assertEqual(list(range(6)), sorted(received))
+        for job in sent:
+            expected = fixofx.convert(job["data"], hints=job["hints"])
+            self.assertEqual(expected.ofx, received[job["id"]]["ofx"])
+
+    def test_socket(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "fixofx.sock")
+        with Server() as server:
+            listener = server.socket_server(path)
+            thread = threading.Thread(target=listener.serve_forever)
+            thread.start()
+            try:
+                client = socket.socket(socket.AF_UNIX)
+                client.connect(path)
+                client.sendall(jobs({"id": "a", "data": self.qif},
+                                    {"id": "b", "data": self.qif}).getvalue())
+                stream = client.makefile("rb")
+                results = [json.loads(stream.readline()) for index in range(2)]
+                stream.close()
+                client.close()
+            finally:
+                listener.shutdown()
+                listener.server_close()
+                thread.join()
+                shutil.rmtree(directory)
+        self.assertEqual([("a", True), ("b", True)],
+                         [(reply["id"], reply["ok"]) for reply in results])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#coding: utf-8
+import sqlite3
+import unittest
+
+import fixofx
+from fixofx.sink import SqliteSink, benchmark
+from fixofx.test.ofx_test_utils import get_checking_stmt, get_creditcard_stmt
+from fixofx.test.test_ofxtools_qif_converter import make_statement
+
+
+class SqliteSinkTests(unittest.TestCase):
+    def setUp(self):
+        self.sink = SqliteSink(":memory:", batch_size=7)
+        self.db = self.sink.connection
+
+    def tearDown(self):
+        self.sink.close()
+
+    def count(self, table):
+        return self.db.execute("SELECT COUNT(*) FROM %s" % table).fetchone()[0]
+
+    def test_load(self):
+        qif = make_statement(30)
+        hints = { "acctid": "1122334455", "bankid": "123456789", "accttype": "CHECKING" }
+        written = self.sink.load(qif, hints=hints, source="upload.qif")
+        rows = list(fixofx.transactions(qif, hints=hints))
+        self.assertEqual(len(rows), written)
+        self.assertEqual([(1, "123456789", "1122334455", "CHECKING")],
+                         self.db.execute("SELECT * FROM accounts").fetchall())
+
+        stored = self.db.execute("SELECT fitid, date, amount, payee, memo FROM transactions"
+                                 " ORDER BY fitid").fetchall()
+        expected = sorted((row["fitid"], row["date"], row["amount"], row["payee"],
+                           row["memo"]) for row in rows)
+        self.assertEqual(expected, stored)
+
+        (source, txn_count, dtstart, dtend) = self.db.execute(
+            "SELECT source, txn_count, dtstart, dtend FROM statements").fetchone()
+        self.assertEqual(("upload.qif", len(rows)), (source, txn_count))
+        self.assertEqual((min(row["date"] for row in rows), max(row["date"] for row in rows)),
+                         (dtstart, dtend))
+
+    def test_reimport(self):
+        self.sink.load(get_checking_stmt())
+        self.sink.load(get_creditcard_stmt())
+        before = self.count("transactions")
+        self.assertEqual(2, self.count("accounts"))
+        self.sink.load(get_checking_stmt())
+        self.assertEqual((before, 2, 3),
+                         (self.count("transactions"), self.count("accounts"),
+                          self.count("statements")))
+
+    def test_rollback(self):
+        rows = list(fixofx.transactions(make_statement(30)))
+        rows[20] = None
+        self.assertRaises(TypeError, self.sink.write, iter(rows))
+        self.assertEqual((0, 0, 0), (self.count("transactions"), self.count("accounts"),
+                                     self.count("statements")))
+        self.sink.write(rows[:20])
+        self.assertEqual(20, self.count("transactions"))
+
+    def test_connection(self):
+        db = sqlite3.connect(":memory:", isolation_level="IMMEDIATE")
+        with SqliteSink(db, fast=False) as sink:
+            sink.write(fixofx.transactions(make_statement(10)))
+        # The connection is the caller's, and is left as it was.
+        self.assertEqual("IMMEDIATE", db.isolation_level)
+        self.assertEqual(9, db.execute("SELECT COUNT(*) FROM transactions").fetchone()[0])
+
+    def test_benchmark(self):
+        (insert, upsert) = benchmark(1000)
+        self.assertTrue(insert > 0 and upsert > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,7 +18,11 @@ setuptools.setup(
         '': ['*.txt', '*.rst'],
     },
     scripts=['bin/ofxfix.py','bin/ofxfake.py'],
+    entry_points={
+        'console_scripts': ['fixofx-serve = fixofx.server:main'],
+    },
     install_requires=open(REQ).readlines(),
+    python_requires='>=3.7',
     license='Apache 2.0',
     keywords='ofx, ofc, qif, converter, xml',
     classifiers=[
@@ -29,6 +33,10 @@ setuptools.setup(
           'Natural Language :: English',
           'Operating System :: OS Independent',
           'Programming Language :: Python :: 3',
+          'Programming Language :: Python :: 3 :: Only',
+          'Programming Language :: Python :: 3.7',
+          'Programming Language :: Python :: 3.8',
+          'Programming Language :: Python :: 3.9',
           'Topic :: Software Development :: Libraries',
           'Topic :: Text Processing',
     ],